@@ -0,0 +1 @@
+"""Benchmarks for the EPG import pipeline and read API (not part of the package)."""
@@ -0,0 +1,198 @@
+"""Import pipeline benchmark: parse -> merge -> store, stage by stage.
+
+Generates a synthetic feed, then runs each stage in a fresh process (so peak
+RSS is attributable to that stage) against a scratch SQLite file:
+
+- parse: ``parse_epg_file`` on the raw bytes
+- parse_time: ``parse_xmltv_time`` over every start/stop attribute (XML only)
+- merge: grouping + ``merge_consecutive_programs`` on parsed data
+- store: ``store_epg_data`` (includes merge, insert, FTS rebuild, commit)
+- snapshot: ``write_snapshot`` of the stored data
+- end_to_end: ``import_epg_content`` from raw bytes
+
+Work done before the timed region of a stage (e.g. parsing for "store") is
+reported separately as ``setup_peak_rss_mb``. Results are printed (or written
+with --output) as JSON so runs can be compared across commits.
+
+Usage:
+  python -m benchmarks.import_bench --channels 300 --days 7
+  python -m benchmarks.import_bench --format json --stages parse,store --output bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+from multiprocessing import get_context
+
+from benchmarks.synthetic import add_spec_arguments, spec_from_args, write_feed
+
+STAGES = ("parse", "parse_time", "merge", "store", "snapshot", "end_to_end")
+
+_XMLTV_TIME_RE = re.compile(rb'(?:start|stop)="([^"]+)"')
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _run_stage(stage: str, feed_path: str, work_dir: str) -> dict:
+    """Run one stage in this (fresh) process and return its measurements."""
+    os.environ["EPG_DB_PATH"] = os.path.join(work_dir, f"{stage}.db")
+    os.environ["EPG_SNAPSHOT_PATH"] = os.path.join(work_dir, f"{stage}.snapshot")
+    os.environ["EPG_DUMP_DIR"] = os.path.join(work_dir, "epg_dumps")
+    # The synthetic feed has fixed dates; keep all of it regardless of retention
+    os.environ.setdefault("EPG_RETAIN_PAST_HOURS", "")
+    os.environ.setdefault("EPG_RETAIN_FUTURE_DAYS", "")
+
+    from collections import defaultdict
+
+    from epg_web.epg.parser import parse_epg_file, parse_xmltv_time
+    from epg_web.services.fetcher import import_epg_content, store_epg_data
+    from epg_web.services.importer import merge_consecutive_programs
+    from epg_web.services.snapshot import write_snapshot
+    from epg_web.services.storage import dispose_engines, init_db
+
+    with open(feed_path, "rb") as f:
+        content = f.read()
+
+    async def run() -> dict:
+        extra = {}
+
+        # Untimed setup
+        if stage in ("merge", "store", "snapshot"):
+            epg_data = await parse_epg_file(content, feed_path)
+        if stage in ("store", "snapshot", "end_to_end"):
+            await init_db()
+        if stage == "snapshot":
+            await store_epg_data(epg_data, feed_path)
+        if stage == "parse_time":
+            time_values = [m.decode() for m in _XMLTV_TIME_RE.findall(content)]
+        setup_peak = _peak_rss_mb()
+
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        if stage == "parse":
+            items = len((await parse_epg_file(content, feed_path)).programs)
+        elif stage == "parse_time":
+            for value in time_values:
+                parse_xmltv_time(value)
+            items = len(time_values)
+        elif stage == "merge":
+            by_channel = defaultdict(list)
+            for program in epg_data.programs:
+                by_channel[program.channel_id].append(program)
+            items = len(epg_data.programs)
+            merged = 0
+            for program_list in by_channel.values():
+                merged += merge_consecutive_programs(program_list)[1]
+            extra["merged"] = merged
+        elif stage == "store":
+            extra = await store_epg_data(epg_data, feed_path)
+            items = len(epg_data.programs)
+        elif stage == "snapshot":
+            await write_snapshot()
+            items = len(epg_data.programs)
+        elif stage == "end_to_end":
+            extra = await import_epg_content(content, feed_path)
+            items = extra["programs"] + extra["merged"]
+        wall = time.perf_counter() - wall
+        cpu = time.process_time() - cpu
+
+        await dispose_engines()
+        return {
+            "seconds": wall,
+            "cpu_seconds": cpu,
+            "items": items,
+            "items_per_second": items / wall if wall else None,
+            "peak_rss_mb": _peak_rss_mb(),
+            "setup_peak_rss_mb": setup_peak,
+            "result": extra,
+        }
+
+    return asyncio.run(run())
+
+
+def run_stage_isolated(stage: str, feed_path: str, work_dir: str) -> dict:
+    """Run a stage in a new spawned interpreter so its RSS starts from zero."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+        return pool.submit(_run_stage, stage, feed_path, work_dir).result()
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark the EPG import pipeline")
+    add_spec_arguments(p)
+    p.add_argument("--format", choices=("xml", "json"), default="xml")
+    p.add_argument("--stages", default=",".join(STAGES), help="Comma-separated stages to run")
+    p.add_argument("--repeat", type=int, default=1, help="Runs per stage (median is reported)")
+    p.add_argument("--feed", help="Use an existing feed file instead of generating one")
+    p.add_argument("-o", "--output", help="Write the JSON report here instead of stdout")
+    args = p.parse_args()
+
+    stages = [s for s in args.stages.split(",") if s]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        p.error(f"unknown stages: {', '.join(sorted(unknown))}")
+    if args.format != "xml" and "parse_time" in stages:
+        stages.remove("parse_time")
+
+    spec = spec_from_args(args)
+    with tempfile.TemporaryDirectory(prefix="epg-bench-") as work_dir:
+        feed_path = args.feed or os.path.join(work_dir, f"feed.{args.format}")
+        generated = None
+        if not args.feed:
+            started = time.perf_counter()
+            generated = write_feed(spec, feed_path, args.format)
+            print(f"Generated {generated} programmes in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+        report = {
+            "benchmark": "import",
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "spec": None if args.feed else asdict(spec),
+            "format": args.format,
+            "feed_bytes": os.path.getsize(feed_path),
+            "feed_programmes": generated,
+            "stages": {},
+        }
+        for stage in stages:
+            runs = []
+            for _ in range(args.repeat):
+                runs.append(run_stage_isolated(stage, feed_path, work_dir))
+                print(f"{stage}: {runs[-1]['seconds']:.2f}s", file=sys.stderr)
+            median = statistics.median(r["seconds"] for r in runs)
+            summary = min(runs, key=lambda r: abs(r["seconds"] - median))
+            report["stages"][stage] = dict(summary, runs=[r["seconds"] for r in runs])
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
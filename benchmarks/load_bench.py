@@ -0,0 +1,345 @@
+"""HTTP load test of the read API against a seeded scratch database.
+
+Seeds a temporary database from a synthetic feed, then runs simulated page
+loads that issue exactly the requests ``app.js`` makes on ``loadData``:
+
+1. ``GET /api/countries``
+2. ``GET /api/grid?country=..&start=..&end=..`` for a 12 hour window
+
+``--mix schedules`` replays the previous client instead: channel pages
+(``GET /api/channels?...&per_page=100`` until the last page), then
+``GET /api/schedule/{id}`` for every channel with programs, all at once
+(limited to --browser-connections in flight, like a browser's per-host
+connection limit).
+
+``--concurrency`` is the number of simulated users loading pages back to
+back. The server is either the app in-process (via httpx's ASGI transport)
+or ``uvicorn`` on localhost with ``--workers`` processes; comma-separated
+values for --concurrency and --workers run every combination. Latency
+percentiles (per route and per page load) and requests per second are
+reported as JSON.
+
+Usage:
+  python -m benchmarks.load_bench --channels 300 --days 7 --concurrency 1,8,32
+  python -m benchmarks.load_bench --server uvicorn --workers 1,4 --concurrency 16
+  python -m benchmarks.load_bench --url http://127.0.0.1:8000 --concurrency 8
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from dataclasses import asdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks.import_bench import _git_commit
+from benchmarks.synthetic import FeedSpec, add_spec_arguments, spec_from_args, write_feed
+
+PER_PAGE = 100
+GRID_HOURS = 12
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(latencies: List[float]) -> dict:
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "p50_ms": _ms(percentile(values, 50)),
+        "p95_ms": _ms(percentile(values, 95)),
+        "p99_ms": _ms(percentile(values, 99)),
+        "max_ms": _ms(values[-1] if values else None),
+    }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+class LoadRecorder:
+    """Collects per-route latencies and errors for one run."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.page_loads: List[float] = []
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    async def get(self, client: httpx.AsyncClient, route: str, url: str):
+        started = time.perf_counter()
+        try:
+            resp = await client.get(url)
+        except httpx.HTTPError as e:
+            self.errors[f"{route}: {type(e).__name__}"] += 1
+            return None
+        data = resp.json() if resp.status_code == 200 else None
+        self.latencies[route].append(time.perf_counter() - started)
+        if data is None:
+            self.errors[f"{route}: HTTP {resp.status_code}"] += 1
+        return data
+
+
+async def load_grid(client: httpx.AsyncClient, recorder: LoadRecorder, country: str,
+                    grid_start: datetime):
+    """One page load: the request sequence of app.js loadData."""
+    started = time.perf_counter()
+    await recorder.get(client, "countries", "/api/countries")
+    end = grid_start + timedelta(hours=GRID_HOURS)
+    params = f"country={country}&start={grid_start:%Y-%m-%dT%H:%M:%SZ}&end={end:%Y-%m-%dT%H:%M:%SZ}"
+    await recorder.get(client, "grid", f"/api/grid?{params}")
+    recorder.page_loads.append(time.perf_counter() - started)
+
+
+async def load_schedules(client: httpx.AsyncClient, recorder: LoadRecorder, country: str,
+                         browser_connections: int):
+    """One page load of the previous client: channel pages, then every schedule."""
+    started = time.perf_counter()
+    await recorder.get(client, "countries", "/api/countries")
+
+    channels, page, total_pages = [], 1, 1
+    while page <= total_pages:
+        data = await recorder.get(
+            client, "channels", f"/api/channels?country={country}&page={page}&per_page={PER_PAGE}"
+        )
+        if data is None:
+            return
+        channels.extend(data["channels"])
+        total_pages = data["total_pages"]
+        page += 1
+
+    slots = asyncio.Semaphore(browser_connections)
+
+    async def schedule(channel_id: int):
+        async with slots:
+            await recorder.get(client, "schedule", f"/api/schedule/{channel_id}")
+
+    await asyncio.gather(*(schedule(c["id"]) for c in channels if c["program_count"] > 0))
+    recorder.page_loads.append(time.perf_counter() - started)
+
+
+async def run_load(client: httpx.AsyncClient, countries: List[str], concurrency: int,
+                   duration: float, args) -> dict:
+    """Run ``concurrency`` simulated users for ``duration`` seconds."""
+    recorder = LoadRecorder()
+    deadline = time.perf_counter() + duration
+
+    async def user(n: int):
+        i = n
+        while time.perf_counter() < deadline:
+            country = countries[i % len(countries)]
+            if args.mix == "grid":
+                await load_grid(client, recorder, country, args.grid_start)
+            else:
+                await load_schedules(client, recorder, country, args.browser_connections)
+            i += concurrency
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(n) for n in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    all_latencies = [v for values in recorder.latencies.values() for v in values]
+    return {
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "requests": len(all_latencies),
+        "requests_per_second": round(len(all_latencies) / elapsed, 1),
+        "page_loads": len(recorder.page_loads),
+        "page_loads_per_second": round(len(recorder.page_loads) / elapsed, 2),
+        "latency": summarize(all_latencies),
+        "routes": {route: summarize(values) for route, values in sorted(recorder.latencies.items())},
+        "page_load": summarize(recorder.page_loads),
+        "errors": dict(recorder.errors),
+    }
+
+
+async def fetch_countries(client: httpx.AsyncClient) -> List[str]:
+    resp = await client.get("/api/countries")
+    resp.raise_for_status()
+    return [c["code"] for c in resp.json()["countries"]]
+
+
+async def sweep(client: httpx.AsyncClient, args, concurrencies: List[int]) -> List[dict]:
+    countries = await fetch_countries(client)
+    if not countries:
+        raise SystemExit("The server has no channels to load")
+    if args.warmup:
+        await run_load(client, countries, 1, args.warmup, args)
+    runs = []
+    for concurrency in concurrencies:
+        result = await run_load(client, countries, concurrency, args.duration, args)
+        print(
+            f"workers={args.current_workers} concurrency={concurrency}: "
+            f"{result['requests_per_second']} req/s, p95 {result['latency']['p95_ms']} ms",
+            file=sys.stderr,
+        )
+        runs.append(dict(result, workers=args.current_workers))
+    return runs
+
+
+def _client_limits(args, concurrencies: List[int]) -> httpx.Limits:
+    connections = max(concurrencies) * args.browser_connections
+    return httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+
+
+async def run_in_process(args, concurrencies: List[int]) -> List[dict]:
+    from epg_web.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench",
+                                     timeout=args.timeout) as client:
+            return await sweep(client, args, concurrencies)
+
+
+async def run_against_url(args, url: str, concurrencies: List[int]) -> List[dict]:
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout,
+                                 limits=_client_limits(args, concurrencies)) as client:
+        return await sweep(client, args, concurrencies)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_uvicorn(workers: int, port: int) -> subprocess.Popen:
+    """Start uvicorn on localhost and wait until it answers."""
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "epg_web.main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--workers", str(workers), "--log-level", "warning",
+         "--no-access-log"],
+        env=os.environ.copy(),
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with status {proc.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/api/countries", timeout=1).status_code == 200:
+                return proc
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("uvicorn did not start within 30s")
+
+
+def seed_database(spec: FeedSpec, work_dir: str) -> dict:
+    """Import a synthetic feed into a scratch database (paths set via env)."""
+    os.environ["EPG_DB_PATH"] = os.path.join(work_dir, "load.db")
+    os.environ["EPG_SNAPSHOT_PATH"] = os.path.join(work_dir, "load.snapshot")
+    os.environ["EPG_DUMP_DIR"] = os.path.join(work_dir, "epg_dumps")
+    # The synthetic feed has fixed dates; keep all of it regardless of retention
+    os.environ.setdefault("EPG_RETAIN_PAST_HOURS", "")
+    os.environ.setdefault("EPG_RETAIN_FUTURE_DAYS", "")
+    feed_path = os.path.join(work_dir, "feed.xml")
+    write_feed(spec, feed_path)
+
+    from epg_web.services.fetcher import import_epg_content
+    from epg_web.services.storage import dispose_engines, init_db
+
+    async def seed() -> dict:
+        await init_db()
+        with open(feed_path, "rb") as f:
+            result = await import_epg_content(f.read(), feed_path)
+        await dispose_engines()
+        return result
+
+    return asyncio.run(seed())
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def _grid_start(value: Optional[str], spec: Optional[FeedSpec]) -> datetime:
+    """Grid window start: --grid-start, else one day into the synthetic feed, else this hour."""
+    if value:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if spec is not None:
+        return datetime.fromisoformat(spec.start) + timedelta(days=1)
+    return datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Load test the EPG read API")
+    add_spec_arguments(p)
+    p.add_argument("--server", choices=("inprocess", "uvicorn"), default="inprocess")
+    p.add_argument("--url", help="Test an already running server instead (no seeding)")
+    p.add_argument("--workers", type=_int_list, default=[1], help="uvicorn worker counts, e.g. 1,2,4")
+    p.add_argument("--concurrency", type=_int_list, default=[1, 8, 32], help="Simulated users, e.g. 1,8,32")
+    p.add_argument("--duration", type=float, default=15.0, help="Seconds per run")
+    p.add_argument("--warmup", type=float, default=2.0, help="Warm-up seconds before measuring")
+    p.add_argument("--mix", choices=("grid", "schedules"), default="grid",
+                   help="Client to replay: one /api/grid request, or channel pages + every schedule")
+    p.add_argument("--grid-start", help="Grid window start (ISO8601); default one day into the feed")
+    p.add_argument("--browser-connections", type=int, default=6,
+                   help="Parallel schedule requests per simulated user")
+    p.add_argument("--timeout", type=float, default=60.0)
+    p.add_argument("-o", "--output", help="Write the JSON report here instead of stdout")
+    args = p.parse_args()
+
+    spec = spec_from_args(args)
+    args.grid_start = _grid_start(args.grid_start, None if args.url else spec)
+    report = {
+        "benchmark": "load",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "server": "url" if args.url else args.server,
+        "spec": None if args.url else asdict(spec),
+        "mix": args.mix,
+        "grid_start": args.grid_start.isoformat() if args.mix == "grid" else None,
+        "browser_connections": args.browser_connections,
+        "duration": args.duration,
+        "runs": [],
+    }
+
+    if args.url:
+        args.current_workers = None
+        report["runs"] = asyncio.run(run_against_url(args, args.url, args.concurrency))
+    else:
+        with tempfile.TemporaryDirectory(prefix="epg-load-") as work_dir:
+            report["seed"] = seed_database(spec, work_dir)
+            if args.server == "inprocess":
+                args.current_workers = None
+                report["runs"] = asyncio.run(run_in_process(args, args.concurrency))
+            else:
+                for workers in args.workers:
+                    args.current_workers = workers
+                    port = _free_port()
+                    proc = start_uvicorn(workers, port)
+                    try:
+                        report["runs"] += asyncio.run(
+                            run_against_url(args, f"http://127.0.0.1:{port}", args.concurrency)
+                        )
+                    finally:
+                        proc.terminate()
+                        proc.wait(timeout=30)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
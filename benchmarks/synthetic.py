@@ -0,0 +1,221 @@
+"""Reproducible synthetic EPG feeds (XMLTV and JSON) for benchmarks.
+
+Feeds are generated from a FeedSpec and a seed, so the same spec always
+produces byte-identical output. Besides plain back-to-back schedules the
+generator can add the irregularities real feeds have:
+
+- overlaps: short inserts overlapping the running programme
+- duplicates: programmes split into consecutive identical fragments (these
+  are what the import's merge step collapses)
+- multi-valued: several <title>/<category> elements on one programme
+- simulcasts: channels repeating the previous channel's schedule (these
+  are what the import stores once)
+"""
+import argparse
+import json
+import random
+from dataclasses import asdict, dataclass, field, replace
+from datetime import datetime, timedelta, timezone
+from typing import IO, Iterator, List, Tuple
+from xml.sax.saxutils import escape, quoteattr
+
+TITLES = [
+    "Morning News", "Evening News", "Weather", "Cooking Today", "Café Society",
+    "Wildlife Planet", "Crime Lab", "Late Show", "Championship Live", "Kids Club",
+    "Documentary Hour", "Classic Movie", "Game Night", "Travel Diaries", "Über Tech",
+]
+CATEGORIES = ["News", "Movie", "Sports", "Kids", "Documentary", "Entertainment", "Lifestyle"]
+WORDS = (
+    "the a an of in on with and for from new old city world life story family "
+    "team match final season episode special report guide night day live"
+).split()
+# UTC offsets used for programme times, to exercise offset handling
+OFFSETS = ["+0000", "+0100", "+0200", "-0500", "-0800", "+0530"]
+
+
+@dataclass
+class FeedSpec:
+    """Shape of a synthetic feed."""
+    channels: int = 200
+    days: int = 7
+    countries: List[str] = field(default_factory=lambda: ["US", "CA", "UK", "FR"])
+    overlap_ratio: float = 0.02
+    duplicate_ratio: float = 0.05
+    multi_valued_ratio: float = 0.3
+    simulcast_ratio: float = 0.0
+    description_words: int = 25
+    seed: int = 1
+    start: str = "2024-01-01T00:00:00"
+
+
+@dataclass
+class SyntheticProgram:
+    channel_id: str
+    start: datetime
+    stop: datetime
+    titles: List[str]
+    description: str
+    categories: List[str]
+
+
+def iter_channels(spec: FeedSpec) -> Iterator[Tuple[str, str, str]]:
+    """Yield (channel_id, display name, icon url) for every channel."""
+    for i in range(spec.channels):
+        country = spec.countries[i % len(spec.countries)]
+        yield (
+            f"{country.lower()}.channel{i}",
+            f"{country}| Channel {i}",
+            f"http://icons.example.com/{i}.png",
+        )
+
+
+def iter_programs(spec: FeedSpec) -> Iterator[SyntheticProgram]:
+    """Yield programmes channel by channel, each channel in start order."""
+    rng = random.Random(spec.seed)
+    # Separate stream, so feeds without simulcasts are unchanged
+    simulcast_rng = random.Random(spec.seed + 2)
+    start = datetime.fromisoformat(spec.start).replace(tzinfo=timezone.utc)
+    end = start + timedelta(days=spec.days)
+    previous: List[SyntheticProgram] = []
+    for channel_id, _, _ in iter_channels(spec):
+        if previous and simulcast_rng.random() < spec.simulcast_ratio:
+            for p in previous:
+                yield replace(p, channel_id=channel_id)
+            continue
+        previous = list(_channel_programs(spec, rng, channel_id, start, end))
+        yield from previous
+
+
+def _channel_programs(
+    spec: FeedSpec, rng: random.Random, channel_id: str, start: datetime, end: datetime
+) -> Iterator[SyntheticProgram]:
+    t = start
+    while t < end:
+        duration = timedelta(minutes=rng.choice((15, 30, 30, 60, 60, 90, 120)))
+        title = rng.choice(TITLES)
+        titles = [title]
+        categories = [rng.choice(CATEGORIES)]
+        if rng.random() < spec.multi_valued_ratio:
+            titles.append(title.upper())
+            categories.append(rng.choice(CATEGORIES))
+        description = " ".join(rng.choice(WORDS) for _ in range(spec.description_words))
+
+        if rng.random() < spec.duplicate_ratio:
+            # Split into two identical, touching fragments
+            half = duration / 2
+            yield SyntheticProgram(channel_id, t, t + half, titles, description, categories)
+            yield SyntheticProgram(channel_id, t + half, t + duration, titles, description, categories)
+        else:
+            yield SyntheticProgram(channel_id, t, t + duration, titles, description, categories)
+
+        if rng.random() < spec.overlap_ratio:
+            insert_start = t + duration / 3
+            yield SyntheticProgram(
+                channel_id, insert_start, insert_start + timedelta(minutes=5),
+                ["Newsflash"], "Breaking news insert", ["News"],
+            )
+        t += duration
+
+
+def _xmltv_time(dt: datetime, offset: str) -> str:
+    sign = 1 if offset[0] == "+" else -1
+    delta = timedelta(hours=int(offset[1:3]), minutes=int(offset[3:5])) * sign
+    return (dt + delta).strftime("%Y%m%d%H%M%S") + " " + offset
+
+
+def write_xmltv(spec: FeedSpec, out: IO[str]) -> int:
+    """Write an XMLTV feed; return the number of programmes written."""
+    rng = random.Random(spec.seed + 1)
+    out.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+    out.write('<tv generator-info-name="epg-benchmarks">\n')
+    for channel_id, name, icon in iter_channels(spec):
+        out.write(
+            f"  <channel id={quoteattr(channel_id)}>"
+            f"<display-name>{escape(name)}</display-name>"
+            f"<icon src={quoteattr(icon)}/></channel>\n"
+        )
+    count = 0
+    for p in iter_programs(spec):
+        offset = rng.choice(OFFSETS)
+        out.write(
+            f'  <programme start="{_xmltv_time(p.start, offset)}" '
+            f'stop="{_xmltv_time(p.stop, offset)}" channel={quoteattr(p.channel_id)}>'
+        )
+        for title in p.titles:
+            out.write(f'<title lang="en">{escape(title)}</title>')
+        out.write(f'<desc lang="en">{escape(p.description)}</desc>')
+        for category in p.categories:
+            out.write(f'<category lang="en">{escape(category)}</category>')
+        out.write("</programme>\n")
+        count += 1
+    out.write("</tv>\n")
+    return count
+
+
+def write_json(spec: FeedSpec, out: IO[str]) -> int:
+    """Write a JSON feed in the service's JSON format; return the programme count."""
+    out.write('{"channels": [')
+    for i, (channel_id, name, icon) in enumerate(iter_channels(spec)):
+        out.write(("," if i else "") + json.dumps({"id": channel_id, "name": name, "iconUrl": icon}))
+    out.write('], "programs": [')
+    count = 0
+    for p in iter_programs(spec):
+        out.write(("," if count else "") + json.dumps({
+            "channelId": p.channel_id,
+            "title": p.titles[0],
+            "description": p.description,
+            "startTime": p.start.isoformat(),
+            "endTime": p.stop.isoformat(),
+            "category": p.categories[0],
+        }))
+        count += 1
+    out.write("]}\n")
+    return count
+
+
+WRITERS = {"xml": write_xmltv, "json": write_json}
+
+
+def write_feed(spec: FeedSpec, path: str, fmt: str = "xml") -> int:
+    """Write a feed in ``fmt`` ("xml" or "json") to ``path``; return the programme count."""
+    with open(path, "w", encoding="utf-8") as f:
+        return WRITERS[fmt](spec, f)
+
+
+def add_spec_arguments(parser: argparse.ArgumentParser):
+    """Add FeedSpec options to a command line parser."""
+    defaults = FeedSpec()
+    parser.add_argument("--channels", type=int, default=defaults.channels)
+    parser.add_argument("--days", type=int, default=defaults.days)
+    parser.add_argument("--overlap-ratio", type=float, default=defaults.overlap_ratio)
+    parser.add_argument("--duplicate-ratio", type=float, default=defaults.duplicate_ratio)
+    parser.add_argument("--multi-valued-ratio", type=float, default=defaults.multi_valued_ratio)
+    parser.add_argument("--simulcast-ratio", type=float, default=defaults.simulcast_ratio)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+
+
+def spec_from_args(args: argparse.Namespace) -> FeedSpec:
+    return FeedSpec(
+        channels=args.channels,
+        days=args.days,
+        overlap_ratio=args.overlap_ratio,
+        duplicate_ratio=args.duplicate_ratio,
+        multi_valued_ratio=args.multi_valued_ratio,
+        simulcast_ratio=args.simulcast_ratio,
+        seed=args.seed,
+    )
+
+
+def main():
+    p = argparse.ArgumentParser(description="Generate a synthetic EPG feed")
+    add_spec_arguments(p)
+    p.add_argument("--format", choices=sorted(WRITERS), default="xml")
+    p.add_argument("-o", "--output", required=True, help="Output file path")
+    args = p.parse_args()
+    spec = spec_from_args(args)
+    count = write_feed(spec, args.output, args.format)
+    print(json.dumps({"spec": asdict(spec), "programmes": count, "output": args.output}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""Micro-benchmark the /api/schedule read path: ORM hydration vs Core rows.
+
+Seeds a scratch database with one channel of N programs, then times the
+previous ORM implementation of ``get_channel_schedule`` against the Core
+implementation in ``epg_web.services.schedule``, reporting per-request CPU
+time and traced allocations.
+
+Usage:
+  python scripts/bench_schedule_read.py
+  python scripts/bench_schedule_read.py --programs 2000 --iterations 200
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+# Point the storage layer at a scratch database before it is imported
+_tmpdir = tempfile.mkdtemp(prefix="epg-bench-")
+os.environ["EPG_DB_PATH"] = str(Path(_tmpdir) / "bench.db")
+
+from sqlalchemy import insert, select
+
+from epg_web.models.db import Channel, Program
+from epg_web.services.schedule import fetch_channel_schedule
+from epg_web.services.storage import dispose_engines, get_connection, get_session, get_write_session, init_db
+
+
+async def seed(num_programs: int) -> int:
+    """Create one channel with ``num_programs`` consecutive programs."""
+    await init_db()
+    start = datetime(2024, 1, 1)
+    async with get_write_session() as session:
+        channel = Channel(name="CA| Bench", channel_id="bench.ca", icon_url=None)
+        session.add(channel)
+        await session.flush()
+        channel.schedule_id = channel.id
+        rows = []
+        for i in range(num_programs):
+            st = start + timedelta(minutes=30 * i)
+            rows.append({
+                "title": f"Program {i}",
+                "description": "A reasonably sized description of the programme " * 3,
+                "start_time": st,
+                "end_time": st + timedelta(minutes=30),
+                "category": "Bench",
+                "channel_id": channel.id,
+            })
+        await session.execute(insert(Program), rows)
+        await session.commit()
+        return channel.id
+
+
+async def orm_schedule(channel_id: int) -> dict:
+    """The ORM-based implementation this benchmark compares against."""
+    async with get_session() as session:
+        channel = (
+            await session.execute(select(Channel).where(Channel.id == channel_id))
+        ).scalar_one_or_none()
+        channel_dict = {
+            "id": channel.id,
+            "name": channel.name,
+            "channel_id": channel.channel_id,
+            "icon_url": channel.icon_url,
+        }
+        programs = (
+            await session.execute(
+                select(Program)
+                .where(Program.channel_id == channel_id)
+                .order_by(Program.start_time)
+            )
+        ).scalars().all()
+
+        def to_utc_iso(dt):
+            if not dt:
+                return None
+            aware = dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt
+            iso = aware.astimezone(timezone.utc).isoformat()
+            if iso.endswith("+00:00"):
+                iso = iso[:-6] + "Z"
+            return iso
+
+        program_list = [
+            {
+                "id": p.id,
+                "title": p.title,
+                "description": p.description,
+                "start_time": to_utc_iso(p.start_time),
+                "end_time": to_utc_iso(p.end_time),
+                "category": p.category,
+                "channel_id": p.channel_id,
+            }
+            for p in programs
+        ]
+        return {"total": len(program_list), "programs": program_list, "channel": channel_dict}
+
+
+async def core_schedule(channel_id: int) -> dict:
+    async with get_connection() as conn:
+        return await fetch_channel_schedule(conn, channel_id)
+
+
+async def measure(fn, channel_id: int, iterations: int) -> dict:
+    """Return mean CPU ms and mean peak traced KiB per request."""
+    await fn(channel_id)  # warm-up (statement cache, pool)
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for _ in range(iterations):
+        await fn(channel_id)
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+
+    tracemalloc.start()
+    peak_total = 0
+    for _ in range(min(iterations, 20)):
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        await fn(channel_id)
+        _, peak = tracemalloc.get_traced_memory()
+        peak_total += peak - base
+    tracemalloc.stop()
+
+    return {
+        "cpu_ms": cpu / iterations * 1000,
+        "wall_ms": wall / iterations * 1000,
+        "peak_kib": peak_total / min(iterations, 20) / 1024,
+    }
+
+
+async def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--programs", type=int, default=2000, help="Programs in the benchmark channel")
+    p.add_argument("--iterations", type=int, default=100, help="Requests per implementation")
+    args = p.parse_args()
+
+    channel_id = await seed(args.programs)
+    orm_result = await orm_schedule(channel_id)
+    core_result = await core_schedule(channel_id)
+    assert orm_result == core_result, "ORM and Core responses differ"
+
+    print(f"Schedule read for one channel with {args.programs} programs ({args.iterations} iterations)")
+    print(f"{'path':<6} {'cpu ms/req':>11} {'wall ms/req':>12} {'peak KiB/req':>13}")
+    for label, fn in (("orm", orm_schedule), ("core", core_schedule)):
+        r = await measure(fn, channel_id, args.iterations)
+        print(f"{label:<6} {r['cpu_ms']:>11.2f} {r['wall_ms']:>12.2f} {r['peak_kib']:>13.1f}")
+
+    await dispose_engines()
+    shutil.rmtree(_tmpdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
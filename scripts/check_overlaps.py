@@ -1,109 +1,87 @@
-"""Scan the SQLite database for overlapping programs per channel.
+"""Scan the SQLite database for overlapping programs and schedule gaps per channel.
+
+Uses the single-scan analysis of ``epg_web.services.diagnostics`` (the same
+data as ``GET /api/diagnostics/overlaps``).
 
 Usage (from project root with venv active):
   python scripts/check_overlaps.py
+  python scripts/check_overlaps.py --country CA --min-gap 300 --limit 20
+  python scripts/check_overlaps.py --channel-id 11243 --json
 
-Outputs a summary and lists channels with overlaps, showing the conflicting items.
+Outputs a summary, the channels with the most overlaps and the first
+overlapping pairs.
 """
+import argparse
 import asyncio
-from dataclasses import dataclass
-from typing import List, Tuple
-
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
-
-from epg_web.services.storage import get_session
-from epg_web.models.db import Channel, Program
-
-
-@dataclass
-class Overlap:
-    channel_id: int
-    channel_name: str
-    a_id: int
-    a_title: str
-    a_start: str
-    a_end: str
-    b_id: int
-    b_title: str
-    b_start: str
-    b_end: str
-    minutes_overlap: int
-
-
-async def find_overlaps(session: AsyncSession) -> Tuple[int, List[Overlap]]:
-    total_overlaps = 0
-    overlaps: List[Overlap] = []
-
-    # Get all channels
-    channels = (await session.execute(select(Channel))).scalars().all()
-
-    for ch in channels:
-        # Fetch channel programs ordered by start
-        progs = (
-            await session.execute(
-                select(Program)
-                .where(Program.channel_id == ch.id)
-                .order_by(Program.start_time, Program.end_time)
+import json
+
+from epg_web.services.diagnostics import analyze_overlaps
+from epg_web.services.storage import dispose_engines, get_connection
+
+
+def _minutes(seconds: int) -> str:
+    return f"{seconds / 60:.0f}m"
+
+
+def print_report(report: dict):
+    coverage = report["coverage"]
+    print(f"Channels analyzed: {report['channels']} ({report['programs']} programs)")
+    print(
+        f"Overlapping programs: {report['overlaps']} ({_minutes(report['overlap_seconds'])})"
+        f" on {report['channels_with_overlaps']} channels"
+    )
+    print(
+        f"Gaps over {report['min_gap_seconds']}s: {report['gaps']} ({_minutes(report['gap_seconds'])})"
+        f" on {report['channels_with_gaps']} channels"
+    )
+    print(f"Coverage: {coverage:.2%}" if coverage is not None else "Coverage: n/a")
+
+    worst = [c for c in report["by_channel"] if c["overlaps"] or c["gaps"]]
+    if worst:
+        print("\nChannels with the most overlaps:")
+        for c in worst:
+            coverage = f"{c['coverage']:.1%}" if c["coverage"] is not None else "n/a"
+            print(
+                f" - {c['name']} (id={c['id']}): {c['overlaps']} overlaps ({_minutes(c['overlap_seconds'])}),"
+                f" {c['gaps']} gaps ({_minutes(c['gap_seconds'])}), coverage {coverage}"
+            )
+
+    if report["examples"]:
+        print("\nOverlapping pairs:")
+        for o in report["examples"]:
+            a, b = o["earlier"], o["program"]
+            print(
+                f" - {o['channel']['name']}: overlap {_minutes(o['overlap_seconds'])}:"
+                f" [{a['id']}] '{a['title']}' ({a['start_time']} -> {a['end_time']})"
+                f" with [{b['id']}] '{b['title']}' ({b['start_time']} -> {b['end_time']})"
             )
-        ).scalars().all()
-
-        if len(progs) < 2:
-            continue
-
-        prev = progs[0]
-        for cur in progs[1:]:
-            # Overlap if current starts before previous ends
-            if cur.start_time < prev.end_time:
-                # overlap duration in minutes
-                delta = int((prev.end_time - cur.start_time).total_seconds() // 60)
-                total_overlaps += 1
-                overlaps.append(
-                    Overlap(
-                        channel_id=ch.id,
-                        channel_name=ch.name,
-                        a_id=prev.id,
-                        a_title=prev.title,
-                        a_start=str(prev.start_time),
-                        a_end=str(prev.end_time),
-                        b_id=cur.id,
-                        b_title=cur.title,
-                        b_start=str(cur.start_time),
-                        b_end=str(cur.end_time),
-                        minutes_overlap=delta,
-                    )
-                )
-                # Advance prev: keep the later end to catch deep overlaps
-                prev = prev if prev.end_time >= cur.end_time else cur
-            else:
-                prev = cur
-
-    return total_overlaps, overlaps
 
 
 async def main():
-    async with get_session() as session:
-        total, overlaps = await find_overlaps(session)
-        print(f"Total overlapping pairs detected: {total}")
-        if not overlaps:
-            return
-
-        # Group by channel for readability
-        from collections import defaultdict
-        by_channel = defaultdict(list)
-        for o in overlaps:
-            by_channel[(o.channel_id, o.channel_name)].append(o)
-
-        for (cid, cname), items in by_channel.items():
-            print("\n=== Channel:", cname, f"(id={cid}) ===")
-            for o in items[:50]:  # limit output per channel
-                print(
-                    f" - Overlap {o.minutes_overlap}m:"
-                    f" [{o.a_id}] '{o.a_title}' ({o.a_start} -> {o.a_end})"
-                    f" with [{o.b_id}] '{o.b_title}' ({o.b_start} -> {o.b_end})"
-                )
-            if len(items) > 50:
-                print(f"   ... truncated, {len(items)-50} more overlaps ...")
+    p = argparse.ArgumentParser(description="Report overlapping programs, gaps and coverage")
+    p.add_argument("--country", help="Only channels of this 2-letter country code")
+    p.add_argument("--channel-id", type=int, help="Only this channel (database id)")
+    p.add_argument("--min-gap", type=int, default=0, help="Ignore gaps up to this many seconds")
+    p.add_argument("--limit", type=int, default=50, help="Channels and overlapping pairs to list")
+    p.add_argument("--json", action="store_true", help="Print the full report as JSON")
+    args = p.parse_args()
+
+    try:
+        async with get_connection() as conn:
+            report = await analyze_overlaps(
+                conn,
+                country=args.country.upper() if args.country else None,
+                channel_id=args.channel_id,
+                min_gap_seconds=args.min_gap,
+                limit=args.limit,
+            )
+    finally:
+        await dispose_engines()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
 
 
 if __name__ == "__main__":
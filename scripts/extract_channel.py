@@ -1,159 +1,90 @@
-"""Extract a specific channel and its programs from the XMLTV feed."""
-import asyncio
+"""Extract a specific channel and its programs from the archived XMLTV feed.
+
+Imports keep the fetched feed in ``epg_dumps/`` with the byte offsets of
+each channel's elements (see ``epg_web.services.archive``), so the channel
+is copied out of the memory-mapped archive with a few seeks instead of
+downloading and parsing the whole feed.
+
+Usage (from project root with venv active):
+  python scripts/extract_channel.py CHANNEL_ID
+  python scripts/extract_channel.py CHANNEL_ID -o out.xml --archive epg_dumps/epg-12.xml
+"""
 import sys
 from pathlib import Path
-import xml.etree.ElementTree as ET
-from xml.dom import minidom
 from datetime import datetime, timezone, timedelta
 
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 
-from epg_web.services.fetcher import fetch_epg_data, DEFAULT_EPG_URL
+from epg_web.services.archive import DUMP_DIR, ArchivedFeed
 
 
-def parse_xmltv_time(time_str):
-    """Parse XMLTV time format to datetime object.
-    
-    XMLTV format: YYYYMMDDhhmmss +HHMM
-    Example: 20251104020000 +0100
-    """
-    # Split time and timezone
-    parts = time_str.strip().split()
-    if len(parts) != 2:
-        return None
-    
-    time_part = parts[0]
-    tz_part = parts[1]
-    
-    # Parse the time
-    dt = datetime.strptime(time_part, '%Y%m%d%H%M%S')
-    
-    # Parse timezone offset
-    tz_sign = 1 if tz_part[0] == '+' else -1
-    tz_hours = int(tz_part[1:3])
-    tz_minutes = int(tz_part[3:5])
-    tz_offset_minutes = tz_sign * (tz_hours * 60 + tz_minutes)
-    
-    # Create timezone
-    tz = timezone(timedelta(minutes=tz_offset_minutes))
-    dt = dt.replace(tzinfo=tz)
-    
-    return dt
-
-
-def format_est_time(dt):
-    """Convert datetime to EST and format as readable string."""
-    if dt is None:
-        return "N/A"
-    
+def format_est_time(dt: datetime) -> str:
+    """Convert a naive UTC datetime to EST and format as readable string."""
     # Convert to EST (-5 hours from UTC)
     est = timezone(timedelta(hours=-5))
-    dt_est = dt.astimezone(est)
-    
+    dt_est = dt.replace(tzinfo=timezone.utc).astimezone(est)
+
     # Format: Mon Nov 04, 2025 at 01:00 AM EST
     return dt_est.strftime('%a %b %d, %Y at %I:%M %p EST')
 
 
-def prettify_xml(elem):
-    """Return a pretty-printed XML string for the Element."""
-    rough_string = ET.tostring(elem, encoding='unicode')
-    reparsed = minidom.parseString(rough_string)
-    return reparsed.toprettyxml(indent="  ")
+def extract_channel_data(channel_id: str, output_file: str = None, archive_path: str = None) -> bool:
+    """Write a channel and its programs from an archived feed to an XMLTV file.
 
-
-async def extract_channel_data(channel_id: str, output_file: str = None):
-    """Extract channel and its programs from XMLTV feed.
-    
     Args:
         channel_id: The channel ID to extract
         output_file: Output file path (default: channel_{id}.xml)
+        archive_path: Archived feed to read (default: the newest in epg_dumps/)
+
+    Returns:
+        bool: Whether the channel was found
     """
-    print(f"Fetching EPG data from {DEFAULT_EPG_URL}...")
-    content = await fetch_epg_data(DEFAULT_EPG_URL)
-    
-    print(f"Parsing XMLTV data...")
-    # Parse the XML
-    root = ET.fromstring(content)
-    
-    # Create new root element
-    tv_root = ET.Element('tv')
-    tv_root.set('generator-info-name', 'EPG Channel Extractor')
-    
-    # Find and extract the channel
-    channel_found = False
-    for channel in root.findall('channel'):
-        if channel.get('id') == channel_id:
-            tv_root.append(channel)
-            channel_found = True
-            print(f"Found channel: {channel.get('id')}")
-            # Print channel details
-            display_name = channel.find('display-name')
-            if display_name is not None:
-                print(f"  Name: {display_name.text}")
-            icon = channel.find('icon')
-            if icon is not None:
-                print(f"  Icon: {icon.get('src')}")
-            break
-    
-    if not channel_found:
-        print(f"ERROR: Channel {channel_id} not found in feed!")
-        return
-    
-    # Find and extract all programs for this channel
-    program_count = 0
-    for programme in root.findall('programme'):
-        if programme.get('channel') == channel_id:
-            # Add EST time as comments
-            start_time = programme.get('start')
-            stop_time = programme.get('stop')
-            
-            if start_time:
-                start_dt = parse_xmltv_time(start_time)
-                est_start = format_est_time(start_dt)
-                # Add as comment before the title
-                comment = ET.Comment(f' EST: {est_start} ')
-                programme.insert(0, comment)
-            
-            if stop_time:
-                stop_dt = parse_xmltv_time(stop_time)
-                est_stop = format_est_time(stop_dt)
-                # Find title and insert comment after it
-                title_elem = programme.find('title')
-                if title_elem is not None:
-                    title_index = list(programme).index(title_elem)
-                    comment = ET.Comment(f' to {est_stop} ')
-                    programme.insert(title_index + 1, comment)
-            
-            tv_root.append(programme)
-            program_count += 1
-    
-    print(f"Found {program_count} programs for channel {channel_id}")
-    
+    feed = ArchivedFeed(archive_path) if archive_path else ArchivedFeed.latest()
+    if feed is None:
+        print(f"ERROR: No archived feed in {DUMP_DIR}/; import a feed first (scripts/init_db.py)")
+        return False
+
+    with feed:
+        print(f"Using {feed.path} (generation {feed.generation}, from {feed.source})")
+        document = feed.extract(channel_id)
+        if document is None:
+            print(f"ERROR: Channel {channel_id} not found in feed!")
+            return False
+        channels, programs = feed.parse(channel_id)
+
+    for channel in channels:
+        print(f"Found channel: {channel.channel_id}")
+        print(f"  Name: {channel.name}")
+        if channel.icon_url:
+            print(f"  Icon: {channel.icon_url}")
+    print(f"Found {len(programs)} programs for channel {channel_id}")
+    if programs:
+        print(f"  First: {format_est_time(min(p.start_time for p in programs))}")
+        print(f"  Last ends: {format_est_time(max(p.end_time for p in programs))}")
+
     # Generate output filename if not provided
     if output_file is None:
         output_file = f"channel_{channel_id}.xml"
-    
+
     output_path = Path(output_file)
-    
-    # Write pretty-printed XML
     print(f"Writing to {output_path}...")
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
-        f.write(prettify_xml(tv_root))
-    
+    output_path.write_bytes(document)
+
     print(f"Successfully extracted channel {channel_id} to {output_path}")
-    print(f"  Channel: 1")
-    print(f"  Programs: {program_count}")
+    print(f"  Channel: {len(channels)}")
+    print(f"  Programs: {len(programs)}")
+    return True
 
 
 if __name__ == "__main__":
     import argparse
-    
-    parser = argparse.ArgumentParser(description='Extract a channel from XMLTV feed')
+
+    parser = argparse.ArgumentParser(description='Extract a channel from the archived XMLTV feed')
     parser.add_argument('channel_id', help='Channel ID to extract')
     parser.add_argument('-o', '--output', help='Output file path', default=None)
-    
+    parser.add_argument('--archive', help='Archived feed (default: newest in epg_dumps/)', default=None)
+
     args = parser.parse_args()
-    
-    asyncio.run(extract_channel_data(args.channel_id, args.output))
+
+    sys.exit(0 if extract_channel_data(args.channel_id, args.output, args.archive) else 1)
@@ -1,10 +1,14 @@
 """Initialize the database and load EPG data."""
+import argparse
 import asyncio
+import logging
+from contextlib import nullcontext
 
 from epg_web.services.storage import init_db
 from epg_web.services.fetcher import update_epg_from_url, DEFAULT_EPG_URL
+from epg_web.services.profiling import PROFILE_DIR, profile
 
-async def main():
+async def main(profile_import: bool = False):
     """Initialize the database and load EPG data."""
     # Initialize database schema
     await init_db()
@@ -13,12 +17,20 @@ async def main():
     # Fetch and load EPG data from the default source
     try:
         print(f"Fetching EPG data from {DEFAULT_EPG_URL}...")
-        result = await update_epg_from_url()
+        with profile("import") if profile_import else nullcontext() as current:
+            result = await update_epg_from_url()
         print(f"Successfully imported {result['channels']} channels and {result['programs']} programs.")
+        if current is not None:
+            print(f"Profile written to {PROFILE_DIR}/{current.name}.prof (summary in .txt)")
     except Exception as e:
         import traceback
         print(f"Error loading EPG data: {repr(e)}")
         traceback.print_exc()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Initialize the database and load EPG data")
+    parser.add_argument("--profile", action="store_true",
+                        help="Profile the import (cProfile + SQL timings) into EPG_PROFILE_DIR")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s")
+    asyncio.run(main(args.profile))
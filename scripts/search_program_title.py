@@ -1,19 +1,36 @@
-"""Search programs by (case-insensitive) title substring, optionally within a channel.
+"""Search programs by title words, optionally within a channel.
+
+Matches whole words (last word as a prefix) via the FTS index; pass
+--substring for the old case-insensitive substring scan. Programs of a
+schedule shared by simulcasts are listed under every channel showing them.
 
 Usage:
   python scripts/search_program_title.py --title "Lethal Weapon 2"
   python scripts/search_program_title.py --title "Lethal Weapon 2" --channel-id 9428
+  python scripts/search_program_title.py --title "ethal weap" --substring
 """
 import argparse
 import sqlite3
 
+from epg_web.services.search import build_match_query
+
 
 def main():
     p = argparse.ArgumentParser(description="Search programs by title substring")
     p.add_argument("--title", required=True, help="Title substring (case-insensitive)")
     p.add_argument("--channel-id", type=int, help="Optional channel id to filter")
+    p.add_argument("--substring", action="store_true", help="Substring scan instead of the FTS index")
     args = p.parse_args()
 
+    match = build_match_query(args.title)
+    if args.substring or match is None:
+        title_clause = "UPPER(p.title) LIKE UPPER(?)"
+        title_arg = f"%{args.title}%"
+    else:
+        # Restrict the FTS match to the title column
+        title_clause = "p.id IN (SELECT rowid FROM programs_fts WHERE programs_fts MATCH ?)"
+        title_arg = f"title : ({match})"
+
     conn = sqlite3.connect("epg.db")
     try:
         conn.row_factory = sqlite3.Row
@@ -22,21 +39,21 @@ def main():
             cur.execute(
                 """
                 SELECT p.id, p.title, p.start_time, p.end_time, c.id as channel_id, c.name as channel_name
-                FROM programs p JOIN channels c ON p.channel_id = c.id
-                WHERE c.id = ? AND UPPER(p.title) LIKE UPPER(?)
+                FROM programs p JOIN channels c ON c.schedule_id = p.channel_id
+                WHERE c.id = ? AND {title_clause}
                 ORDER BY p.start_time
-                """,
-                (args.channel_id, f"%{args.title}%"),
+                """.format(title_clause=title_clause),
+                (args.channel_id, title_arg),
             )
         else:
             cur.execute(
                 """
                 SELECT p.id, p.title, p.start_time, p.end_time, c.id as channel_id, c.name as channel_name
-                FROM programs p JOIN channels c ON p.channel_id = c.id
-                WHERE UPPER(p.title) LIKE UPPER(?)
+                FROM programs p JOIN channels c ON c.schedule_id = p.channel_id
+                WHERE {title_clause}
                 ORDER BY c.name COLLATE NOCASE, p.start_time
-                """,
-                (f"%{args.title}%",),
+                """.format(title_clause=title_clause),
+                (title_arg,),
             )
         rows = cur.fetchall()
         if not rows:
@@ -4,8 +4,20 @@ Usage:
   python scripts/show_channel_by_id.py 11243
 """
 import argparse
+import asyncio
 import sqlite3
 
+from epg_web.services.diagnostics import analyze_overlaps
+from epg_web.services.storage import DATABASE_PATH, dispose_engines, get_connection
+
+
+async def channel_overlaps(channel_id: int, limit: int) -> dict:
+    try:
+        async with get_connection() as conn:
+            return await analyze_overlaps(conn, channel_id=channel_id, limit=limit)
+    finally:
+        await dispose_engines()
+
 
 def main():
     p = argparse.ArgumentParser()
@@ -13,16 +25,23 @@ def main():
     p.add_argument("--limit", type=int, default=50, help="Max programs to display")
     args = p.parse_args()
 
-    conn = sqlite3.connect("epg.db")
+    conn = sqlite3.connect(DATABASE_PATH)
     conn.row_factory = sqlite3.Row
     cur = conn.cursor()
 
-    cur.execute("SELECT id, name, channel_id FROM channels WHERE id=?", (args.channel_id,))
+    cur.execute("SELECT id, name, channel_id, schedule_id FROM channels WHERE id=?", (args.channel_id,))
     ch = cur.fetchone()
     if not ch:
         print(f"Channel id {args.channel_id} not found")
         return
-    print(f"Channel DB id={ch['id']}, name={ch['name']}, source_id='{ch['channel_id']}'\n")
+    print(f"Channel DB id={ch['id']}, name={ch['name']}, source_id='{ch['channel_id']}'")
+    # Simulcasts with an identical schedule read the programs of the channel storing it
+    schedule_id = ch["schedule_id"] if ch["schedule_id"] is not None else ch["id"]
+    if schedule_id != ch["id"]:
+        cur.execute("SELECT name, channel_id FROM channels WHERE id=?", (schedule_id,))
+        owner = cur.fetchone()
+        print(f"Shares the schedule of DB id={schedule_id}, name={owner['name']}, source_id='{owner['channel_id']}'")
+    print()
 
     cur.execute(
         """
@@ -31,24 +50,19 @@ def main():
         WHERE channel_id=?
         ORDER BY start_time
         """,
-        (args.channel_id,),
+        (schedule_id,),
     )
     rows = cur.fetchall()
     print(f"Total programs: {len(rows)}\n")
 
-    # Naive overlap analysis
-    overlaps = []
-    for i in range(1, len(rows)):
-        prev = rows[i-1]
-        curp = rows[i]
-        if curp[2] < prev[3]:  # start_time < previous end_time
-            overlaps.append((prev, curp))
-    print(f"Overlapping adjacent pairs: {len(overlaps)}\n")
+    report = asyncio.run(channel_overlaps(args.channel_id, 20))
+    print(f"Overlapping programs: {report['overlaps']}, gaps: {report['gaps']}", end="")
+    print(f", coverage: {report['coverage']:.1%}\n" if report["coverage"] is not None else "\n")
 
-    if overlaps:
+    if report["examples"]:
         print("Examples (up to 20):")
-        for pair in overlaps[:20]:
-            a, b = pair
+        for o in report["examples"]:
+            a, b = o["earlier"], o["program"]
             print(f"- [{a['id']}] {a['title']}  {a['start_time']} -> {a['end_time']}")
             print(f"  overlaps with")
             print(f"  [{b['id']}] {b['title']}  {b['start_time']} -> {b['end_time']}\n")
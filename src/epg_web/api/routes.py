@@ -1,34 +1,61 @@
 """API endpoints for the EPG web service."""
-from typing import List
+import os
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
 from pydantic import HttpUrl
 
-from fastapi import APIRouter, File, HTTPException, UploadFile, Query
-from sqlalchemy import select, func
+from fastapi import APIRouter, File, HTTPException, Request, UploadFile, Query
+from fastapi.responses import FileResponse, PlainTextResponse, Response, StreamingResponse
+from sqlalchemy import select
 
-from epg_web.models.db import Channel, Program
+from epg_web.epg.parser import SUFFIX_FORMATS, country_code
+from epg_web.models.db import Channel
 from epg_web.models.schemas import ChannelResponse, ProgramResponse, EPGSourceUpdate
-from epg_web.services.storage import get_session
+from epg_web.services.storage import get_connection, get_session
+from epg_web.services.schedule import fetch_channel_page, fetch_channel_schedule, fetch_generation, to_naive_utc, to_utc_iso
+from epg_web.services.search import search_programs
+from epg_web.services.diagnostics import analyze_overlaps
+from epg_web.services.changes import fetch_changes
+from epg_web.services.events import broadcaster
+from epg_web.services.schedule_index import get_schedule_index
+from epg_web.services.export import WRITERS, ExportFilter, cache_path, stream_export
 from epg_web.services.fetcher import update_epg_from_url
-from epg_web.epg.parser import parse_epg_file
+from epg_web.services.icons import ICON_HEADERS, icon_cache
+from epg_web.services.importer import CHUNK_SIZE, iter_file
+from epg_web.services.jobs import get_job, remove_file, spool_upload, start_import_job
+from epg_web.services.metrics import render_prometheus
 
 router = APIRouter(tags=["epg"])
 
-@router.post("/upload")
+# Longest window /grid lays out
+GRID_MAX_HOURS = 48
+
+UPLOAD_SUFFIXES = tuple(s + gz for s in SUFFIX_FORMATS for gz in ("", ".gz"))
+
+@router.post("/upload", status_code=202)
 async def upload_epg_file(file: UploadFile = File(...)):
-    """Upload and parse an EPG file."""
-    if not file.filename.endswith((".xml", ".json")):
-        raise HTTPException(status_code=400, detail="Only XML and JSON files are supported")
-    
-    content = await file.read()
-    try:
-        epg_data = await parse_epg_file(content, file.filename)
-        async with get_session() as session:
-            # Store parsed data
-            # Implementation to be added
-            await session.commit()
-        return {"message": "EPG data uploaded successfully"}
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+    """Upload an EPG file (XML or JSON, optionally gzipped) and import it in the background."""
+    filename = file.filename or ""
+    if not filename.lower().endswith(UPLOAD_SUFFIXES):
+        raise HTTPException(status_code=400, detail="Only XML, JSON and NDJSON files (optionally .gz) are supported")
+
+    path = await spool_upload(file, CHUNK_SIZE)
+    job = start_import_job(
+        filename, iter_file(path), cleanup=remove_file(path), content_type=file.content_type
+    )
+    return {
+        "message": "EPG import started",
+        "job_id": job.id,
+        "status_url": f"/api/jobs/{job.id}"
+    }
+
+@router.get("/jobs/{job_id}", response_model=dict)
+async def get_import_job(job_id: str):
+    """Status of a background import started by /upload."""
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
 
 @router.post("/update-from-url")
 async def update_from_url(source: EPGSourceUpdate):
@@ -55,11 +82,9 @@ async def get_countries():
         
         countries = set()
         for name in channels:
-            if '|' in name:
-                code = name.split('|')[0].strip().upper()
-                # Only accept 2-character country codes
-                if len(code) == 2 and code.isalpha():
-                    countries.add(code)
+            code = country_code(name)
+            if code:
+                countries.add(code)
         
     # Convert to list of dicts and sort by code
     country_list = [{"code": code, "name": code} for code in countries]
@@ -82,132 +107,230 @@ async def get_channels(
     Returns paginated results with total count and page info.
     """
     country = (country or "CA").upper()
-    offset = (page - 1) * per_page
-    
-    async with get_session() as session:
-        # Build where clause for country prefix
-        where_clause = Channel.name.startswith(f"{country}|")
-        order_by_clause = [Channel.channel_id.collate('NOCASE')]
-
-        # Get total count for pagination
-        count_result = await session.execute(
-            select(Channel).where(where_clause)
-        )
-        total = len(count_result.scalars().all())
-        
-        # Get paginated results with program counts
-        result = await session.execute(
-            select(
-                Channel,
-                func.count(Program.id).label('program_count')
-            )
-            .outerjoin(Program, Channel.id == Program.channel_id)
-            .where(where_clause)
-            .group_by(Channel.id)
-            .order_by(*order_by_clause)
-            .offset(offset)
-            .limit(per_page)
-        )
-        
-        # Convert SQLAlchemy models to dictionaries
-        channels = []
-        for channel, program_count in result.all():
-            channels.append({
-                "id": channel.id,
-                "name": channel.name,
-                "channel_id": channel.channel_id,
-                "icon_url": channel.icon_url,
-                "program_count": program_count
-            })
-        
-        return {
-            "total": total,
-            "page": page,
-            "per_page": per_page,
-            "total_pages": (total + per_page - 1) // per_page,
-            "channels": channels
-        }
+    async with get_connection() as conn:
+        return await fetch_channel_page(conn, country, page, per_page)
 
 @router.get("/schedule/{channel_id}", response_model=dict)
 async def get_channel_schedule(channel_id: int):
     """Get the program schedule for a specific channel (all programs)."""
-    async with get_session() as session:
-        # First verify the channel exists and get its details
-        channel_result = await session.execute(
-            select(Channel).where(Channel.id == channel_id)
+    index = await get_schedule_index()
+    schedule = index.schedule(channel_id) if index is not None else None
+    if schedule is None:
+        # Not in the snapshot (no snapshot yet, or a newer import is being published)
+        async with get_connection() as conn:
+            schedule = await fetch_channel_schedule(conn, channel_id)
+    if schedule is None:
+        raise HTTPException(status_code=404, detail=f"Channel with id {channel_id} not found")
+    return schedule
+
+async def _snapshot_index():
+    """The snapshot for routes answered only from it, waiting for a rebuild if there is none.
+
+    None means nothing has been imported yet.
+    """
+    index = await get_schedule_index(wait=True)
+    if index is None:
+        async with get_connection() as conn:
+            if await fetch_generation(conn):
+                raise HTTPException(status_code=503, detail="Schedule snapshot unavailable",
+                                    headers={"Retry-After": "30"})
+    return index
+
+@router.get("/now", response_model=dict)
+async def get_now_next(
+    country: str = Query("CA", description="Country filter (2-letter code)"),
+    at: Optional[datetime] = Query(None, description="Instant to look up (ISO8601, default now)")
+):
+    """Get the program on air at `at` and the next one for every channel of a country."""
+    country = (country or "CA").upper()
+    if at is None:
+        at = datetime.now(timezone.utc)
+    index = await _snapshot_index()
+    channels = index.now_next(country, at) if index is not None else []
+    return {
+        "at": to_utc_iso(at),
+        "generation": index.generation if index is not None else 0,
+        "total": len(channels),
+        "channels": channels
+    }
+
+@router.get("/grid")
+async def get_grid(
+    country: str = Query("CA", description="Country filter (2-letter code)"),
+    start: Optional[datetime] = Query(None, description="Window start (ISO8601, default the current hour)"),
+    end: Optional[datetime] = Query(None, description="Window end (ISO8601, default start + 12h)"),
+    lanes: bool = Query(True, description="Put genuine overlaps in separate lanes instead of clipping them")
+):
+    """Precomputed guide layout: every channel of a country with its programs in the window
+    as clipped spans, assigned to lanes. Cached per import and window."""
+    country = (country or "CA").upper()
+    if start is None:
+        start = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    if end is None:
+        end = start + timedelta(hours=12)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+    if not start < end <= start + timedelta(hours=GRID_MAX_HOURS):
+        raise HTTPException(status_code=400, detail=f"end must be after start and at most {GRID_MAX_HOURS}h later")
+
+    index = await _snapshot_index()
+    if index is None:
+        return {"generation": 0, "country": country, "start": to_utc_iso(start), "end": to_utc_iso(end),
+                "lanes": lanes, "total": 0, "channels": []}
+    body = index.grid(country, int(start.timestamp()), int(end.timestamp()), lanes)
+    return Response(content=body, media_type="application/json")
+
+@router.get("/icons/{channel_id}")
+async def get_channel_icon(channel_id: int):
+    """A channel's icon, fetched once from its `icon_url`, resized and cached on disk."""
+    index = await get_schedule_index()
+    channel = index.channel(channel_id) if index is not None else None
+    if channel is not None:
+        icon_url = channel["icon_url"]
+    else:
+        async with get_connection() as conn:
+            icon_url = await conn.scalar(select(Channel.icon_url).where(Channel.id == channel_id))
+    icon = await icon_cache.get(icon_url) if icon_url else None
+    if icon is None:
+        raise HTTPException(status_code=404, detail=f"No icon for channel {channel_id}")
+    path, media_type = icon
+    return FileResponse(path, media_type=media_type, headers=ICON_HEADERS)
+
+@router.get("/generation", response_model=dict)
+async def get_generation(response: Response):
+    """Current data generation, for clients revalidating cached data."""
+    index = await get_schedule_index()
+    if index is not None:
+        generation = index.generation
+    else:
+        async with get_connection() as conn:
+            generation = await fetch_generation(conn)
+    response.headers["Cache-Control"] = "no-cache"
+    return {"generation": generation}
+
+@router.get("/changes", response_model=dict)
+async def get_changes(
+    since: int = Query(..., ge=0, description="Generation the client last synced (0 for everything)")
+):
+    """Channels and programs added, changed or removed after generation `since`.
+
+    Changed rows are returned in full, removed ones as ids. `full_resync` is
+    true if the change history doesn't reach back to `since`; the client must
+    then reload everything and continue from `generation`.
+    """
+    async with get_connection() as conn:
+        return await fetch_changes(conn, since)
+
+@router.get("/events")
+async def get_events(
+    country: Optional[str] = Query(None, description="Also send program boundaries of this country (2-letter code)")
+):
+    """Server-sent events: `generation` when a new import is available (also sent on
+    connect) and, with `country`, `boundary` whenever a program of the country starts
+    or ends, with the ids of the affected channels."""
+    return StreamingResponse(
+        broadcaster.subscribe(country.upper() if country else None),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def _export(request: Request, fmt: str, country, channel, start, end, gzip) -> Response:
+    if start is not None and end is not None and not start < end:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    export_filter = ExportFilter(
+        country=country.upper() if country else None,
+        channels=tuple(channel or ()),
+        start=to_naive_utc(start),
+        end=to_naive_utc(end),
+    )
+    index = await get_schedule_index()
+    if index is not None:
+        generation = index.generation
+    else:
+        async with get_connection() as conn:
+            generation = await fetch_generation(conn)
+
+    writer = WRITERS[fmt]
+    filename = f"epg-{export_filter.country or 'all'}.{writer.suffix}" + (".gz" if gzip else "")
+    headers = {
+        "ETag": f'"{generation}-{export_filter.key()}{"-gz" if gzip else ""}"',
+        "Cache-Control": "no-cache",
+        "Content-Disposition": f'attachment; filename="{filename}"',
+    }
+    media_type = "application/gzip" if gzip else writer.media_type
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    path = cache_path(generation, fmt, export_filter, gzip)
+    if os.path.exists(path):
+        return FileResponse(path, media_type=media_type, headers=headers)
+    return StreamingResponse(stream_export(fmt, export_filter, gzip, generation), media_type=media_type, headers=headers)
+
+@router.get("/export.xml")
+async def export_xmltv(
+    request: Request,
+    country: Optional[str] = Query(None, description="Only channels of this country (2-letter code)"),
+    channel: Optional[List[str]] = Query(None, description="Only these channels (feed channel ids; repeatable)"),
+    start: Optional[datetime] = Query(None, description="Only programs ending after this (ISO8601)"),
+    end: Optional[datetime] = Query(None, description="Only programs starting before this (ISO8601)"),
+    gzip: bool = Query(False, description="Return a gzip file")
+):
+    """Stream the stored channels and programs as an XMLTV document."""
+    return await _export(request, "xml", country, channel, start, end, gzip)
+
+@router.get("/export.ndjson")
+async def export_ndjson(
+    request: Request,
+    country: Optional[str] = Query(None, description="Only channels of this country (2-letter code)"),
+    channel: Optional[List[str]] = Query(None, description="Only these channels (feed channel ids; repeatable)"),
+    start: Optional[datetime] = Query(None, description="Only programs ending after this (ISO8601)"),
+    end: Optional[datetime] = Query(None, description="Only programs starting before this (ISO8601)"),
+    gzip: bool = Query(False, description="Return a gzip file")
+):
+    """Stream the stored channels and programs as NDJSON (one channel or program object
+    per line, with the field names of JSON feeds)."""
+    return await _export(request, "ndjson", country, channel, start, end, gzip)
+
+@router.get("/search", response_model=dict)
+async def search(
+    q: str = Query(..., min_length=1, description="Search text; the last word matches as a prefix"),
+    country: Optional[str] = Query(None, description="Country filter (2-letter code)"),
+    start: Optional[datetime] = Query(None, description="Only programs ending after this time"),
+    end: Optional[datetime] = Query(None, description="Only programs starting before this time"),
+    page: int = Query(1, ge=1, description="Page number"),
+    per_page: int = Query(50, ge=10, le=100, description="Items per page")
+):
+    """Full-text search over program titles, descriptions and categories, best matches first."""
+    async with get_connection() as conn:
+        return await search_programs(
+            conn,
+            q,
+            country=country.upper() if country else None,
+            start=to_naive_utc(start),
+            end=to_naive_utc(end),
+            page=page,
+            per_page=per_page,
         )
-        channel = channel_result.scalar_one_or_none()
-        if not channel:
-            raise HTTPException(status_code=404, detail=f"Channel with id {channel_id} not found")
-        
-        # Convert channel to dict
-        channel_dict = {
-            "id": channel.id,
-            "name": channel.name,
-            "channel_id": channel.channel_id,
-            "icon_url": channel.icon_url
-        }
-        
-        # Get ALL programs ordered by start time
-        result = await session.execute(
-            select(Program)
-            .where(Program.channel_id == channel_id)
-            .order_by(Program.start_time)
+
+@router.get("/diagnostics/overlaps", response_model=dict)
+async def get_overlap_diagnostics(
+    country: Optional[str] = Query(None, description="Country filter (2-letter code)"),
+    channel_id: Optional[int] = Query(None, description="Only this channel (database id)"),
+    min_gap: int = Query(0, ge=0, description="Ignore gaps up to this many seconds"),
+    limit: int = Query(50, ge=0, le=1000, description="Channels and overlap examples to list")
+):
+    """Overlaps, gaps and coverage of the stored schedules, worst channels first."""
+    async with get_connection() as conn:
+        return await analyze_overlaps(
+            conn,
+            country=country.upper() if country else None,
+            channel_id=channel_id,
+            min_gap_seconds=min_gap,
+            limit=limit,
         )
-        programs = result.scalars().all()
-        
-        # Convert programs to dicts (emit UTC ISO8601 with 'Z')
-        from datetime import timezone
-        def to_utc_iso(dt):
-            if not dt:
-                return None
-            # Data model stores UTC as naive; if naive, assume UTC (not server local)
-            if dt.tzinfo is None:
-                aware = dt.replace(tzinfo=timezone.utc)
-            else:
-                aware = dt
-            dt_utc = aware.astimezone(timezone.utc)
-            iso = dt_utc.isoformat()
-            # Ensure Z suffix
-            if iso.endswith("+00:00"):
-                iso = iso[:-6] + "Z"
-            return iso
-        program_list = []
-        for program in programs:
-            program_list.append({
-                "id": program.id,
-                "title": program.title,
-                "description": program.description,
-                "start_time": to_utc_iso(program.start_time),
-                "end_time": to_utc_iso(program.end_time),
-                "category": program.category,
-                "channel_id": program.channel_id
-            })
-        
-        return {
-            "total": len(program_list),
-            "programs": program_list,
-            "channel": channel_dict
-        }
 
-        # Add channel info to each program for convenience
-        program_list = []
-        for p in programs:
-            program_list.append({
-                "id": p.id,
-                "title": p.title,
-                "description": p.description,
-                "start_time": p.start_time,
-                "end_time": p.end_time,
-                "category": p.category,
-                "channel_id": p.channel_id,
-            })
-            
-        return {
-            "total": total,
-            "page": page,
-            "per_page": per_page,
-            "total_pages": (total + per_page - 1) // per_page,
-            "programs": program_list,
-            "channel": channel
-        }
\ No newline at end of file
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Import stage timings and request latencies of this worker, in Prometheus text format."""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,152 +1,75 @@
 """EPG file parser module."""
+import codecs
+import fnmatch
 import json
-from datetime import datetime
-from typing import Union
-
-import xmltodict
+import logging
+import os
+import re
+import zlib
+from datetime import datetime, timezone
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+from xml.parsers import expat
 
 from epg_web.models.schemas import ChannelCreate, EPGData, ProgramCreate
 
-async def parse_epg_file(content: bytes, filename: str) -> EPGData:
-    """Parse an EPG file (XML or JSON) and return structured data."""
-    try:
-        # Try to parse as XML first since we're dealing with XMLTV data
-        data = xmltodict.parse(content)
-        return parse_xmltv(data)
-    except Exception as xml_error:
-        try:
-            # If XML parsing fails, try JSON
-            if isinstance(content, bytes):
-                content = content.decode('utf-8')
-            data = json.loads(content)
-            return parse_json(data)
-        except Exception as json_error:
-            raise ValueError(f"Failed to parse EPG file: XML error: {xml_error}, JSON error: {json_error}")
-
-def parse_xmltv(data: dict) -> EPGData:
-    """Parse XMLTV format data."""
-    if "tv" not in data:
-        raise ValueError("Invalid XMLTV format: missing 'tv' element")
-    
-    tv_data = data["tv"]
-    channels = []
-    channel_map = {}  # Map XMLTV channel IDs to database IDs
-    
-    # Parse channels
-    channel_list = tv_data.get("channel", [])
-    if not isinstance(channel_list, list):
-        channel_list = [channel_list]
-    
-    for channel in channel_list:
-        channel_id = channel.get("@id", "")
-        if not channel_id:
-            continue
-            
-        # Clean and standardize the channel ID
-        clean_channel_id = str(channel_id).strip()
-        
-        display_name = channel.get("display-name", "")
-        if isinstance(display_name, list):
-            display_name = display_name[0]
-        if isinstance(display_name, dict):
-            display_name = display_name.get("#text", "Unknown")
-            
-        icon_url = None
-        if "icon" in channel:
-            icon = channel["icon"]
-            if isinstance(icon, dict):
-                icon_url = icon.get("@src")
-            elif isinstance(icon, list):
-                icon_url = icon[0].get("@src") if icon else None
-        
-        # Create channel object with cleaned ID
-        channel_data = ChannelCreate(
-            name=display_name,
-            channel_id=clean_channel_id,
-            icon_url=icon_url
-        )
-        channels.append(channel_data)
-        channel_map[clean_channel_id] = channel_data  # Map using cleaned ID
-    
-    # Parse programs
-    programs = []
-    program_list = tv_data.get("programme", [])
-    if not isinstance(program_list, list):
-        program_list = [program_list]
-    
-    for idx, program in enumerate(program_list):
-        channel_id = program.get("@channel", "")
-        if channel_id not in channel_map:
-            continue  # Skip programs for unknown channels
-            
-        title = program.get("title", "")
-        if isinstance(title, list):
-            title = title[0]
-        if isinstance(title, dict):
-            title = title.get("#text", "Unknown")
-            
-        desc = program.get("desc", "")
-        if isinstance(desc, list):
-            desc = desc[0]
-        if isinstance(desc, dict):
-            desc = desc.get("#text", "")
-            
-        category = program.get("category", "")
-        if isinstance(category, list) and category:
-            # Use the first category and extract text if it's a dict
-            category = category[0].get("#text", "") if isinstance(category[0], dict) else category[0]
-        elif isinstance(category, dict):
-            category = category.get("#text", "")
-        
-        try:
-            # Clean and validate the channel ID
-            clean_channel_id = str(channel_id).strip()
-            channel = channel_map.get(clean_channel_id)
-            
-            if channel:
-                programs.append(ProgramCreate(
-                    title=title,
-                    description=desc,
-                    start_time=parse_xmltv_time(program.get("@start", "")),
-                    end_time=parse_xmltv_time(program.get("@stop", "")),
-                    category=category,
-                    channel_id=clean_channel_id
-                ))
-            else:
-                continue
-        except (ValueError, KeyError) as e:
-            continue
-    
-    return EPGData(channels=channels, programs=programs)
-
-def parse_json(data: dict) -> EPGData:
-    """Parse JSON format data."""
-    if "channels" not in data or "programs" not in data:
-        raise ValueError("Invalid JSON format: missing 'channels' or 'programs'")
-    
-    channels = [
-        ChannelCreate(
-            name=channel["name"],
-            channel_id=channel["id"],
-            icon_url=channel.get("iconUrl")
-        )
-        for channel in data["channels"]
-    ]
-    
-    programs = [
-        ProgramCreate(
-            title=program["title"],
-            description=program.get("description"),
-            start_time=datetime.fromisoformat(program["startTime"]),
-            end_time=datetime.fromisoformat(program["endTime"]),
-            category=program.get("category"),
-            # normalize channel id to string to match XMLTV parsing behavior
-            channel_id=str(program["channelId"])
-        )
-        for program in data["programs"]
-    ]
-    
-    return EPGData(channels=channels, programs=programs)
+logger = logging.getLogger(__name__)
+
+
+class ChannelRecord(NamedTuple):
+    """A channel as produced by the incremental parsers."""
+    channel_id: str
+    name: str
+    icon_url: Optional[str]
+
+
+class ProgramRecord(NamedTuple):
+    """A programme as produced by the incremental parsers (naive UTC times)."""
+    channel_id: str
+    start_time: datetime
+    end_time: datetime
+    title: str
+    description: Optional[str]
+    category: Optional[str]
+
+
+def country_code(channel_name: str) -> Optional[str]:
+    """Return the 2-letter country prefix of a channel name ("CA| ..."), if any."""
+    if "|" not in channel_name:
+        return None
+    code = channel_name.split("|")[0].strip().upper()
+    if len(code) == 2 and code.isalpha():
+        return code
+    return None
+
+
+async def parse_epg_file(
+    content: bytes, filename: str, content_type: Optional[str] = None, feed_filter: Optional["FeedFilter"] = None
+) -> EPGData:
+    """Parse a whole EPG document (XMLTV, JSON or NDJSON, optionally gzipped).
+
+    The format is sniffed from the content, with ``filename`` and
+    ``content_type`` as hints (see ``sniff_format``); the document is parsed
+    once by the matching parser, keeping only what ``feed_filter`` accepts.
+    """
+    parser = FeedStreamParser(filename=filename, content_type=content_type, feed_filter=feed_filter)
+    parser.feed(content)
+    parser.close()
+    channels, programs = parser.take()
+    return EPGData(
+        channels=[ChannelCreate(name=c.name, channel_id=c.channel_id, icon_url=c.icon_url) for c in channels],
+        programs=[
+            ProgramCreate(
+                title=p.title,
+                description=p.description,
+                start_time=p.start_time,
+                end_time=p.end_time,
+                category=p.category,
+                channel_id=p.channel_id,
+            )
+            for p in programs
+        ],
+    )
 
 def parse_xmltv_time(time_str: str) -> datetime:
     """Parse XMLTV time format to UTC naive datetime.
@@ -177,4 +100,643 @@ def parse_xmltv_time(time_str: str) -> datetime:
     # attach tz and convert to UTC, then return naive UTC
     aware = dt.replace(tzinfo=tzinfo)
     dt_utc = aware.astimezone(timezone.utc)
-    return dt_utc.replace(tzinfo=None)
\ No newline at end of file
+    return dt_utc.replace(tzinfo=None)
+
+
+class FeedFilter:
+    """Which channels of a feed to import.
+
+    A channel is kept if its country (the 2-letter name prefix, "CA| ...")
+    is in ``countries`` (when given) and not in ``exclude_countries``, and
+    its id matches one of the ``channels`` glob patterns (when given) and
+    none of ``exclude_channels``. Patterns are matched case-insensitively.
+
+    Decisions are made on ``<channel>`` records and remembered by id, so a
+    programme is checked with one dict lookup. A programme whose channel
+    hasn't been seen yet is checked on its id alone; if the channel turns
+    out to be excluded, the importer drops its programmes as unmapped.
+    """
+
+    def __init__(
+        self,
+        countries: Sequence[str] = (),
+        exclude_countries: Sequence[str] = (),
+        channels: Sequence[str] = (),
+        exclude_channels: Sequence[str] = (),
+    ):
+        self.countries = {c.strip().upper() for c in countries if c.strip()}
+        self.exclude_countries = {c.strip().upper() for c in exclude_countries if c.strip()}
+        self._include = self._patterns(channels)
+        self._exclude = self._patterns(exclude_channels)
+        self._decisions: Dict[str, bool] = {}
+
+    @staticmethod
+    def _patterns(patterns: Sequence[str]) -> Optional[re.Pattern]:
+        patterns = [p.strip() for p in patterns if p.strip()]
+        if not patterns:
+            return None
+        return re.compile("|".join(fnmatch.translate(p) for p in patterns), re.IGNORECASE)
+
+    @property
+    def active(self) -> bool:
+        return bool(self.countries or self.exclude_countries or self._include or self._exclude)
+
+    def _id_allowed(self, channel_id: str) -> bool:
+        if self._include is not None and not self._include.match(channel_id):
+            return False
+        return self._exclude is None or not self._exclude.match(channel_id)
+
+    def channel(self, channel_id: str, name: str) -> bool:
+        """Whether to import this channel (and its programmes)."""
+        allowed = self._id_allowed(channel_id)
+        if allowed and (self.countries or self.exclude_countries):
+            code = country_code(name)
+            allowed = (not self.countries or code in self.countries) and code not in self.exclude_countries
+        self._decisions[channel_id] = allowed
+        return allowed
+
+    def program(self, channel_id: str) -> bool:
+        """Whether to import a programme of this channel."""
+        allowed = self._decisions.get(channel_id)
+        if allowed is None:
+            # Replaced by the full decision if the <channel> comes later
+            allowed = self._decisions[channel_id] = self._id_allowed(channel_id)
+        return allowed
+
+
+class ElementOffsets:
+    """Byte ranges of the top-level elements of an XMLTV document, by channel.
+
+    An element's range runs from its start tag to the start of the next
+    top-level element (or ``</tv>``), so whitespace and comments between
+    elements belong to the element before them. Adjacent ranges of the same
+    channel are merged, so a feed that lists each channel's programmes
+    together needs one range per channel.
+    """
+
+    def __init__(self):
+        # Offset of the first top-level element, i.e. the length of the prolog and <tv> tag
+        self.head: Optional[int] = None
+        self.channels: Dict[str, List[List[int]]] = {}
+        self.programmes: Dict[str, List[List[int]]] = {}
+        self._pending: Optional[tuple] = None
+
+    def element(self, name: str, channel_id: str, offset: int):
+        """Record the start tag of a top-level element at byte ``offset``."""
+        self.close(offset)
+        if self.head is None:
+            self.head = offset
+        if name == "programme":
+            self._pending = (self.programmes, channel_id, offset)
+        elif name == "channel":
+            self._pending = (self.channels, channel_id, offset)
+
+    def close(self, offset: int):
+        """End the element being recorded at byte ``offset``."""
+        if self._pending is None:
+            return
+        ranges, channel_id, start = self._pending
+        self._pending = None
+        runs = ranges.get(channel_id)
+        if runs is None:
+            ranges[channel_id] = [[start, offset - start]]
+        elif runs[-1][0] + runs[-1][1] == start:
+            runs[-1][1] += offset - start
+        else:
+            runs.append([start, offset - start])
+
+
+class XmltvStreamParser:
+    """Incremental XMLTV parser.
+
+    Bytes are passed to ``feed`` in chunks of any size; completed channels
+    and programmes are collected and handed out by ``take``, so memory use
+    is bounded by the chunk size rather than the document size.
+
+    Only the first display-name, icon (its ``src``), title, desc and
+    category of an element are used; their text is stripped, a present but
+    empty title or display-name becomes "Unknown", and missing fields are
+    empty strings (icon: None). Channel ids are stripped and channels
+    without one are skipped. Times are parsed with ``parse_xmltv_time`` (to
+    naive UTC); programmes with invalid times are dropped (counted in
+    ``invalid``).
+    """
+
+    CHANNEL_FIELDS = ("display-name", "icon")
+    PROGRAM_FIELDS = ("title", "desc", "category")
+
+    def __init__(self, offsets: Optional[ElementOffsets] = None, feed_filter: Optional[FeedFilter] = None):
+        parser = expat.ParserCreate()
+        parser.buffer_text = True
+        parser.buffer_size = 1 << 16
+        parser.StartElementHandler = self._start
+        parser.EndElementHandler = self._end
+        parser.CharacterDataHandler = self._characters
+        self._parser = parser
+        # Records where each channel's elements are in the input, if given
+        self.offsets = offsets
+        self.feed_filter = feed_filter
+        self._depth = 0
+        self._record: Optional[dict] = None
+        self._field: Optional[str] = None
+        self._text: List[str] = []
+        self.channels: List[ChannelRecord] = []
+        self.programs: List[ProgramRecord] = []
+        self.invalid = 0
+        self.filtered = 0
+        self.filtered_channels = 0
+
+    def feed(self, data: bytes, final: bool = False):
+        try:
+            self._parser.Parse(data, final)
+        except expat.ExpatError as e:
+            raise ValueError(f"Invalid XMLTV document: {e}") from e
+        if final and self._depth:
+            raise ValueError("Invalid XMLTV document: unexpected end of data")
+
+    def close(self):
+        self.feed(b"", final=True)
+
+    def take(self) -> Tuple[List[ChannelRecord], List[ProgramRecord]]:
+        """Return and forget the records completed since the last call."""
+        channels, programs = self.channels, self.programs
+        self.channels, self.programs = [], []
+        return channels, programs
+
+    def _start(self, name, attrs):
+        self._depth += 1
+        depth = self._depth
+        if depth == 1:
+            if name != "tv":
+                raise ValueError("Invalid XMLTV format: missing 'tv' element")
+        elif depth == 2:
+            if self.offsets is not None:
+                self.offsets.element(
+                    name, str(attrs.get("channel" if name == "programme" else "id", "")).strip(),
+                    self._parser.CurrentByteIndex,
+                )
+            if name == "programme":
+                channel = attrs.get("channel", "")
+                if self.feed_filter is not None and not self.feed_filter.program(channel.strip()):
+                    # Without a record the programme's children and text are ignored
+                    self.filtered += 1
+                    return
+                self._record = {
+                    "fields": self.PROGRAM_FIELDS,
+                    "channel": channel,
+                    "start": attrs.get("start", ""),
+                    "stop": attrs.get("stop", ""),
+                }
+            elif name == "channel":
+                self._record = {"fields": self.CHANNEL_FIELDS, "id": attrs.get("id", "")}
+        elif depth == 3 and self._record is not None:
+            record = self._record
+            if name in record["fields"] and name not in record:
+                if name == "icon":
+                    record["icon"] = attrs.get("src")
+                else:
+                    self._field = name
+                    self._text = []
+
+    def _characters(self, data):
+        if self._field is not None:
+            self._text.append(data)
+
+    def _end(self, name):
+        depth = self._depth
+        self._depth -= 1
+        if depth == 3 and self._field == name:
+            text = "".join(self._text).strip()
+            if not text and name in ("title", "display-name"):
+                text = "Unknown"
+            self._record[name] = text
+            self._field = None
+        elif depth == 1 and self.offsets is not None:
+            self.offsets.close(self._parser.CurrentByteIndex)
+        elif depth == 2 and self._record is not None:
+            record = self._record
+            self._record = None
+            if name == "programme":
+                self._end_programme(record)
+            elif name == "channel":
+                self._end_channel(record)
+
+    def _end_channel(self, record: dict):
+        channel_id = str(record["id"]).strip()
+        if not channel_id:
+            return
+        name = record.get("display-name", "")
+        if self.feed_filter is not None and not self.feed_filter.channel(channel_id, name):
+            self.filtered_channels += 1
+            return
+        self.channels.append(ChannelRecord(channel_id, name, record.get("icon")))
+
+    def _end_programme(self, record: dict):
+        try:
+            start_time = parse_xmltv_time(record["start"])
+            end_time = parse_xmltv_time(record["stop"])
+        except ValueError:
+            self.invalid += 1
+            return
+        self.programs.append(ProgramRecord(
+            str(record["channel"]).strip(),
+            start_time,
+            end_time,
+            record.get("title", ""),
+            record.get("desc", ""),
+            record.get("category", ""),
+        ))
+
+
+def _naive_utc(value: str) -> datetime:
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def json_channel_record(item: dict) -> ChannelRecord:
+    """Channel record from a JSON feed object (``id``, ``name``, ``iconUrl``)."""
+    return ChannelRecord(str(item["id"]).strip(), item["name"], item.get("iconUrl"))
+
+
+def json_program_record(item: dict) -> ProgramRecord:
+    """Program record from a JSON feed object; times are converted to naive UTC."""
+    return ProgramRecord(
+        str(item["channelId"]).strip(),
+        _naive_utc(item["startTime"]),
+        _naive_utc(item["endTime"]),
+        item["title"],
+        item.get("description"),
+        item.get("category"),
+    )
+
+
+class JsonStreamParser:
+    """Incremental parser for JSON and NDJSON feeds.
+
+    Accepts a sequence of top-level JSON objects separated by whitespace:
+
+    - a feed document ``{"channels": [...], "programs": [...]}``, whose
+      arrays are decoded one element at a time, so only the element being
+      parsed is held in memory;
+    - channel (``id``/``name``) and programme (``channelId``/``startTime``)
+      objects on their own, i.e. NDJSON with one record per line.
+
+    Records that lack required fields are skipped and counted in ``invalid``;
+    records rejected by ``feed_filter`` are skipped before their fields are
+    converted and counted in ``filtered``/``filtered_channels``.
+    """
+
+    ARRAYS = {"channels": "channel", "programs": "program"}
+    # Bytes a single record may span before the input is declared invalid
+    MAX_RECORD_CHARS = 8 << 20
+
+    _WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+    def __init__(self, encoding: str = "utf-8-sig", feed_filter: Optional[FeedFilter] = None):
+        self.feed_filter = feed_filter
+        self._decoder = codecs.getincrementaldecoder(encoding)()
+        self._json = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._consumed = 0
+        self._final = False
+        self._state = "top"
+        self._key: Optional[str] = None
+        self._array: Optional[str] = None
+        self._object: Optional[dict] = None
+        self._streamed = False
+        self.documents = 0
+        self.records = 0
+        self.channels: List[ChannelRecord] = []
+        self.programs: List[ProgramRecord] = []
+        self.invalid = 0
+        self.filtered = 0
+        self.filtered_channels = 0
+
+    def feed(self, data: bytes, final: bool = False):
+        try:
+            text = self._decoder.decode(data, final)
+        except UnicodeDecodeError as e:
+            raise ValueError(f"Invalid JSON feed: {e}") from e
+        self._consumed += self._pos
+        self._buf = self._buf[self._pos:] + text
+        self._pos = 0
+        self._final = final
+        self._run()
+        if final:
+            if self._state != "top" or self._buf[self._pos:].strip():
+                raise ValueError("Invalid JSON feed: unexpected end of data")
+            if not self.documents and not self.records:
+                raise ValueError("Invalid JSON format: missing 'channels' or 'programs'")
+
+    def close(self):
+        self.feed(b"", final=True)
+
+    def take(self) -> Tuple[List[ChannelRecord], List[ProgramRecord]]:
+        channels, programs = self.channels, self.programs
+        self.channels, self.programs = [], []
+        return channels, programs
+
+    def _skip_whitespace(self) -> Optional[str]:
+        """Move past whitespace; return the next character (None if none yet)."""
+        self._pos = self._WHITESPACE.match(self._buf, self._pos).end()
+        return self._buf[self._pos] if self._pos < len(self._buf) else None
+
+    def _decode(self):
+        """Decode the JSON value at the current position, or raise _Incomplete."""
+        try:
+            value, end = self._json.raw_decode(self._buf, self._pos)
+        except json.JSONDecodeError as e:
+            if self._final or len(self._buf) - self._pos > self.MAX_RECORD_CHARS:
+                raise ValueError(f"Invalid JSON feed at character {self._consumed + e.pos}: {e.msg}") from e
+            raise _Incomplete
+        # A number at the end of the buffer may continue in the next chunk
+        if end == len(self._buf) and not self._final:
+            raise _Incomplete
+        self._pos = end
+        return value
+
+    def _expect(self, char: str):
+        raise ValueError(f"Invalid JSON feed: expected {char} at character {self._consumed + self._pos}")
+
+    def _run(self):
+        try:
+            while True:
+                char = self._skip_whitespace()
+                if char is None:
+                    return
+                state = self._state
+                if state == "top":
+                    if char != "{":
+                        self._expect("'{'")
+                    self._pos += 1
+                    self._object = {}
+                    self._streamed = False
+                    self._state = "key"
+                elif state == "key":
+                    if char == "}":
+                        self._pos += 1
+                        self._end_object()
+                        self._state = "top"
+                    elif char == ",":
+                        self._pos += 1
+                    elif char == '"':
+                        self._key = self._decode()
+                        self._state = "colon"
+                    else:
+                        self._expect("a key")
+                elif state == "colon":
+                    if char != ":":
+                        self._expect("':'")
+                    self._pos += 1
+                    self._state = "value"
+                elif state == "value":
+                    if char == "[" and self._key in self.ARRAYS:
+                        self._pos += 1
+                        self._array = self.ARRAYS[self._key]
+                        self._streamed = True
+                        self._state = "array"
+                    else:
+                        self._object[self._key] = self._decode()
+                        self._state = "key"
+                elif state == "array":
+                    if char == "]":
+                        self._pos += 1
+                        self._state = "key"
+                    elif char == ",":
+                        self._pos += 1
+                    else:
+                        self._add(self._array, self._decode())
+        except _Incomplete:
+            return
+
+    def _end_object(self):
+        item, self._object = self._object, None
+        if self._streamed:
+            self.documents += 1
+        elif "startTime" in item or "channelId" in item:
+            self.records += 1
+            self._add("program", item)
+        elif "id" in item and "name" in item:
+            self.records += 1
+            self._add("channel", item)
+        else:
+            self.invalid += 1
+
+    def _add(self, kind: str, item):
+        feed_filter = self.feed_filter
+        try:
+            if kind == "program":
+                if feed_filter is not None and not feed_filter.program(str(item["channelId"]).strip()):
+                    self.filtered += 1
+                    return
+                self.programs.append(json_program_record(item))
+            else:
+                channel = json_channel_record(item)
+                if feed_filter is not None and not feed_filter.channel(channel.channel_id, channel.name):
+                    self.filtered_channels += 1
+                    return
+                self.channels.append(channel)
+        except (KeyError, TypeError, ValueError, AttributeError):
+            self.invalid += 1
+
+
+class _Incomplete(Exception):
+    """The buffer ends inside a JSON value; wait for more input."""
+
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+# Byte order marks: (bom, encoding of the whole feed, codec of the text after the BOM)
+BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig", "utf-8"),
+    (codecs.BOM_UTF16_LE, "utf-16", "utf-16-le"),
+    (codecs.BOM_UTF16_BE, "utf-16", "utf-16-be"),
+)
+
+CONTENT_TYPE_FORMATS = {
+    "application/xml": "xml",
+    "text/xml": "xml",
+    "application/xmltv+xml": "xml",
+    "application/json": "json",
+    "text/json": "json",
+    "application/x-ndjson": "json",
+    "application/ndjson": "json",
+    "application/jsonl": "json",
+    "application/json-seq": "json",
+}
+SUFFIX_FORMATS = {
+    ".xml": "xml",
+    ".xmltv": "xml",
+    ".json": "json",
+    ".ndjson": "json",
+    ".jsonl": "json",
+}
+
+# Give up if this much decoded input has no recognizable first character
+SNIFF_LIMIT = 4096
+
+
+def format_hint(filename: Optional[str] = None, content_type: Optional[str] = None) -> Optional[str]:
+    """Format suggested by a Content-Type or a file name/URL ("xml", "json" or None)."""
+    if content_type:
+        fmt = CONTENT_TYPE_FORMATS.get(content_type.split(";")[0].strip().lower())
+        if fmt:
+            return fmt
+    if filename:
+        name = os.path.basename(urlsplit(filename).path).lower()
+        if name.endswith(".gz"):
+            name = name[:-3]
+        return SUFFIX_FORMATS.get(os.path.splitext(name)[1])
+    return None
+
+
+def sniff_format(
+    head: bytes, filename: Optional[str] = None, content_type: Optional[str] = None
+) -> Optional[Tuple[str, str]]:
+    """Detect the format of (decompressed) feed bytes from their start.
+
+    Returns ``(format, encoding)`` where format is "xml" or "json" (JSON and
+    NDJSON share a parser), or None if ``head`` is too short to tell. The
+    first character after any BOM and whitespace decides: ``<`` is XML,
+    ``{``/``[`` JSON. Hints from ``filename``/``content_type`` only decide
+    when the content is unrecognizable, so the matching parser reports the
+    error.
+    """
+    encoding, body = "utf-8-sig", head
+    for bom, bom_encoding, codec in BOMS:
+        if head.startswith(bom):
+            encoding = bom_encoding
+            body = head[len(bom):]
+            break
+    else:
+        codec = "utf-8"
+        if head and any(bom.startswith(head) for bom, _, _ in BOMS):
+            return None
+    if codec != "utf-8":
+        body = body[:len(body) & ~1]
+    text = body.decode(codec, errors="ignore")
+    stripped = text.lstrip(" \t\r\n")
+    hint = format_hint(filename, content_type)
+    if stripped:
+        first = stripped[0]
+        if first == "<":
+            fmt = "xml"
+        elif first in "{[":
+            fmt = "json"
+        elif hint:
+            fmt = hint
+        else:
+            raise ValueError("Unrecognized EPG feed format: expected XMLTV or JSON")
+        if hint and hint != fmt:
+            logger.info("Feed %s looks like %s despite hint %s", filename or content_type, fmt, hint)
+        return fmt, encoding
+    if len(head) > SNIFF_LIMIT:
+        if hint:
+            return hint, encoding
+        raise ValueError("Unrecognized EPG feed format: no content")
+    return None
+
+
+class FeedStreamParser:
+    """Incremental parser for any supported feed.
+
+    Input that starts with the gzip magic bytes is inflated on the fly. The
+    format is then sniffed from the first decompressed bytes (``sniff_format``)
+    and the rest is passed to the matching incremental parser. ``filename``
+    and ``content_type`` may be set until the first ``feed``.
+
+    An ``archive`` (with ``write(bytes)`` and an ``offsets`` ElementOffsets)
+    receives the decompressed bytes of an XMLTV feed, and the offsets of its
+    elements are recorded while parsing; other formats are not archived.
+    Channels and programmes rejected by ``feed_filter`` are skipped.
+    """
+
+    def __init__(
+        self,
+        filename: Optional[str] = None,
+        content_type: Optional[str] = None,
+        archive=None,
+        feed_filter: Optional[FeedFilter] = None,
+    ):
+        self.filename = filename
+        self.content_type = content_type
+        self.archive = archive
+        self.feed_filter = feed_filter
+        self.format: Optional[str] = None
+        self.compressed = False
+        self._inflater = None
+        self._magic_checked = False
+        self._raw_head = b""
+        self._head = b""
+        self._parser = None
+
+    @property
+    def invalid(self) -> int:
+        return self._parser.invalid if self._parser is not None else 0
+
+    @property
+    def filtered(self) -> int:
+        return self._parser.filtered if self._parser is not None else 0
+
+    @property
+    def filtered_channels(self) -> int:
+        return self._parser.filtered_channels if self._parser is not None else 0
+
+    def feed(self, chunk: bytes):
+        if not self._magic_checked:
+            self._raw_head += chunk
+            if len(self._raw_head) < len(GZIP_MAGIC):
+                return
+            self._magic_checked = True
+            chunk, self._raw_head = self._raw_head, b""
+            if chunk.startswith(GZIP_MAGIC):
+                self.compressed = True
+                self._inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        if self._inflater is not None:
+            try:
+                chunk = self._inflater.decompress(chunk)
+            except zlib.error as e:
+                raise ValueError(f"Invalid gzip data: {e}") from e
+        self._feed_parser(chunk)
+
+    def _feed_parser(self, data: bytes, final: bool = False):
+        if self._parser is None:
+            self._head += data
+            detected = sniff_format(self._head, self.filename, self.content_type)
+            if detected is None:
+                if not final:
+                    return
+                if not self._head.strip():
+                    raise ValueError("Empty EPG feed")
+                detected = (format_hint(self.filename, self.content_type) or "xml", "utf-8-sig")
+            self.format, encoding = detected
+            if self.format == "xml":
+                self._parser = XmltvStreamParser(
+                    self.archive.offsets if self.archive is not None else None, self.feed_filter
+                )
+            else:
+                self._parser = JsonStreamParser(encoding, self.feed_filter)
+                self.archive = None
+            data, self._head = self._head, b""
+        if self.archive is not None:
+            self.archive.write(data)
+        self._parser.feed(data)
+
+    def close(self):
+        if not self._magic_checked:
+            self._magic_checked = True
+            self._feed_parser(self._raw_head)
+        if self._inflater is not None:
+            self._feed_parser(self._inflater.flush())
+            if not self._inflater.eof:
+                raise ValueError("Invalid gzip data: truncated stream")
+        self._feed_parser(b"", final=True)
+        self._parser.close()
+
+    def take(self) -> Tuple[List[ChannelRecord], List[ProgramRecord]]:
+        if self._parser is None:
+            return [], []
+        return self._parser.take()
@@ -1,4 +1,6 @@
 """FastAPI application entry point."""
+import logging
+from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import Annotated
 
@@ -7,7 +9,40 @@ from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
-app = FastAPI(title="EPG Web Service", description="Electronic Program Guide Web Service")
+from epg_web.services.events import broadcaster
+from epg_web.services.icons import icon_cache
+from epg_web.services.metrics import RequestMetricsMiddleware
+from epg_web.services.profiling import ProfilingMiddleware
+from epg_web.services.storage import dispose_engines, upgrade_schema, warm_read_pool
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Upgrade the schema, warm the read pool and start the event broadcaster and
+    icon prewarming on startup; stop them and the engines on shutdown."""
+    try:
+        await upgrade_schema()
+    except Exception as e:
+        # Another worker may be upgrading; the first import upgrades otherwise
+        logger.warning("Could not upgrade the database schema: %s", e)
+    await warm_read_pool()
+    broadcaster.start()
+    icon_cache.start()
+    yield
+    await broadcaster.stop()
+    await icon_cache.close()
+    await dispose_engines()
+
+
+app = FastAPI(
+    title="EPG Web Service",
+    description="Electronic Program Guide Web Service",
+    lifespan=lifespan,
+)
+app.add_middleware(RequestMetricsMiddleware)
+app.add_middleware(ProfilingMiddleware)
 
 # Mount static files and templates
 static_path = Path(__file__).parent / "static"
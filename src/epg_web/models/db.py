@@ -1,7 +1,7 @@
 """SQLAlchemy models for the EPG database."""
 from datetime import datetime
 
-from sqlalchemy import DateTime, ForeignKey, Integer, String, Text
+from sqlalchemy import DDL, DateTime, ForeignKey, Index, Integer, String, Text, event
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 class Base(DeclarativeBase):
@@ -16,6 +16,9 @@ class Channel(Base):
     name: Mapped[str] = mapped_column(String(100), nullable=False)
     channel_id: Mapped[str] = mapped_column(String(50), nullable=False)
     icon_url: Mapped[str] = mapped_column(String(255), nullable=True)
+    # Channel whose `programs` rows hold this channel's schedule: its own id, or
+    # for a simulcast with an identical schedule the channel storing it
+    schedule_id: Mapped[int] = mapped_column(Integer, nullable=True, index=True)
     
     programs: Mapped[list["Program"]] = relationship(
         "Program", back_populates="channel", cascade="all, delete-orphan"
@@ -24,6 +27,12 @@ class Channel(Base):
 class Program(Base):
     """TV Program model."""
     __tablename__ = "programs"
+    __table_args__ = (
+        # Serves per-channel schedule reads (ordered by start) and program counts
+        Index("ix_programs_channel_start", "channel_id", "start_time"),
+        # Lets retention delete whole expired days with a range scan
+        Index("ix_programs_day", "day"),
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     title: Mapped[str] = mapped_column(String(200), nullable=False)
@@ -34,5 +43,50 @@ class Program(Base):
     channel_id: Mapped[int] = mapped_column(
         Integer, ForeignKey("channels.id"), nullable=False
     )
+    # UTC day of start_time as days since 1970-01-01 (see services.retention)
+    day: Mapped[int] = mapped_column(Integer, nullable=True)
     
-    channel: Mapped[Channel] = relationship("Channel", back_populates="programs")
\ No newline at end of file
+    channel: Mapped[Channel] = relationship("Channel", back_populates="programs")
+
+# Full-text index over program text. It is an external-content FTS5 table
+# (rows live in `programs`), repopulated by the import with a 'rebuild'.
+PROGRAMS_FTS_TABLE = "programs_fts"
+
+event.listen(
+    Program.__table__,
+    "after_create",
+    DDL(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {PROGRAMS_FTS_TABLE} USING fts5("
+        "title, description, category, "
+        "content='programs', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    ),
+)
+event.listen(
+    Program.__table__,
+    "before_drop",
+    DDL(f"DROP TABLE IF EXISTS {PROGRAMS_FTS_TABLE}"),
+)
+
+class ImportGeneration(Base):
+    """One row per completed import; the highest id is the current data generation."""
+    __tablename__ = "generations"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    source: Mapped[str] = mapped_column(String(255), nullable=True)
+    channels: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    programs: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    # Number of change records, NULL if this generation's changes are not (or no longer) recorded
+    changes: Mapped[int] = mapped_column(Integer, nullable=True)
+
+class ChangeRecord(Base):
+    """A channel or program added, changed or removed by an import generation."""
+    __tablename__ = "changes"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    generation: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
+    # "channel" or "program"
+    kind: Mapped[str] = mapped_column(String(10), nullable=False)
+    entity_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    channel_id: Mapped[int] = mapped_column(Integer, nullable=False)
@@ -0,0 +1,208 @@
+"""Archive of imported XMLTV feeds with a per-channel byte-offset index.
+
+Each import of an XMLTV feed writes the (decompressed) document to
+EPG_DUMP_DIR (``epg_dumps/``) as ``epg-<generation>.xml`` while it is
+parsed, and next to it ``epg-<generation>.idx.json``: the byte ranges of
+every channel's ``<channel>`` and ``<programme>`` elements, recorded by the
+streaming parser (``ElementOffsets``). The last EPG_DUMP_KEEP (2) feeds are
+kept; 0 disables archiving. Archiving is best effort: a directory or file
+that can't be written is logged and the import goes on without an archive.
+
+``ArchivedFeed`` maps an archive read-only, so extracting or re-parsing one
+channel reads only its ranges instead of downloading and parsing the whole
+feed.
+"""
+import glob
+import json
+import logging
+import mmap
+import os
+import re
+import uuid
+from typing import List, Optional, Tuple
+
+from epg_web.epg.parser import ChannelRecord, ElementOffsets, ProgramRecord, XmltvStreamParser
+
+logger = logging.getLogger(__name__)
+
+DUMP_DIR = os.environ.get("EPG_DUMP_DIR", "epg_dumps")
+DUMP_KEEP = int(os.environ.get("EPG_DUMP_KEEP", "2"))
+
+_ARCHIVE_NAME = re.compile(r"epg-(\d+)\.xml$")
+
+
+def _archives(directory: str) -> List[Tuple[int, str]]:
+    """(generation, path) of the archived feeds in ``directory``, oldest first."""
+    found = []
+    for path in glob.glob(os.path.join(directory, "epg-*.xml")):
+        match = _ARCHIVE_NAME.search(path)
+        if match:
+            found.append((int(match.group(1)), path))
+    return sorted(found)
+
+
+def index_path(path: str) -> str:
+    return path[:-len(".xml")] + ".idx.json"
+
+
+class FeedArchive:
+    """Copy of the feed being imported; pass it to ``FeedStreamParser(archive=...)``.
+
+    Raises ``OSError`` if the temporary file can't be created; see ``open_archive``.
+    """
+
+    def __init__(self, directory: str = DUMP_DIR):
+        self.directory = directory
+        self.offsets = ElementOffsets()
+        self.size = 0
+        self.failed = False
+        os.makedirs(directory, exist_ok=True)
+        self._tmp_path = os.path.join(directory, f"import-{uuid.uuid4().hex}.xml.tmp")
+        self._file = open(self._tmp_path, "wb")
+
+    def write(self, data: bytes):
+        # A full disk loses the archive, not the import
+        if self.failed:
+            return
+        try:
+            self._file.write(data)
+        except OSError as e:
+            logger.error("Could not archive feed: %s", e)
+            self.failed = True
+        self.size += len(data)
+
+    def commit(self, generation: int, source: str) -> Optional[str]:
+        """Keep the archive as the feed of ``generation``; return its path.
+
+        Nothing is kept if the feed wasn't XMLTV or couldn't be written.
+        Older archives beyond DUMP_KEEP are deleted.
+        """
+        try:
+            self._file.close()
+        except OSError as e:
+            logger.error("Could not archive feed: %s", e)
+            self.failed = True
+        if self.offsets.head is None or self.failed:
+            self.discard()
+            return None
+        path = os.path.join(self.directory, f"epg-{generation}.xml")
+        index = {
+            "generation": generation,
+            "source": source,
+            "size": self.size,
+            "head": self.offsets.head,
+            "channels": self.offsets.channels,
+            "programmes": self.offsets.programmes,
+        }
+        tmp_index = f"{self._tmp_path}.idx"
+        try:
+            with open(tmp_index, "w", encoding="utf-8") as f:
+                json.dump(index, f, separators=(",", ":"))
+            os.replace(self._tmp_path, path)
+            os.replace(tmp_index, index_path(path))
+        except OSError as e:
+            logger.error("Could not archive feed: %s", e)
+            self.discard()
+            for name in (tmp_index, path):
+                try:
+                    os.remove(name)
+                except OSError:
+                    pass
+            return None
+        for _, old in _archives(self.directory)[:-max(DUMP_KEEP, 1)]:
+            for name in (old, index_path(old)):
+                try:
+                    os.remove(name)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.error("Could not remove archived feed: %s", e)
+        logger.info("Archived feed of generation %d to %s (%d bytes)", generation, path, self.size)
+        return path
+
+    def discard(self):
+        try:
+            self._file.close()
+            os.remove(self._tmp_path)
+        except OSError:
+            pass
+
+
+def open_archive(directory: str = DUMP_DIR) -> Optional[FeedArchive]:
+    """A new ``FeedArchive``, or None if archiving is disabled or fails to start."""
+    if DUMP_KEEP <= 0:
+        return None
+    try:
+        return FeedArchive(directory)
+    except OSError as e:
+        logger.error("Could not archive feed: %s", e)
+        return None
+
+
+class ArchivedFeed:
+    """Read-only, memory-mapped archived feed and its index."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(index_path(path), encoding="utf-8") as f:
+            index = json.load(f)
+        self.generation: int = index["generation"]
+        self.source: str = index["source"]
+        self._head: int = index["head"]
+        self._channels = index["channels"]
+        self._programmes = index["programmes"]
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @classmethod
+    def latest(cls, directory: str = DUMP_DIR) -> Optional["ArchivedFeed"]:
+        """The archive of the newest generation, if any."""
+        archives = _archives(directory)
+        return cls(archives[-1][1]) if archives else None
+
+    def close(self):
+        self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def channel_ids(self) -> List[str]:
+        return list(self._channels)
+
+    def _read(self, ranges) -> bytes:
+        return b"".join(self._mm[start:start + length] for start, length in ranges)
+
+    def channel_xml(self, channel_id: str) -> bytes:
+        """The channel's ``<channel>`` element(s) as in the feed."""
+        return self._read(self._channels.get(channel_id, ()))
+
+    def programmes_xml(self, channel_id: str) -> bytes:
+        """The channel's ``<programme>`` elements as in the feed."""
+        return self._read(self._programmes.get(channel_id, ()))
+
+    def extract(self, channel_id: str) -> Optional[bytes]:
+        """An XMLTV document with only this channel, or None if the feed lacks it.
+
+        The prolog and ``<tv>`` tag are copied from the feed.
+        """
+        if channel_id not in self._channels and channel_id not in self._programmes:
+            return None
+        return b"".join((
+            self._mm[:self._head],
+            self.channel_xml(channel_id),
+            self.programmes_xml(channel_id),
+            b"</tv>\n",
+        ))
+
+    def parse(self, channel_id: str) -> Tuple[List[ChannelRecord], List[ProgramRecord]]:
+        """Parse one channel's records from the archive."""
+        document = self.extract(channel_id)
+        if document is None:
+            return [], []
+        parser = XmltvStreamParser()
+        parser.feed(document)
+        parser.close()
+        return parser.take()
@@ -0,0 +1,148 @@
+"""Per-generation change history for incremental client sync.
+
+Each import records which channels and programs it added, changed or removed
+(``changes`` table, one row per entity). ``GET /api/changes?since=<generation>``
+returns the current state of everything changed after ``since``: rows that
+still exist are returned in full, the others as deleted ids.
+
+History is kept for the last EPG_CHANGE_HISTORY (50) generations. An import
+changing more than EPG_CHANGE_LIMIT (50000) entities (e.g. the first one)
+records no history. ``generations.changes`` is NULL for generations without
+history, and clients syncing from before such a generation must fetch
+everything again (``full_resync``).
+"""
+import os
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from epg_web.models.db import ChangeRecord, ImportGeneration
+from epg_web.services.schedule import (
+    CHANNEL_COLUMNS,
+    PROGRAM_COLUMNS,
+    channel_row_to_dict,
+    channels_table,
+    fetch_generation,
+    program_row_to_dict,
+    programs_table,
+)
+
+CHANGE_HISTORY = int(os.environ.get("EPG_CHANGE_HISTORY", "50"))
+CHANGE_LIMIT = int(os.environ.get("EPG_CHANGE_LIMIT", "50000"))
+
+changes_table = ChangeRecord.__table__
+generations_table = ImportGeneration.__table__
+
+# Ids per IN (...) query
+ID_BATCH = 500
+
+
+class ChangeLog:
+    """Entities touched by one import; gives up past ``limit`` entries."""
+
+    def __init__(self, limit: int = CHANGE_LIMIT):
+        self.limit = limit
+        self.channels: Set[int] = set()
+        self.programs: Dict[int, int] = {}
+        self.overflow = False
+
+    def __len__(self) -> int:
+        return len(self.channels) + len(self.programs)
+
+    def channel(self, channel_id: int):
+        if not self.overflow:
+            self.channels.add(channel_id)
+            self._check()
+
+    def programs_of(self, rows: Iterable[Tuple[int, int]]):
+        """Add (program id, channel id) pairs."""
+        if not self.overflow:
+            self.programs.update(rows)
+            self._check()
+
+    def _check(self):
+        if len(self) > self.limit:
+            self.overflow = True
+            self.channels.clear()
+            self.programs.clear()
+
+
+async def record_changes(session: AsyncSession, generation: int, log: ChangeLog) -> Optional[int]:
+    """Store the changes of ``generation`` and drop history beyond CHANGE_HISTORY.
+
+    Returns:
+        Optional[int]: Number of records stored, None if too many to record
+    """
+    rows = [
+        {"generation": generation, "kind": "channel", "entity_id": c, "channel_id": c}
+        for c in log.channels
+    ]
+    rows.extend(
+        {"generation": generation, "kind": "program", "entity_id": p, "channel_id": c}
+        for p, c in log.programs.items()
+    )
+    if rows and not log.overflow:
+        await session.execute(insert(changes_table), rows)
+
+    oldest = generation - CHANGE_HISTORY
+    await session.execute(delete(changes_table).where(changes_table.c.generation <= oldest))
+    await session.execute(
+        update(generations_table)
+        .where(generations_table.c.id <= oldest, generations_table.c.changes.is_not(None))
+        .values(changes=None)
+    )
+    return None if log.overflow else len(rows)
+
+
+async def _fetch_by_ids(conn: AsyncConnection, columns, id_column, ids: List[int]) -> list:
+    rows = []
+    for start in range(0, len(ids), ID_BATCH):
+        result = await conn.execute(select(*columns).where(id_column.in_(ids[start:start + ID_BATCH])))
+        rows.extend(result)
+    return rows
+
+
+async def fetch_changes(conn: AsyncConnection, since: int) -> dict:
+    """Return the channels and programs changed after generation ``since``.
+
+    ``full_resync`` is set instead when the history doesn't reach back to
+    ``since`` (or ``since`` is from a newer or replaced database).
+    """
+    generation = await fetch_generation(conn)
+    # Latest generation without history: a delta must start at or after it
+    floor = (
+        await conn.execute(select(func.max(generations_table.c.id)).where(generations_table.c.changes.is_(None)))
+    ).scalar() or 0
+    response = {
+        "generation": generation,
+        "since": since,
+        "full_resync": since > generation or since < floor,
+        "channels": [],
+        "programs": [],
+        "deleted_channels": [],
+        "deleted_programs": [],
+    }
+    if response["full_resync"] or since == generation:
+        return response
+
+    c = changes_table.c
+    result = await conn.execute(
+        select(c.kind, c.entity_id).where(c.generation > since).group_by(c.kind, c.entity_id)
+    )
+    channel_ids, program_ids = [], []
+    for kind, entity_id in result:
+        (channel_ids if kind == "channel" else program_ids).append(entity_id)
+    if len(channel_ids) + len(program_ids) > CHANGE_LIMIT:
+        response["full_resync"] = True
+        return response
+
+    channels = await _fetch_by_ids(conn, CHANNEL_COLUMNS, channels_table.c.id, channel_ids)
+    programs = await _fetch_by_ids(conn, PROGRAM_COLUMNS, programs_table.c.id, program_ids)
+    found_channels = {row[0] for row in channels}
+    found_programs = {row[0] for row in programs}
+    response["channels"] = [channel_row_to_dict(row) for row in channels]
+    response["programs"] = [program_row_to_dict(row) for row in programs]
+    response["deleted_channels"] = sorted(set(channel_ids) - found_channels)
+    response["deleted_programs"] = sorted(set(program_ids) - found_programs)
+    return response
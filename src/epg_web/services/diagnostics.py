@@ -0,0 +1,223 @@
+"""Schedule quality diagnostics: overlaps, gaps and coverage per channel.
+
+Everything is computed in one pass over ``programs`` streamed in
+``(channel_id, start_time)`` order, which the ``ix_programs_channel_start``
+index provides. Each programme is compared with the latest end time of all
+earlier programmes of its channel (not only the previous one), so a short
+programme nested inside a long one doesn't hide an overlap with the next
+programme:
+
+- overlap: the programme starts before that end; its length is the part of
+  the programme before that end
+- gap: the programme starts after that end; its length is the empty time
+- covered time: the part of the programme after that end, so the union of
+  a channel's programmes is counted once
+
+Coverage is covered time divided by the channel's span (first start to last
+end).
+
+Statistics are computed once per stored schedule and reported for every
+channel showing it, so simulcasts sharing a schedule each count as a channel
+(``schedule_id`` names the channel storing it).
+"""
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import String, select, type_coerce
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from epg_web.services.schedule import (
+    channels_table,
+    fetch_generation,
+    programs_table,
+    stored_time_to_iso,
+)
+
+# Rows fetched from the stream at a time
+STREAM_PARTITION = 10000
+
+
+class ChannelStats:
+    """Running overlap/gap/coverage totals of one channel."""
+
+    __slots__ = (
+        "id", "schedule_id", "programs", "overlaps", "overlap_seconds", "gaps", "gap_seconds",
+        "covered_seconds", "first_start", "last_end", "last_end_program",
+    )
+
+    def __init__(self, channel_id: int, program: tuple):
+        _, _, start, end = program
+        self.id = channel_id
+        self.schedule_id = channel_id
+        self.programs = 1
+        self.overlaps = 0
+        self.overlap_seconds = 0.0
+        self.gaps = 0
+        self.gap_seconds = 0.0
+        self.covered_seconds = max((end - start).total_seconds(), 0.0)
+        self.first_start = start
+        # Latest end so far and the (id, title, start, end) programme that has it
+        self.last_end = end
+        self.last_end_program = program
+
+    def for_channel(self, channel_id: int) -> "ChannelStats":
+        """The same totals reported for a channel sharing this schedule."""
+        copy = ChannelStats.__new__(ChannelStats)
+        for slot in self.__slots__:
+            setattr(copy, slot, getattr(self, slot))
+        copy.id = channel_id
+        return copy
+
+    def to_dict(self, name: Optional[str], source_id: Optional[str]) -> dict:
+        span = (self.last_end - self.first_start).total_seconds()
+        return {
+            "id": self.id,
+            "name": name,
+            "channel_id": source_id,
+            "schedule_id": self.schedule_id,
+            "programs": self.programs,
+            "overlaps": self.overlaps,
+            "overlap_seconds": round(self.overlap_seconds),
+            "gaps": self.gaps,
+            "gap_seconds": round(self.gap_seconds),
+            "covered_seconds": round(self.covered_seconds),
+            "span_seconds": round(span),
+            "coverage": round(self.covered_seconds / span, 4) if span > 0 else None,
+            "first_start": _iso(self.first_start),
+            "last_end": _iso(self.last_end),
+        }
+
+
+def _iso(dt: datetime) -> str:
+    return stored_time_to_iso(dt.isoformat(" ", "microseconds"))
+
+
+def _program_dict(row) -> dict:
+    return {
+        "id": row[0],
+        "title": row[1],
+        "start_time": _iso(row[2]),
+        "end_time": _iso(row[3]),
+    }
+
+
+async def analyze_overlaps(
+    conn: AsyncConnection,
+    country: Optional[str] = None,
+    channel_id: Optional[int] = None,
+    min_gap_seconds: int = 0,
+    limit: int = 50,
+) -> dict:
+    """Return overlap, gap and coverage statistics for all matching channels.
+
+    Args:
+        conn: Read connection
+        country: Only channels with this 2-letter name prefix
+        channel_id: Only this channel (database id)
+        min_gap_seconds: Gaps up to this length are not counted
+        limit: Number of worst channels and of overlap examples to list
+
+    Returns:
+        dict: Totals, the ``limit`` channels with the most overlaps (then
+        the most gap time) and the first ``limit`` overlapping pairs
+    """
+    p = programs_table.c
+    # Times come back as stored text and are parsed with fromisoformat,
+    # which is several times faster than the generic DateTime processor
+    query = select(
+        p.channel_id,
+        p.id,
+        p.title,
+        type_coerce(p.start_time, String),
+        type_coerce(p.end_time, String),
+    ).order_by(p.channel_id, p.start_time, p.end_time, p.id)
+    c = channels_table.c
+    conditions = []
+    if channel_id is not None:
+        conditions.append(c.id == channel_id)
+    if country:
+        conditions.append(c.name.startswith(f"{country}|"))
+    if conditions:
+        query = query.where(p.channel_id.in_(select(c.schedule_id).where(*conditions)))
+
+    parse = datetime.fromisoformat
+    stats: List[ChannelStats] = []
+    examples = []
+    current: Optional[ChannelStats] = None
+    result = await conn.stream(query)
+    async for partition in result.partitions(STREAM_PARTITION):
+        for channel, program_id, title, start_text, end_text in partition:
+            start = parse(start_text)
+            end = parse(end_text)
+            program = (program_id, title, start, end)
+            if current is None or current.id != channel:
+                current = ChannelStats(channel, program)
+                stats.append(current)
+                continue
+
+            current.programs += 1
+            last_end = current.last_end
+            if start < last_end:
+                overlap = (min(last_end, end) - start).total_seconds()
+                current.overlaps += 1
+                current.overlap_seconds += overlap
+                if len(examples) < limit:
+                    examples.append({
+                        "channel": {"id": channel},
+                        "earlier": _program_dict(current.last_end_program),
+                        "program": _program_dict(program),
+                        "overlap_seconds": round(overlap),
+                    })
+            elif start > last_end:
+                gap = (start - last_end).total_seconds()
+                if gap > min_gap_seconds:
+                    current.gaps += 1
+                    current.gap_seconds += gap
+            if end > last_end:
+                current.covered_seconds += (end - max(start, last_end)).total_seconds()
+                current.last_end = end
+                current.last_end_program = program
+
+    # Stats of each stored schedule for every matching channel showing it
+    by_schedule = {s.id: s for s in stats}
+    stats = []
+    first_channel: Dict[int, int] = {}
+    for row in await conn.execute(select(c.id, c.schedule_id).where(*conditions).order_by(c.id)):
+        schedule = by_schedule.get(row.schedule_id)
+        if schedule is not None:
+            stats.append(schedule.for_channel(row.id))
+            first_channel.setdefault(row.schedule_id, row.id)
+    for example in examples:
+        example["channel"]["id"] = first_channel.get(example["channel"]["id"], example["channel"]["id"])
+
+    worst = sorted(stats, key=lambda c: (-c.overlaps, -c.gap_seconds, c.id))[:limit]
+    names = await _channel_names(conn, {c.id for c in worst} | {e["channel"]["id"] for e in examples})
+    for example in examples:
+        example["channel"]["name"] = names.get(example["channel"]["id"], (None, None))[0]
+
+    total_span = sum((c.last_end - c.first_start).total_seconds() for c in stats)
+    total_covered = sum(c.covered_seconds for c in stats)
+    return {
+        "generation": await fetch_generation(conn),
+        "channels": len(stats),
+        "programs": sum(c.programs for c in stats),
+        "channels_with_overlaps": sum(1 for c in stats if c.overlaps),
+        "channels_with_gaps": sum(1 for c in stats if c.gaps),
+        "overlaps": sum(c.overlaps for c in stats),
+        "overlap_seconds": round(sum(c.overlap_seconds for c in stats)),
+        "gaps": sum(c.gaps for c in stats),
+        "gap_seconds": round(sum(c.gap_seconds for c in stats)),
+        "coverage": round(total_covered / total_span, 4) if total_span > 0 else None,
+        "min_gap_seconds": min_gap_seconds,
+        "by_channel": [c.to_dict(*names.get(c.id, (None, None))) for c in worst],
+        "examples": examples,
+    }
+
+
+async def _channel_names(conn: AsyncConnection, ids) -> Dict[int, tuple]:
+    """Map channel ids to (name, source channel id)."""
+    if not ids:
+        return {}
+    c = channels_table.c
+    result = await conn.execute(select(c.id, c.name, c.channel_id).where(c.id.in_(ids)))
+    return {row[0]: (row[1], row[2]) for row in result}
@@ -0,0 +1,169 @@
+"""Server-sent events: new data generations and program boundaries.
+
+One ``Broadcaster`` per worker process watches the mapped snapshot (and
+starts icon prewarming for each new generation) and publishes each event
+once, pre-encoded, to a topic: ``generation`` (a new import is available)
+and one ``boundary`` topic per country with subscribers (a program of the
+country started or ended). Subscribers only wait on the futures of their
+topics, so an idle connection costs a coroutine and no work per event beyond
+writing it.
+
+A topic keeps only its latest event; a subscriber that falls behind skips
+to it, which is all clients need (both events mean "refetch").
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, List, Optional
+
+from epg_web.services.icons import icon_cache
+from epg_web.services.schedule import to_utc_iso
+from epg_web.services.schedule_index import get_schedule_index
+
+logger = logging.getLogger(__name__)
+
+# How often to look for a generation published by another worker
+EVENTS_POLL_SECONDS = float(os.environ.get("EPG_EVENTS_POLL_SECONDS", "5"))
+# Comment line sent to idle connections so proxies keep them open
+EVENTS_KEEPALIVE_SECONDS = 15
+# Reconnect delay suggested to clients (ms)
+EVENTS_RETRY_MS = 5000
+
+KEEPALIVE = b": keepalive\n\n"
+
+
+def encode_event(event: str, data: dict) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode("utf-8")
+
+
+class Topic:
+    """Latest event of one stream and the future resolved by the next one."""
+
+    def __init__(self):
+        self.seq = 0
+        self.message: Optional[bytes] = None
+        self.subscribers = 0
+        self.changed: asyncio.Future = asyncio.get_running_loop().create_future()
+        # Boundary topics: next transition (epoch seconds) and its channels, for ``generation``
+        self.next_at: Optional[int] = None
+        self.next_channels: List[int] = []
+        self.generation: Optional[int] = None
+
+    def publish(self, message: bytes):
+        self.seq += 1
+        self.message = message
+        changed, self.changed = self.changed, asyncio.get_running_loop().create_future()
+        changed.set_result(None)
+
+
+class Broadcaster:
+    """Publishes events to every subscriber of this process."""
+
+    def __init__(self):
+        self._generation: Optional[Topic] = None
+        self._countries: Dict[str, Topic] = {}
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._generation = Topic()
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self):
+        """Check for a new generation now (called after an import in this process)."""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def subscribe(self, country: Optional[str] = None) -> AsyncIterator[bytes]:
+        """Yield encoded events for a client until it disconnects."""
+        self.start()
+        topics: List[Topic] = [self._generation]
+        if country:
+            topic = self._countries.get(country)
+            if topic is None:
+                topic = self._countries[country] = Topic()
+                self._wake.set()
+            topics.append(topic)
+        for topic in topics:
+            topic.subscribers += 1
+        seen = [topic.seq for topic in topics]
+        try:
+            yield f"retry: {EVENTS_RETRY_MS}\n\n".encode("ascii")
+            if self._generation.message is not None:
+                yield self._generation.message
+            while True:
+                waiting = [t.changed for t, s in zip(topics, seen) if t.seq == s]
+                if len(waiting) == len(topics):
+                    done, _ = await asyncio.wait(
+                        waiting, timeout=EVENTS_KEEPALIVE_SECONDS, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    if not done:
+                        yield KEEPALIVE
+                        continue
+                for n, topic in enumerate(topics):
+                    if topic.seq != seen[n]:
+                        seen[n] = topic.seq
+                        yield topic.message
+        finally:
+            for topic in topics:
+                topic.subscribers -= 1
+            if country and self._countries.get(country) is topics[-1] and not topics[-1].subscribers:
+                del self._countries[country]
+
+    async def _run(self):
+        generation = None
+        while True:
+            try:
+                snapshot = await get_schedule_index()
+            except Exception as e:
+                logger.warning("Event broadcaster could not read the snapshot: %s", e)
+                snapshot = None
+            now = int(time.time())
+            if snapshot is not None:
+                if snapshot.generation != generation:
+                    generation = snapshot.generation
+                    self._generation.publish(encode_event("generation", {"generation": generation}))
+                    icon_cache.prewarm(generation, snapshot.icon_urls())
+                for country, topic in list(self._countries.items()):
+                    if topic.generation != generation:
+                        topic.generation = generation
+                        topic.next_at, topic.next_channels = snapshot.next_transition(country, now)
+                    if topic.next_at is None or topic.next_at > now:
+                        continue
+                    # Only the latest boundary is sent if several passed
+                    while topic.next_at is not None and topic.next_at <= now:
+                        at, channels = topic.next_at, topic.next_channels
+                        topic.next_at, topic.next_channels = snapshot.next_transition(country, at)
+                    topic.publish(encode_event("boundary", {
+                        "country": country,
+                        "at": to_utc_iso(datetime.fromtimestamp(at, timezone.utc)),
+                        "generation": generation,
+                        "channels": channels,
+                    }))
+
+            wait = EVENTS_POLL_SECONDS
+            upcoming = [t.next_at for t in self._countries.values() if t.next_at is not None]
+            if upcoming:
+                wait = max(0.0, min(wait, min(upcoming) - time.time()))
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+
+broadcaster = Broadcaster()
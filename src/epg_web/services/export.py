@@ -0,0 +1,253 @@
+"""Streaming XMLTV and NDJSON export of the stored schedule.
+
+``/api/export.xml`` and ``/api/export.ndjson`` write channels and then
+programmes, optionally limited to a country, a list of source channel ids
+and a time window. Rows are read from a server-side cursor in
+``(channel, start)`` order and formatted one at a time into chunks of about
+EXPORT_CHUNK_BYTES, so memory use does not depend on the export size. With
+``gzip`` the chunks are compressed as they are produced.
+
+All queries of one export run in a single read transaction, so the output
+is one generation even if an import commits meanwhile. Finished exports are
+written to EPG_EXPORT_CACHE_DIR (default: next to the database) under their
+generation, format and filters and served from there until the next import;
+the newest EPG_EXPORT_CACHE_FILES are kept.
+
+The NDJSON records use the JSON feed field names, so an export can be
+imported again. A shared simulcast schedule is written for every channel
+showing it, as in the source feed.
+"""
+import hashlib
+import json
+import logging
+import os
+import uuid
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, NamedTuple, Optional, Tuple
+from xml.sax.saxutils import escape, quoteattr
+
+from sqlalchemy import String, select, type_coerce
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from epg_web.services.schedule import channels_table, fetch_generation, programs_table, stored_time_to_iso
+from epg_web.services.storage import DATABASE_PATH, get_connection
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CACHE_DIR = os.environ.get("EPG_EXPORT_CACHE_DIR", f"{DATABASE_PATH}.exports")
+EXPORT_CACHE_FILES = int(os.environ.get("EPG_EXPORT_CACHE_FILES", "32"))
+# Rows fetched from the cursor at a time
+STREAM_PARTITION = 5000
+# Output is handed to the response in pieces of about this size
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+
+class ExportFilter(NamedTuple):
+    """Which channels and programmes to export; empty fields don't filter."""
+
+    country: Optional[str] = None
+    channels: Tuple[str, ...] = ()
+    start: Optional[datetime] = None  # naive UTC; programmes ending after it
+    end: Optional[datetime] = None  # naive UTC; programmes starting before it
+
+    def key(self) -> str:
+        """Short stable digest of the filter, for cache file names and ETags."""
+        text = "|".join((
+            self.country or "",
+            ",".join(sorted(self.channels)),
+            self.start.isoformat() if self.start else "",
+            self.end.isoformat() if self.end else "",
+        ))
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def _xmltv_time(value: str) -> str:
+    """Stored timestamp text to XMLTV ``YYYYMMDDhhmmss +0000``."""
+    if len(value) < 19:
+        value = datetime.fromisoformat(value).isoformat(" ")
+    return value[0:4] + value[5:7] + value[8:10] + value[11:13] + value[14:16] + value[17:19] + " +0000"
+
+
+class XmltvWriter:
+    media_type = "application/xml"
+    suffix = "xml"
+
+    def header(self) -> str:
+        return '<?xml version="1.0" encoding="UTF-8"?>\n<tv generator-info-name="EPG Web Service">\n'
+
+    def channel(self, channel_id: str, name: str, icon_url: Optional[str]) -> str:
+        icon = f"    <icon src={quoteattr(icon_url)}/>\n" if icon_url else ""
+        return (
+            f"  <channel id={quoteattr(channel_id)}>\n"
+            f"    <display-name>{escape(name)}</display-name>\n{icon}  </channel>\n"
+        )
+
+    def program(self, channel_id, start, end, title, description, category) -> str:
+        parts = [
+            f"  <programme start=\"{_xmltv_time(start)}\" stop=\"{_xmltv_time(end)}\""
+            f" channel={quoteattr(channel_id)}>\n    <title>{escape(title)}</title>\n"
+        ]
+        if description:
+            parts.append(f"    <desc>{escape(description)}</desc>\n")
+        if category:
+            parts.append(f"    <category>{escape(category)}</category>\n")
+        parts.append("  </programme>\n")
+        return "".join(parts)
+
+    def footer(self) -> str:
+        return "</tv>\n"
+
+
+class NdjsonWriter:
+    media_type = "application/x-ndjson"
+    suffix = "ndjson"
+
+    def header(self) -> str:
+        return ""
+
+    def channel(self, channel_id: str, name: str, icon_url: Optional[str]) -> str:
+        record = {"id": channel_id, "name": name}
+        if icon_url:
+            record["iconUrl"] = icon_url
+        return json.dumps(record, ensure_ascii=False) + "\n"
+
+    def program(self, channel_id, start, end, title, description, category) -> str:
+        record = {
+            "channelId": channel_id,
+            "startTime": stored_time_to_iso(start),
+            "endTime": stored_time_to_iso(end),
+            "title": title,
+        }
+        if description:
+            record["description"] = description
+        if category:
+            record["category"] = category
+        return json.dumps(record, ensure_ascii=False) + "\n"
+
+    def footer(self) -> str:
+        return ""
+
+
+WRITERS = {"xml": XmltvWriter(), "ndjson": NdjsonWriter()}
+
+
+def _channel_filter(query, export_filter: ExportFilter):
+    c = channels_table.c
+    if export_filter.country:
+        query = query.where(c.name.startswith(f"{export_filter.country}|"))
+    if export_filter.channels:
+        query = query.where(c.channel_id.in_(export_filter.channels))
+    return query
+
+
+async def iter_export(conn: AsyncConnection, writer, export_filter: ExportFilter) -> AsyncIterator[str]:
+    """Yield the export as text chunks of about EXPORT_CHUNK_BYTES characters."""
+    c = channels_table.c
+    p = programs_table.c
+    buf = [writer.header()]
+    size = len(buf[0])
+
+    channels = _channel_filter(select(c.channel_id, c.name, c.icon_url).order_by(c.id), export_filter)
+    result = await conn.stream(channels)
+    async for partition in result.partitions(STREAM_PARTITION):
+        for row in partition:
+            text = writer.channel(*row)
+            buf.append(text)
+            size += len(text)
+            if size >= EXPORT_CHUNK_BYTES:
+                yield "".join(buf)
+                buf, size = [], 0
+
+    # Times as stored text, formatted by slicing (see schedule.PROGRAM_COLUMNS)
+    programs = _channel_filter(
+        select(
+            c.channel_id,
+            type_coerce(p.start_time, String),
+            type_coerce(p.end_time, String),
+            p.title,
+            p.description,
+            p.category,
+        )
+        .join(channels_table, p.channel_id == c.schedule_id)
+        .order_by(c.id, p.start_time, p.id),
+        export_filter,
+    )
+    if export_filter.start is not None:
+        programs = programs.where(p.end_time > export_filter.start)
+    if export_filter.end is not None:
+        programs = programs.where(p.start_time < export_filter.end)
+    result = await conn.stream(programs)
+    async for partition in result.partitions(STREAM_PARTITION):
+        for row in partition:
+            text = writer.program(*row)
+            buf.append(text)
+            size += len(text)
+            if size >= EXPORT_CHUNK_BYTES:
+                yield "".join(buf)
+                buf, size = [], 0
+    buf.append(writer.footer())
+    yield "".join(buf)
+
+
+def cache_path(generation: int, fmt: str, export_filter: ExportFilter, gzip: bool) -> str:
+    name = f"{generation}-{export_filter.key()}.{WRITERS[fmt].suffix}"
+    return os.path.join(EXPORT_CACHE_DIR, name + ".gz" if gzip else name)
+
+
+def _prune_cache(generation: int):
+    """Delete exports of older generations and all but the newest EXPORT_CACHE_FILES."""
+    try:
+        entries = [e for e in os.scandir(EXPORT_CACHE_DIR) if not e.name.endswith(".tmp")]
+    except FileNotFoundError:
+        return
+    current = [e for e in entries if e.name.startswith(f"{generation}-")]
+    current.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+    stale = [e for e in entries if not e.name.startswith(f"{generation}-")] + current[EXPORT_CACHE_FILES:]
+    for entry in stale:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+async def stream_export(
+    fmt: str, export_filter: ExportFilter, gzip: bool, generation: int
+) -> AsyncIterator[bytes]:
+    """Stream an export as bytes and store it in the cache under ``generation``.
+
+    The file is only kept if the export completes and the data read is still
+    ``generation``.
+    """
+    writer = WRITERS[fmt]
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+    path = cache_path(generation, fmt, export_filter, gzip)
+    os.makedirs(EXPORT_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    out = open(tmp_path, "wb")
+    complete = False
+    try:
+        async with get_connection() as conn:
+            # One snapshot for all queries of the export
+            await conn.exec_driver_sql("BEGIN")
+            cacheable = await fetch_generation(conn) == generation
+            async for text in iter_export(conn, writer, export_filter):
+                data = text.encode("utf-8")
+                if compressor is not None:
+                    data = compressor.compress(data)
+                if data:
+                    out.write(data)
+                    yield data
+            if compressor is not None:
+                data = compressor.flush()
+                out.write(data)
+                yield data
+            await conn.rollback()
+        complete = True
+    finally:
+        out.close()
+        if complete and cacheable:
+            os.replace(tmp_path, path)
+            _prune_cache(generation)
+        else:
+            os.remove(tmp_path)
@@ -1,7 +1,23 @@
 """EPG data fetching service."""
 import asyncio
+import logging
+from typing import AsyncIterator, Optional
+
 import aiohttp
 
+from epg_web.epg.parser import ChannelRecord, ProgramRecord
+from epg_web.models.schemas import EPGData
+from epg_web.services.importer import (
+    BATCH_SIZE,
+    CHUNK_SIZE,
+    ImportWriter,
+    import_epg_stream,
+    iter_bytes,
+)
+from epg_web.services.metrics import ImportMetrics
+
+logger = logging.getLogger(__name__)
+
 # Default EPG source URL
 DEFAULT_EPG_URL = "http://vpn.modetv.ink/xmltv.php?username=rz8c28z5wu&password=tj5rvj6f2x"
 
@@ -36,137 +52,112 @@ async def fetch_epg_data(url: str = DEFAULT_EPG_URL) -> bytes:
             raise ValueError(f"Unexpected error while fetching EPG data: {str(e)}")
 
 
+class UrlFeedStream:
+    """Async iterator over a feed download in chunks.
+
+    ``content_type`` holds the response's Content-Type once the first chunk
+    has been returned, so the importer can use it as a format hint.
+
+    Raises:
+        ValueError: If the URL is invalid or the request fails
+    """
+
+    def __init__(self, url: str, chunk_size: int = CHUNK_SIZE):
+        self.url = url
+        self.chunk_size = chunk_size
+        self.content_type: Optional[str] = None
+        self._chunks = self._download()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        return await self._chunks.__anext__()
+
+    async def aclose(self):
+        await self._chunks.aclose()
+
+    async def _download(self) -> AsyncIterator[bytes]:
+        # No total limit: the import parses while downloading; stalls still time out
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=60)
+        conn = aiohttp.TCPConnector(verify_ssl=False)  # Skip SSL verification if needed
+
+        async with aiohttp.ClientSession(connector=conn, timeout=timeout) as session:
+            try:
+                async with session.get(self.url) as response:
+                    if response.status != 200:
+                        raise ValueError(f"Failed to fetch EPG data: HTTP {response.status}")
+                    self.content_type = response.headers.get("Content-Type")
+                    async for chunk in response.content.iter_chunked(self.chunk_size):
+                        yield chunk
+            except aiohttp.ClientError as e:
+                raise ValueError(f"Failed to fetch EPG data: {str(e)}")
+            except asyncio.TimeoutError:
+                raise ValueError("Timeout while fetching EPG data")
+
+
+def iter_epg_url(url: str = DEFAULT_EPG_URL, chunk_size: int = CHUNK_SIZE) -> UrlFeedStream:
+    """Stream EPG data from a URL in chunks (see ``UrlFeedStream``)."""
+    return UrlFeedStream(url, chunk_size)
+
+
 async def update_epg_from_url(url: str = DEFAULT_EPG_URL) -> dict:
     """Update EPG data from a URL.
 
+    The feed is parsed and staged while it downloads (see ``importer``).
+
     Args:
         url: The URL to fetch EPG data from
 
     Returns:
         dict: Summary of the update operation
     """
-    from epg_web.epg.parser import parse_epg_file
-    from epg_web.services.storage import get_session
-    from epg_web.models.db import Channel, Program
-    from sqlalchemy import delete
-
-    # Fetch and parse the EPG data
-    content = await fetch_epg_data(url)
-    epg_data = await parse_epg_file(content, url.lower())
-
-    async with get_session() as session:
-        # Clear existing data
-        await session.execute(delete(Program))
-        await session.execute(delete(Channel))
-        await session.flush()
-
-        # Create new channel records and store in dictionary by channel_id string
-        db_channels = {}  # Map channel_id to Channel object
-        for idx, channel_data in enumerate(epg_data.channels):
-            try:
-                # Clean and standardize the channel ID
-                clean_channel_id = str(channel_data.channel_id).strip()
-                
-                channel = Channel(
-                    name=channel_data.name,
-                    channel_id=clean_channel_id,  # Use cleaned ID
-                    icon_url=channel_data.icon_url
-                )
-                session.add(channel)
-                db_channels[clean_channel_id] = channel  # Store using cleaned ID
-            except Exception as e:
-                print(f"ERROR creating channel {channel_data.name}: {e}")
-
-        # Flush to get channel IDs
-        await session.flush()
-
-        # Group programs by channel for merging consecutive identical entries
-        from collections import defaultdict
-        programs_by_channel = defaultdict(list)
-        skipped = 0
-        seen_unknown = set()
-
-        for idx, program_data in enumerate(epg_data.programs):
-            try:
-                # Clean and standardize the program's channel ID for lookup
-                clean_channel_id = str(program_data.channel_id).strip()
-                
-                if clean_channel_id not in db_channels:
-                    if clean_channel_id not in seen_unknown:
-                        seen_unknown.add(clean_channel_id)
-                    skipped += 1
-                    continue
-
-                channel = db_channels[clean_channel_id]
-                programs_by_channel[channel.id].append(program_data)
-
-            except Exception as e:
-                print(f"ERROR processing program {program_data.title}: {e}")
-                skipped += 1
-                continue
-
-        # Merge consecutive identical programs per channel
-        mapped = 0
-        merged_count = 0
-        for channel_id, program_list in programs_by_channel.items():
-            # Sort by start_time
-            program_list.sort(key=lambda p: p.start_time)
-            
-            merged_programs = []
-            for prog in program_list:
-                # Check if we can merge with the last merged program
-                if merged_programs:
-                    last = merged_programs[-1]
-                    # Merge if: same title, same description (or both None/empty), same category,
-                    # and time ranges are connected (overlap or touch)
-                    desc_match = (last.description or "").strip() == (prog.description or "").strip()
-                    cat_match = (last.category or "").strip() == (prog.category or "").strip()
-                    title_match = last.title.strip() == prog.title.strip()
-                    # Consider connected if the next starts at or before the last ends
-                    connected = prog.start_time <= last.end_time
-                    
-                    if title_match and desc_match and cat_match and connected:
-                        # Extend the last program's end time to cover the union
-                        if prog.end_time > last.end_time:
-                            last.end_time = prog.end_time
-                        merged_count += 1
-                        continue
-                
-                # No merge: add as new
-                merged_programs.append(prog)
-            
-            # Insert merged programs into DB
-            for prog_data in merged_programs:
-                try:
-                    program = Program(
-                        title=prog_data.title,
-                        description=prog_data.description,
-                        start_time=prog_data.start_time,
-                        end_time=prog_data.end_time,
-                        category=prog_data.category,
-                        channel_id=channel_id
-                    )
-                    session.add(program)
-                    mapped += 1
-
-                    # Commit in batches to avoid memory issues
-                    if mapped % 1000 == 0:
-                        await session.flush()
-
-                except Exception as e:
-                    print(f"ERROR creating program {prog_data.title}: {e}")
-                    continue
+    return await import_epg_stream(iter_epg_url(url), str(url))
 
-        try:
-            await session.commit()
-            print(f"Merged {merged_count} consecutive identical programs.")
-            return {
-                "channels": len(db_channels),
-                "programs": mapped,
-                "merged": merged_count,
-                "skipped": skipped,
-                "unmapped_channels": len(seen_unknown)
-            }
-        except Exception as e:
-            print(f"ERROR during final commit: {e}")
-            raise
\ No newline at end of file
+
+async def import_epg_content(content: bytes, source: str, metrics: Optional[ImportMetrics] = None) -> dict:
+    """Parse raw EPG content and replace the stored data with it.
+
+    Args:
+        content: Raw XMLTV or JSON document, optionally gzipped
+        source: Where the content came from (URL or filename), recorded with
+            the import generation
+        metrics: Metrics of this import; a new one is started if omitted
+
+    Returns:
+        dict: Summary of the update operation
+    """
+    return await import_epg_stream(iter_bytes(content), source, metrics)
+
+
+async def store_epg_data(epg_data: EPGData, source: str, metrics: Optional[ImportMetrics] = None) -> dict:
+    """Replace the stored channels and programs with parsed EPG data.
+
+    Args:
+        epg_data: Parsed channels and programs
+        source: Where the data came from, recorded with the import generation
+        metrics: Receives per-stage timings and counters, if given
+
+    Returns:
+        dict: Summary of the update operation
+    """
+    from epg_web.services.storage import get_write_session
+
+    if metrics is None:
+        metrics = ImportMetrics(source)
+
+    channels = [
+        ChannelRecord(str(c.channel_id).strip(), c.name, c.icon_url) for c in epg_data.channels
+    ]
+    programs = [
+        ProgramRecord(str(p.channel_id).strip(), p.start_time, p.end_time, p.title, p.description, p.category)
+        for p in epg_data.programs
+    ]
+    async with get_write_session() as session:
+        writer = ImportWriter(session, source, metrics)
+        await writer.start()
+        for start in range(0, len(programs), BATCH_SIZE):
+            await writer.add(channels if start == 0 else [], programs[start:start + BATCH_SIZE])
+        if not programs:
+            await writer.add(channels, [])
+        return await writer.finish()
@@ -0,0 +1,277 @@
+"""Channel icon proxy with an on-disk LRU cache.
+
+``/api/icons/{channel_id}`` serves a channel's icon from EPG_ICON_CACHE_DIR
+(default: next to the database). On a miss the remote ``icon_url`` is
+fetched through one pooled aiohttp session, scaled down to ICON_SIZE pixels
+and re-encoded (WebP, or PNG if Pillow lacks WebP) when Pillow is installed,
+and written to the cache. Without Pillow the original image is cached as is.
+SVGs are kept as they are; responses carry a sandboxing
+Content-Security-Policy so scripts in them never run on our origin.
+
+Cache files are named after a hash of the icon URL, so a changed URL is a
+new entry. Hits touch the file's mtime; when the cache grows past
+EPG_ICON_CACHE_MB the least recently used files are deleted. Failed fetches
+are remembered for ICON_FAILURE_TTL seconds so slow or dead hosts are not
+retried on every request. When the server sees a new generation (the event
+broadcaster's poll, so imports by scripts and other workers count too) it
+fetches the icons of all channels in the background (``IconCache.prewarm``);
+a marker file in the cache lets only one worker do so per generation.
+"""
+import asyncio
+import hashlib
+import io
+import logging
+import mimetypes
+import os
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+import aiohttp
+
+from epg_web.services.storage import DATABASE_PATH
+
+try:
+    from PIL import Image
+except ImportError:  # optional: icons are cached unresized
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+ICON_CACHE_DIR = os.environ.get("EPG_ICON_CACHE_DIR", f"{DATABASE_PATH}.icons")
+ICON_CACHE_MAX_BYTES = int(float(os.environ.get("EPG_ICON_CACHE_MB", "64")) * 1024 * 1024)
+# Longest side of a resized icon (the grid shows them at 32px)
+ICON_SIZE = 64
+# Larger downloads are abandoned
+ICON_MAX_SOURCE_BYTES = 2 * 1024 * 1024
+ICON_FETCH_TIMEOUT = 10
+ICON_FAILURE_TTL = 600
+# Concurrent downloads while prewarming
+PREWARM_CONCURRENCY = 8
+# Browsers may reuse an icon this long without revalidating
+ICON_MAX_AGE = 7 * 24 * 3600
+# Icons come from the feed and are served from our origin: an SVG opened
+# directly must not run scripts or load anything, nor be sniffed as HTML
+ICON_HEADERS = {
+    "Cache-Control": f"public, max-age={ICON_MAX_AGE}",
+    "Content-Security-Policy": "sandbox; default-src 'none'",
+    "X-Content-Type-Options": "nosniff",
+}
+
+# Extensions of cached originals by content type
+CONTENT_TYPE_SUFFIXES = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+    "image/svg+xml": ".svg",
+    "image/x-icon": ".ico",
+    "image/vnd.microsoft.icon": ".ico",
+}
+SUFFIXES = set(CONTENT_TYPE_SUFFIXES.values())
+
+
+class IconCache:
+    """Fetches, converts and stores icons; one instance per worker process."""
+
+    def __init__(self, directory: str = ICON_CACHE_DIR, max_bytes: int = ICON_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._failures: Dict[str, float] = {}
+        self._size: Optional[int] = None
+        self._prewarm: Optional[asyncio.Task] = None
+        self._started = False
+
+    def _key(self, url: str) -> str:
+        return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+    def _find(self, key: str) -> Optional[str]:
+        for suffix in SUFFIXES:
+            path = os.path.join(self.directory, key + suffix)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def _client(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=PREWARM_CONCURRENCY * 2, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=ICON_FETCH_TIMEOUT),
+            )
+        return self._session
+
+    def start(self):
+        """Allow prewarming (server lifespan); it stops again on ``close``."""
+        self._started = True
+
+    async def close(self):
+        self._started = False
+        if self._prewarm is not None:
+            self._prewarm.cancel()
+        if self._session is not None:
+            await self._session.close()
+
+    async def get(self, url: str) -> Optional[Tuple[str, str]]:
+        """Return (path, content type) of the cached icon for ``url``, fetching it on a miss.
+
+        Returns None if the icon can't be fetched.
+        """
+        key = self._key(url)
+        path = self._find(key)
+        if path is None:
+            failed_at = self._failures.get(key)
+            if failed_at is not None and time.monotonic() - failed_at < ICON_FAILURE_TTL:
+                return None
+            # Concurrent requests for the same icon share one download
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._inflight[key] = asyncio.ensure_future(self._fetch(key, url))
+                future.add_done_callback(lambda _: self._inflight.pop(key, None))
+            path = await asyncio.shield(future)
+            if path is None:
+                return None
+        else:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        return path, content_type
+
+    async def _fetch(self, key: str, url: str) -> Optional[str]:
+        try:
+            async with self._client().get(url) as response:
+                if response.status != 200:
+                    raise ValueError(f"HTTP {response.status}")
+                content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+                data = await response.content.read(ICON_MAX_SOURCE_BYTES + 1)
+            if len(data) > ICON_MAX_SOURCE_BYTES:
+                raise ValueError("icon too large")
+            data, suffix = await asyncio.to_thread(convert_icon, data, content_type, url)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, OSError) as e:
+            logger.debug("Could not fetch icon %s: %s", url, e)
+            self._failures[key] = time.monotonic()
+            return None
+        self._failures.pop(key, None)
+        return self._store(key + suffix, data)
+
+    def _store(self, name: str, data: bytes) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, name)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        if self._size is None:
+            self._size = sum(size for _, _, size in self._entries())
+        else:
+            self._size += len(data)
+        if self._size > self.max_bytes:
+            self._evict(keep=path)
+        return path
+
+    def _entries(self) -> Iterable[Tuple[float, str, int]]:
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if os.path.splitext(entry.name)[1] in SUFFIXES:
+                        stat = entry.stat()
+                        yield stat.st_mtime, entry.path, stat.st_size
+        except FileNotFoundError:
+            return
+
+    def _evict(self, keep: str):
+        """Delete least recently used icons until the cache is within 90% of its cap."""
+        entries = sorted(self._entries())
+        total = sum(size for _, _, size in entries)
+        for _, path, size in entries:
+            if total <= self.max_bytes * 0.9:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._size = total
+
+    def _claim(self, generation: int) -> bool:
+        """Whether this process is the first to prewarm ``generation``."""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd = os.open(os.path.join(self.directory, f".prewarm-{generation}"), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        except OSError as e:
+            logger.warning("Could not prewarm icons: %s", e)
+            return False
+        os.close(fd)
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith(".prewarm-") and entry.name != f".prewarm-{generation}":
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+        return True
+
+    def prewarm(self, generation: int, urls: Iterable[str]):
+        """Fetch the icons of ``urls`` that aren't cached yet, in the background.
+
+        Only the first worker to call this for ``generation`` does so.
+        """
+        if not self._started or not self._claim(generation):
+            return
+        if self._prewarm is not None and not self._prewarm.done():
+            self._prewarm.cancel()
+        self._prewarm = asyncio.ensure_future(self._run_prewarm(list(dict.fromkeys(urls))))
+
+    async def _run_prewarm(self, urls):
+        semaphore = asyncio.Semaphore(PREWARM_CONCURRENCY)
+        started = time.monotonic()
+
+        async def one(url):
+            async with semaphore:
+                return await self.get(url) is not None
+
+        missing = [url for url in urls if self._find(self._key(url)) is None]
+        results = await asyncio.gather(*(one(url) for url in missing))
+        logger.info(
+            "Prewarmed %d of %d missing icons (%d cached) in %.1fs",
+            sum(results), len(missing), len(urls) - len(missing), time.monotonic() - started,
+        )
+
+
+def convert_icon(data: bytes, content_type: str, url: str) -> Tuple[bytes, str]:
+    """Return the bytes to cache for a downloaded icon and their file suffix.
+
+    With Pillow, raster images are scaled to fit ICON_SIZE and re-encoded;
+    otherwise (and for SVG) the original is kept.
+    """
+    suffix = CONTENT_TYPE_SUFFIXES.get(content_type)
+    if suffix is None:
+        guessed = mimetypes.guess_type(url.split("?")[0])[0]
+        suffix = CONTENT_TYPE_SUFFIXES.get(guessed or "")
+    if Image is None or suffix == ".svg":
+        if suffix is None:
+            raise ValueError(f"unsupported icon type {content_type or 'unknown'}")
+        return data, suffix
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.thumbnail((ICON_SIZE, ICON_SIZE))
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA")
+            out = io.BytesIO()
+            try:
+                image.save(out, "WEBP", quality=80, method=4)
+                return out.getvalue(), ".webp"
+            except (KeyError, OSError):
+                out = io.BytesIO()
+                image.save(out, "PNG", optimize=True)
+                return out.getvalue(), ".png"
+    except Exception as e:  # Pillow raises many types for bad input
+        raise ValueError(f"unreadable image: {e}")
+
+
+icon_cache = IconCache()
@@ -0,0 +1,705 @@
+"""Streaming EPG import pipeline shared by URL refreshes and uploads.
+
+Raw feed bytes arrive as an async iterator of chunks (an HTTP download or an
+uploaded file). Each chunk is decompressed if the feed is gzipped, fed to an
+incremental parser, and the completed programmes are batch-inserted into a
+temporary staging table, so memory stays bounded by the chunk and batch
+sizes. Once the feed is complete the stored data is replaced in the same
+write transaction: programmes are read back one channel at a time in start
+order, consecutive identical fragments are merged, and the result is
+inserted into ``programs``. Programmes outside the retention window
+(``epg_web.services.retention``) are dropped before insertion. Readers keep
+seeing the previous data until the commit, after which the freed pages are
+returned with an incremental vacuum.
+
+EPG_IMPORT_COUNTRIES / EPG_IMPORT_EXCLUDE_COUNTRIES (2-letter name prefixes)
+and EPG_IMPORT_CHANNELS / EPG_IMPORT_EXCLUDE_CHANNELS (channel id glob
+patterns), comma-separated, restrict what is imported. The parser applies
+them (``FeedFilter``), skipping unwanted programmes before their fields are
+read; channels that are filtered out are removed from the database.
+
+Simulcasts whose merged schedules are identical (same ``schedule_digest``)
+store it once: the first such channel in source id order keeps the
+programme rows and the others point to it with ``channels.schedule_id``.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Index,
+    MetaData,
+    String,
+    Table,
+    Text,
+    bindparam,
+    delete,
+    func,
+    insert,
+    select,
+    text,
+    type_coerce,
+    update,
+)
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.schema import CreateIndex, CreateTable, DropTable
+
+from epg_web.epg.parser import ChannelRecord, FeedFilter, FeedStreamParser, ProgramRecord
+from epg_web.models.db import PROGRAMS_FTS_TABLE, ImportGeneration
+from epg_web.services.changes import ChangeLog, record_changes
+from epg_web.services.metrics import ImportMetrics
+from epg_web.services.retention import RetentionWindow, epoch_day, prune_programs, retention_window
+from epg_web.services.schedule import channels_table, programs_table
+
+logger = logging.getLogger(__name__)
+
+# Bytes read from a download or upload at a time
+CHUNK_SIZE = 1 << 20
+# Rows per executemany into the staging and programs tables
+BATCH_SIZE = 5000
+# Channel and programme ids stay below 2**53 so JavaScript clients read them exactly
+MAX_ID = (1 << 53) - 1
+# Comma-separated channel filters (empty: no restriction), see FeedFilter
+IMPORT_COUNTRIES = os.environ.get("EPG_IMPORT_COUNTRIES", "")
+IMPORT_EXCLUDE_COUNTRIES = os.environ.get("EPG_IMPORT_EXCLUDE_COUNTRIES", "")
+IMPORT_CHANNELS = os.environ.get("EPG_IMPORT_CHANNELS", "")
+IMPORT_EXCLUDE_CHANNELS = os.environ.get("EPG_IMPORT_EXCLUDE_CHANNELS", "")
+
+
+def import_filter() -> Optional[FeedFilter]:
+    """A filter for one import from the configured lists, or None to import everything."""
+    feed_filter = FeedFilter(
+        IMPORT_COUNTRIES.split(","),
+        IMPORT_EXCLUDE_COUNTRIES.split(","),
+        IMPORT_CHANNELS.split(","),
+        IMPORT_EXCLUDE_CHANNELS.split(","),
+    )
+    return feed_filter if feed_filter.active else None
+
+
+staging_metadata = MetaData()
+staging_programs = Table(
+    "import_programs",
+    staging_metadata,
+    Column("channel_id", String),
+    Column("start_time", DateTime),
+    Column("end_time", DateTime),
+    Column("title", String),
+    Column("description", Text),
+    Column("category", String),
+    schema="temp",
+)
+staging_index = Index(
+    "ix_import_programs_channel_start", staging_programs.c.channel_id, staging_programs.c.start_time
+)
+
+
+class StagedProgram:
+    """Mutable programme row read back from staging for merging."""
+
+    __slots__ = ("title", "description", "start_time", "end_time", "category")
+
+    def __init__(self, start_time, end_time, title, description, category):
+        self.start_time = start_time
+        self.end_time = end_time
+        self.title = title
+        self.description = description
+        self.category = category
+
+
+def merge_consecutive_programs(program_list: list) -> Tuple[list, int]:
+    """Sort one channel's programs and merge consecutive identical fragments.
+
+    Args:
+        program_list: Program items of a single channel (sorted in place)
+
+    Returns:
+        tuple: (merged programs, number of fragments merged away)
+    """
+    # Sort by start_time
+    program_list.sort(key=lambda p: p.start_time)
+
+    merged_count = 0
+    merged_programs = []
+    for prog in program_list:
+        # Check if we can merge with the last merged program
+        if merged_programs:
+            last = merged_programs[-1]
+            # Merge if: same title, same description (or both None/empty), same category,
+            # and time ranges are connected (overlap or touch)
+            desc_match = (last.description or "").strip() == (prog.description or "").strip()
+            cat_match = (last.category or "").strip() == (prog.category or "").strip()
+            title_match = last.title.strip() == prog.title.strip()
+            # Consider connected if the next starts at or before the last ends
+            connected = prog.start_time <= last.end_time
+
+            if title_match and desc_match and cat_match and connected:
+                # Extend the last program's end time to cover the union
+                if prog.end_time > last.end_time:
+                    last.end_time = prog.end_time
+                merged_count += 1
+                continue
+
+        # No merge: add as new
+        merged_programs.append(prog)
+
+    return merged_programs, merged_count
+
+
+def stable_id(*parts: str) -> int:
+    """Deterministic positive id from text parts, below 2**53 (safe as a JS number)."""
+    digest = hashlib.blake2b("\x1f".join(parts).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") & MAX_ID or 1
+
+
+def stored_time(value: datetime) -> str:
+    """``value`` in the text form SQLite ``DateTime`` columns are stored in."""
+    return value.isoformat(" ", "microseconds")
+
+
+def schedule_digest(programs: List[StagedProgram]) -> bytes:
+    """Digest of a channel's merged schedule; equal for identical schedules."""
+    digest = hashlib.blake2b(digest_size=16)
+    for prog in programs:
+        digest.update("\x1f".join((
+            stored_time(prog.start_time), stored_time(prog.end_time),
+            prog.title, prog.description or "", prog.category or "",
+        )).encode("utf-8"))
+        digest.update(b"\x1e")
+    return digest.digest()
+
+
+def program_key(channel_key: str, start_time: datetime, occurrence: int) -> Tuple[str, ...]:
+    """Id parts of the ``occurrence``-th programme starting at ``start_time`` on a channel."""
+    return ("program", channel_key, start_time.isoformat(), str(occurrence))
+
+
+class ImportWriter:
+    """Stages parsed records and applies them to the stored data as a new generation.
+
+    Rows keep their ids across imports: channels are identified by their
+    source ``channel_id`` and programmes by channel and start time (see
+    ``stable_id``). Each channel's merged schedule is compared with what is
+    stored and only new, changed and removed programmes are written.
+    Programmes that ended before the first programme of the feed are kept
+    (until they leave the retention window); a channel listed without any
+    programmes loses all of its stored ones. A channel whose schedule is
+    identical to one already applied in this import stores no programmes of
+    its own and points to that channel instead (``schedule_id``).
+    """
+
+    def __init__(self, session: AsyncSession, source: str, metrics: ImportMetrics):
+        self.session = session
+        self.source = source
+        self.metrics = metrics
+        self.channels: List[ChannelRecord] = []
+        self._pending: List[dict] = []
+        self.staged = 0
+        # Program writes not yet executed
+        self._inserts: List[dict] = []
+        self._updates: List[dict] = []
+        self._deletes: List[int] = []
+        self._insert_ids: Set[int] = set()
+        self.changes = {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+        self.log = ChangeLog()
+        # Database id -> stored schedule_id of the channels kept by this import
+        self._schedule_ids: Dict[int, Optional[int]] = {}
+
+    async def start(self):
+        await self.session.execute(DropTable(staging_programs, if_exists=True))
+        await self.session.execute(CreateTable(staging_programs))
+
+    async def add(self, channels: List[ChannelRecord], programs: List[ProgramRecord]):
+        self.channels.extend(channels)
+        self._pending.extend(p._asdict() for p in programs)
+        if len(self._pending) >= BATCH_SIZE:
+            await self._flush()
+
+    async def _flush(self):
+        if not self._pending:
+            return
+        with self.metrics.stage("stage"):
+            await self.session.execute(insert(staging_programs), self._pending)
+        self.staged += len(self._pending)
+        self._pending = []
+
+    async def _sync_channels(self) -> Tuple[Dict[str, int], int]:
+        """Insert, update and delete channels to match the feed.
+
+        Returns:
+            tuple: (source channel id -> database id, channels removed)
+        """
+        session = self.session
+        c = channels_table.c
+        stored = {row.channel_id: row for row in await session.execute(
+            select(c.id, c.channel_id, c.name, c.icon_url, c.schedule_id)
+        )}
+        taken = {row.id for row in stored.values()}
+
+        # Duplicate channel ids: the last record wins
+        records = {record.channel_id: record for record in self.channels}
+        db_channels: Dict[str, int] = {}
+        inserts = []
+        updates = []
+        for channel_key, record in records.items():
+            row = stored.get(channel_key)
+            if row is not None:
+                db_channels[channel_key] = row.id
+                self._schedule_ids[row.id] = row.schedule_id
+                if (row.name, row.icon_url) != (record.name, record.icon_url):
+                    updates.append({"b_id": row.id, "name": record.name, "icon_url": record.icon_url})
+                continue
+            salt = 0
+            channel_id = stable_id("channel", channel_key)
+            while channel_id in taken:
+                salt += 1
+                channel_id = stable_id("channel", channel_key, str(salt))
+            taken.add(channel_id)
+            db_channels[channel_key] = channel_id
+            self._schedule_ids[channel_id] = channel_id
+            inserts.append({
+                "id": channel_id, "name": record.name, "channel_id": channel_key, "icon_url": record.icon_url,
+                "schedule_id": channel_id,
+            })
+
+        removed = [row.id for key, row in stored.items() if key not in records]
+        await self._delete_channel_programs(removed)
+        for start in range(0, len(removed), BATCH_SIZE):
+            await session.execute(delete(channels_table).where(c.id.in_(removed[start:start + BATCH_SIZE])))
+        for channel_id in removed:
+            self.log.channel(channel_id)
+        for row in updates:
+            self.log.channel(row["b_id"])
+        for row in inserts:
+            self.log.channel(row["id"])
+        if updates:
+            await session.execute(
+                update(channels_table).where(c.id == bindparam("b_id")).values(
+                    name=bindparam("name"), icon_url=bindparam("icon_url")
+                ),
+                updates,
+            )
+        if inserts:
+            await session.execute(insert(channels_table), inserts)
+        return db_channels, len(removed)
+
+    async def _delete_channel_programs(self, channel_ids: List[int]):
+        """Delete the stored programmes of these channels."""
+        for start in range(0, len(channel_ids), BATCH_SIZE):
+            result = await self.session.execute(
+                delete(programs_table)
+                .where(programs_table.c.channel_id.in_(channel_ids[start:start + BATCH_SIZE]))
+                .returning(programs_table.c.id, programs_table.c.channel_id)
+            )
+            deleted = [tuple(row) for row in result]
+            self.changes["deleted"] += len(deleted)
+            self.log.programs_of(deleted)
+
+    async def _update_schedule_ids(self, shared: Dict[int, int], changed_owners: Set[int]):
+        """Point channels to the channel storing their schedule.
+
+        ``shared`` maps channels sharing a schedule to its owner; all other
+        channels store their own. Channels whose shared schedule changed are
+        logged as changed, as their programme rows are logged under the owner.
+        """
+        c = channels_table.c
+        updates = []
+        for channel_id, current in self._schedule_ids.items():
+            schedule_id = shared.get(channel_id, channel_id)
+            if current != schedule_id:
+                updates.append({"b_id": channel_id, "schedule_id": schedule_id})
+                self.log.channel(channel_id)
+            elif schedule_id in changed_owners and schedule_id != channel_id:
+                self.log.channel(channel_id)
+        if updates:
+            await self.session.execute(
+                update(channels_table).where(c.id == bindparam("b_id")).values(schedule_id=bindparam("schedule_id")),
+                updates,
+            )
+
+    async def _free_ids(self, candidates: List[int]) -> Set[int]:
+        """The ids in ``candidates`` not used by a stored or pending programme."""
+        free = {i for i in candidates if i not in self._insert_ids}
+        # One JSON array parameter instead of an IN list of bind parameters
+        rows = await self.session.execute(
+            text(f"SELECT id FROM {programs_table.name} WHERE id IN (SELECT value FROM json_each(:ids))"),
+            {"ids": json.dumps(list(free))},
+        )
+        free.difference_update(row[0] for row in rows)
+        return free
+
+    async def _sync_programs(
+        self, channel_key: str, channel_id: int, programs: List[StagedProgram], window: RetentionWindow
+    ) -> Tuple[int, int]:
+        """Queue the writes turning a channel's stored schedule into ``programs``.
+
+        Returns:
+            tuple: (programmes of the feed stored, programmes outside the window)
+        """
+        p = programs_table.c
+        # Times are compared as stored text, skipping the DateTime processor
+        rows = await self.session.execute(
+            select(
+                p.id,
+                type_coerce(p.start_time, String),
+                type_coerce(p.end_time, String),
+                p.title,
+                p.description,
+                p.category,
+            ).where(p.channel_id == channel_id)
+        )
+        first_start = stored_time(programs[0].start_time) if programs else None
+        stored = {}
+        used = set()
+        for row in rows:
+            if first_start is None or row[2] <= first_start:
+                used.add(row[0])  # history before the feed
+            else:
+                stored[row[0]] = tuple(row[1:])
+
+        kept = []
+        expired = 0
+        changed = []
+        occurrences: Dict[datetime, int] = {}
+        for prog in programs:
+            occurrence = occurrences[prog.start_time] = occurrences.get(prog.start_time, -1) + 1
+            if not window.keeps(prog.start_time, prog.end_time):
+                expired += 1
+                continue
+            key = program_key(channel_key, prog.start_time, occurrence)
+            kept.append((key, stable_id(*key), prog))
+
+        # Ids taken by another channel's programme get salted until free;
+        # a salted id is found again among the stored ids on the next import
+        new_ids = [program_id for _, program_id, _ in kept if program_id not in stored]
+        free = await self._free_ids(new_ids) if new_ids else set()
+        for key, program_id, prog in kept:
+            salt = 0
+            while program_id in used or (program_id not in stored and program_id not in free):
+                salt += 1
+                program_id = stable_id(*key, str(salt))
+                if program_id not in stored and program_id not in used:
+                    free |= await self._free_ids([program_id])
+            used.add(program_id)
+
+            values = (
+                stored_time(prog.start_time), stored_time(prog.end_time),
+                prog.title, prog.description, prog.category,
+            )
+            current = stored.pop(program_id, None)
+            if current == values:
+                self.changes["unchanged"] += 1
+                continue
+            row = {
+                "title": prog.title,
+                "description": prog.description,
+                "start_time": prog.start_time,
+                "end_time": prog.end_time,
+                "category": prog.category,
+                "day": epoch_day(prog.start_time),
+            }
+            changed.append((program_id, channel_id))
+            if current is None:
+                self._inserts.append({"id": program_id, "channel_id": channel_id, **row})
+                self._insert_ids.add(program_id)
+                self.changes["inserted"] += 1
+            else:
+                self._updates.append({"b_id": program_id, **row})
+                self.changes["updated"] += 1
+        self._deletes.extend(stored)
+        self.changes["deleted"] += len(stored)
+        changed.extend((program_id, channel_id) for program_id in stored)
+        self.log.programs_of(changed)
+        return len(kept), expired
+
+    async def _write_programs(self):
+        session = self.session
+        p = programs_table.c
+        with self.metrics.stage("write_programs"):
+            for start in range(0, len(self._deletes), BATCH_SIZE):
+                await session.execute(delete(programs_table).where(p.id.in_(self._deletes[start:start + BATCH_SIZE])))
+            if self._updates:
+                await session.execute(
+                    update(programs_table).where(p.id == bindparam("b_id")).values(
+                        title=bindparam("title"),
+                        description=bindparam("description"),
+                        start_time=bindparam("start_time"),
+                        end_time=bindparam("end_time"),
+                        category=bindparam("category"),
+                        day=bindparam("day"),
+                    ),
+                    self._updates,
+                )
+            if self._inserts:
+                # In key order, so each batch fills the table's B-tree sequentially
+                self._inserts.sort(key=lambda row: row["id"])
+                await session.execute(insert(programs_table), self._inserts)
+        self._inserts, self._updates, self._deletes = [], [], []
+        self._insert_ids.clear()
+
+    async def finish(self) -> dict:
+        """Apply the staged data to the stored channels and programs and commit."""
+        from epg_web.services.storage import incremental_vacuum
+
+        session = self.session
+        metrics = self.metrics
+        window = retention_window()
+        await self._flush()
+        with metrics.stage("stage"):
+            await session.execute(CreateIndex(staging_index))
+
+        # Expire stored programmes that fell out of the window
+        with metrics.stage("prune"):
+            pruned = await prune_programs(session, window)
+        self.log.programs_of(pruned)
+        expired = len(pruned)
+
+        with metrics.stage("sync_channels"):
+            db_channels, channels_removed = await self._sync_channels()
+
+        staged_counts = await session.execute(
+            select(staging_programs.c.channel_id, func.count()).group_by(staging_programs.c.channel_id)
+        )
+        skipped = 0
+        unmapped = 0
+        channel_keys = []
+        for channel_key, staged in staged_counts:
+            if channel_key in db_channels:
+                channel_keys.append(channel_key)
+            else:
+                skipped += staged
+                unmapped += 1
+        channel_keys.sort()
+        # Channels of the feed without any programmes left
+        staged_keys = set(channel_keys)
+        emptied = sorted(db_id for key, db_id in db_channels.items() if key not in staged_keys)
+
+        # Merge consecutive identical programs per channel and apply the
+        # differences; a schedule seen before is shared instead of stored
+        mapped = 0
+        merged_count = 0
+        schedules: Dict[bytes, int] = {}
+        shared: Dict[int, int] = {}
+        shared_programs = 0
+        changed_owners: Set[int] = set()
+        by_channel = (
+            select(
+                staging_programs.c.start_time,
+                staging_programs.c.end_time,
+                staging_programs.c.title,
+                staging_programs.c.description,
+                staging_programs.c.category,
+            )
+            .where(staging_programs.c.channel_id == bindparam("channel_key"))
+            .order_by(staging_programs.c.start_time, text("rowid"))
+        )
+        for channel_key in channel_keys:
+            with metrics.stage("merge"):
+                rows = await session.execute(by_channel, {"channel_key": channel_key})
+                merged_programs, merged = merge_consecutive_programs(
+                    [StagedProgram(*row) for row in rows]
+                )
+                digest = schedule_digest(merged_programs)
+            merged_count += merged
+            db_id = db_channels[channel_key]
+            owner = schedules.setdefault(digest, db_id)
+            if owner != db_id:
+                shared[db_id] = owner
+                shared_programs += len(merged_programs)
+                continue
+            writes = self.changes["inserted"] + self.changes["updated"] + self.changes["deleted"]
+            with metrics.stage("diff"):
+                stored, outside = await self._sync_programs(channel_key, db_id, merged_programs, window)
+            if self.changes["inserted"] + self.changes["updated"] + self.changes["deleted"] != writes:
+                changed_owners.add(db_id)
+            mapped += stored
+            expired += outside
+            if len(self._inserts) + len(self._updates) + len(self._deletes) >= BATCH_SIZE:
+                await self._write_programs()
+        await self._write_programs()
+        with metrics.stage("write_programs"):
+            # Channels now sharing a schedule, or listed without programmes,
+            # drop the programmes they stored
+            await self._delete_channel_programs(
+                [channel_id for channel_id in shared if self._schedule_ids[channel_id] in (channel_id, None)]
+                + emptied
+            )
+            await self._update_schedule_ids(shared, changed_owners)
+
+        # Repopulate the full-text index if any program row changed
+        changed = len(pruned) + self.changes["inserted"] + self.changes["updated"] + self.changes["deleted"]
+        if changed:
+            with metrics.stage("fts_rebuild"):
+                await session.execute(
+                    text(f"INSERT INTO {PROGRAMS_FTS_TABLE}({PROGRAMS_FTS_TABLE}) VALUES('rebuild')")
+                )
+
+        # Record the new data generation in the same transaction
+        generation = ImportGeneration(
+            created_at=datetime.now(timezone.utc).replace(tzinfo=None),
+            source=str(self.source)[:255],
+            channels=len(db_channels),
+            programs=(await session.execute(select(func.count()).select_from(programs_table))).scalar(),
+        )
+        session.add(generation)
+        await session.flush()
+        with metrics.stage("changes"):
+            generation.changes = await record_changes(session, generation.id, self.log)
+
+        try:
+            with metrics.stage("commit"):
+                await session.commit()
+            logger.info(
+                "Merged %d consecutive identical programs; %d new, %d changed, %d removed, %d unchanged.",
+                merged_count, self.changes["inserted"], self.changes["updated"],
+                self.changes["deleted"], self.changes["unchanged"],
+            )
+        except Exception as e:
+            logger.error("Final commit failed: %s", e)
+            raise
+        await session.execute(DropTable(staging_programs, if_exists=True))
+        with metrics.stage("vacuum"):
+            vacuumed = await incremental_vacuum(session)
+
+        metrics.count("channels_stored", len(db_channels))
+        metrics.count("channels_removed", channels_removed)
+        metrics.count("programs_staged", self.staged)
+        metrics.count("programs_stored", mapped)
+        for change, count in self.changes.items():
+            metrics.count(f"programs_{change}", count)
+        metrics.count("programs_merged", merged_count)
+        metrics.count("channels_shared", len(shared))
+        metrics.count("programs_shared", shared_programs)
+        metrics.count("programs_skipped", skipped)
+        metrics.count("programs_expired", expired)
+        metrics.count("pages_vacuumed", vacuumed)
+        metrics.generation = generation.id
+
+        return {
+            "channels": len(db_channels),
+            "programs": mapped,
+            **self.changes,
+            "merged": merged_count,
+            "shared": shared_programs,
+            "skipped": skipped,
+            "expired": expired,
+            "unmapped_channels": unmapped,
+            "generation": generation.id,
+        }
+
+
+async def iter_bytes(content: bytes, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Yield an in-memory document in chunks."""
+    view = memoryview(content)
+    for start in range(0, len(view), chunk_size):
+        yield bytes(view[start:start + chunk_size])
+
+
+async def iter_file(path: str, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Yield a file's contents in chunks, read in a thread off the event loop."""
+    with open(path, "rb") as f:
+        while True:
+            chunk = await asyncio.to_thread(f.read, chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+async def import_epg_stream(
+    chunks: AsyncIterator[bytes],
+    source: str,
+    metrics: Optional[ImportMetrics] = None,
+    filename: Optional[str] = None,
+    content_type: Optional[str] = None,
+) -> dict:
+    """Import a feed (XMLTV or JSON, optionally gzipped) from a stream of byte chunks.
+
+    Args:
+        chunks: Raw feed bytes in chunks of any size. If the iterator has a
+            ``content_type`` attribute once it yielded (e.g. a download), it
+            is used as a format hint.
+        source: Where the content came from (URL or filename), recorded with
+            the import generation
+        metrics: Metrics of this import; a new one is started if omitted
+        filename: Name hinting at the format; defaults to the path of ``source``
+        content_type: MIME type hinting at the format
+
+    Returns:
+        dict: Summary of the update operation
+    """
+    from epg_web.services.archive import open_archive
+    from epg_web.services.events import broadcaster
+    from epg_web.services.snapshot import write_snapshot
+    from epg_web.services.storage import get_write_session
+
+    if metrics is None:
+        metrics = ImportMetrics(source)
+    iterator = chunks.__aiter__()
+    archive = None
+    try:
+        async with get_write_session() as session:
+            writer = ImportWriter(session, source, metrics)
+            await writer.start()
+            # XMLTV feeds are kept with an index of each channel's elements
+            archive = open_archive()
+            parser = FeedStreamParser(
+                filename or urlsplit(str(source)).path, content_type, archive, import_filter()
+            )
+            while True:
+                with metrics.stage("download"):
+                    try:
+                        chunk = await iterator.__anext__()
+                    except StopAsyncIteration:
+                        break
+                if parser.content_type is None:
+                    parser.content_type = getattr(iterator, "content_type", None)
+                metrics.count("download_bytes", len(chunk))
+                with metrics.stage("parse"):
+                    parser.feed(chunk)
+                    channels, programs = parser.take()
+                metrics.count("programs_parsed", len(programs))
+                await writer.add(channels, programs)
+            with metrics.stage("parse"):
+                parser.close()
+                channels, programs = parser.take()
+            logger.info("Parsed %s feed%s from %s", parser.format, " (gzip)" if parser.compressed else "", source)
+            metrics.count("programs_parsed", len(programs))
+            metrics.count("programs_invalid", parser.invalid)
+            metrics.count("programs_filtered", parser.filtered)
+            metrics.count("channels_filtered", parser.filtered_channels)
+            await writer.add(channels, programs)
+            result = await writer.finish()
+            result["filtered"] = parser.filtered
+            result["filtered_channels"] = parser.filtered_channels
+
+        if archive is not None:
+            with metrics.stage("archive"):
+                archive.commit(result["generation"], str(source))
+
+        # Publish the new data to every worker's mapped snapshot
+        try:
+            with metrics.stage("snapshot"):
+                await write_snapshot()
+            broadcaster.wake()
+        except Exception as e:
+            logger.error("Could not write schedule snapshot: %s", e)
+    except Exception as e:
+        if archive is not None:
+            archive.discard()
+        metrics.finish(e)
+        raise
+    finally:
+        # Release the download/file if the import stopped early
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+    metrics.finish()
+    return result
@@ -0,0 +1,130 @@
+"""Background import jobs.
+
+Jobs run as asyncio tasks in the worker that accepted them and are tracked
+in memory; the most recent JOB_HISTORY jobs can be looked up by id.
+"""
+import asyncio
+import logging
+import os
+import tempfile
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import AsyncIterator, Callable, Optional
+
+from fastapi import UploadFile
+
+logger = logging.getLogger(__name__)
+
+JOB_HISTORY = 50
+# Uploads are copied here (default: the system temp dir) until imported
+UPLOAD_DIR = os.environ.get("EPG_UPLOAD_DIR") or None
+
+
+class ImportJob:
+    """State of one background import."""
+
+    def __init__(self, source: str):
+        self.id = uuid.uuid4().hex
+        self.source = source
+        self.status = "queued"
+        self.created_at = datetime.now(timezone.utc)
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def to_dict(self) -> dict:
+        def iso(dt):
+            return dt.isoformat().replace("+00:00", "Z") if dt else None
+
+        return {
+            "id": self.id,
+            "source": self.source,
+            "status": self.status,
+            "created_at": iso(self.created_at),
+            "started_at": iso(self.started_at),
+            "finished_at": iso(self.finished_at),
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+_jobs: "OrderedDict[str, ImportJob]" = OrderedDict()
+
+
+def get_job(job_id: str) -> Optional[ImportJob]:
+    return _jobs.get(job_id)
+
+
+def start_import_job(
+    source: str,
+    chunks: AsyncIterator[bytes],
+    cleanup: Optional[Callable[[], None]] = None,
+    content_type: Optional[str] = None,
+) -> ImportJob:
+    """Run ``import_epg_stream`` over ``chunks`` in the background.
+
+    ``cleanup`` is called when the job ends, successful or not (e.g. to
+    delete a spooled upload). ``content_type`` is passed on as a format hint.
+    """
+    from epg_web.services.importer import import_epg_stream
+
+    job = ImportJob(source)
+    _jobs[job.id] = job
+    while len(_jobs) > JOB_HISTORY:
+        _jobs.popitem(last=False)
+
+    async def run():
+        job.status = "running"
+        job.started_at = datetime.now(timezone.utc)
+        try:
+            job.result = await import_epg_stream(chunks, source, content_type=content_type)
+            job.status = "succeeded"
+        except ValueError as e:
+            logger.warning("Import job %s (%s) failed: %s", job.id, source, e)
+            job.status = "failed"
+            job.error = str(e)
+        except Exception as e:
+            logger.exception("Import job %s (%s) failed", job.id, source)
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = datetime.now(timezone.utc)
+            if cleanup is not None:
+                cleanup()
+
+    job.task = asyncio.create_task(run())
+    return job
+
+
+def remove_file(path: str) -> Callable[[], None]:
+    """Cleanup callback deleting ``path``."""
+    def cleanup():
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    return cleanup
+
+
+async def spool_upload(upload: UploadFile, chunk_size: int) -> str:
+    """Copy an upload to a temporary file in chunks; return its path.
+
+    The request's own upload file is closed when the request ends, so the
+    background job reads this copy instead. Writes run in a thread so a slow
+    disk doesn't block the event loop.
+    """
+    fd, path = tempfile.mkstemp(prefix="epg-upload-", dir=UPLOAD_DIR)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                chunk = await upload.read(chunk_size)
+                if not chunk:
+                    break
+                await asyncio.to_thread(f.write, chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
@@ -0,0 +1,258 @@
+"""In-process metrics: import stage timings and API request latencies.
+
+Metrics live in the worker process that recorded them. With several uvicorn
+workers, each one reports the requests it served and the imports it ran.
+``render_prometheus`` formats everything in the Prometheus text exposition
+format for ``/api/metrics``.
+"""
+import logging
+import os
+import resource
+import sys
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from itertools import count
+from typing import Deque, Dict, List, Optional, Tuple
+
+from starlette.routing import Mount
+
+logger = logging.getLogger(__name__)
+
+IMPORT_HISTORY = int(os.environ.get("EPG_METRICS_IMPORT_HISTORY", "20"))
+
+# Request latency buckets in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_import_ids = count(1)
+
+
+def peak_rss_bytes() -> int:
+    """Peak resident set size of this process so far."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class ImportMetrics:
+    """Timings and counters of one import, filled in as its stages run."""
+
+    def __init__(self, source: str):
+        self.id = next(_import_ids)
+        self.source = source
+        self.started_at = datetime.now(timezone.utc)
+        self.status = "running"
+        self.error: Optional[str] = None
+        self.generation: Optional[int] = None
+        self.stages: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        self.peak_rss_bytes = 0
+        self._started = time.perf_counter()
+        self.seconds = 0.0
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a stage; repeated stages of the same name add up."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - started
+
+    def count(self, name: str, value: int):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def rate(self, counter: str, stage: str) -> Optional[float]:
+        """Items of ``counter`` per second of ``stage``."""
+        seconds = self.stages.get(stage)
+        if not seconds or counter not in self.counters:
+            return None
+        return self.counters[counter] / seconds
+
+    def finish(self, error: Optional[BaseException] = None):
+        """Mark the import done (or failed) and add it to the history."""
+        self.seconds = time.perf_counter() - self._started
+        self.peak_rss_bytes = peak_rss_bytes()
+        self.status = "failed" if error is not None else "ok"
+        self.error = str(error) if error is not None else None
+        record_import(self)
+        logger.info(
+            "Import %s from %s %s in %.2fs: stages=%s counters=%s",
+            self.id, self.source, self.status, self.seconds,
+            {k: round(v, 3) for k, v in self.stages.items()}, self.counters,
+        )
+
+
+# Rates derived from the counters, exported per import
+IMPORT_RATES = (
+    ("download_bytes", "download"),
+    ("programs_parsed", "parse"),
+    ("programs_stored", "diff"),
+)
+
+_imports: Deque[ImportMetrics] = deque(maxlen=IMPORT_HISTORY)
+_import_totals: Dict[str, int] = {}
+
+
+def record_import(metrics: ImportMetrics):
+    _imports.append(metrics)
+    _import_totals[metrics.status] = _import_totals.get(metrics.status, 0) + 1
+
+
+def recent_imports() -> List[ImportMetrics]:
+    """The last IMPORT_HISTORY finished imports, oldest first."""
+    return list(_imports)
+
+
+class LatencyHistogram:
+    """Cumulative request latency histogram keyed by (method, route, status)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._series: Dict[Tuple[str, str, str], list] = {}
+
+    def observe(self, method: str, route: str, status: int, seconds: float):
+        key = (method, route, str(status))
+        series = self._series.get(key)
+        if series is None:
+            # bucket counts, +Inf count, sum
+            series = self._series[key] = [[0] * len(self.buckets), 0, 0.0]
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                series[0][i] += 1
+        series[1] += 1
+        series[2] += seconds
+
+    def items(self):
+        return sorted(self._series.items())
+
+
+request_latency = LatencyHistogram()
+
+
+class RequestMetricsMiddleware:
+    """ASGI middleware observing each HTTP request in ``request_latency``.
+
+    Requests are labelled with the matched route template (e.g.
+    ``/api/schedule/{channel_id}``) so ids in paths don't create new series.
+    Event streams (``text/event-stream``) stay open for the life of the
+    client, so they are timed only up to the start of the response.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started = time.perf_counter()
+        elapsed = None
+
+        async def send_with_status(message):
+            nonlocal status, elapsed
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                for name, value in message.get("headers", ()):
+                    if name.lower() == b"content-type" and value.startswith(b"text/event-stream"):
+                        elapsed = time.perf_counter() - started
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            if elapsed is None:
+                elapsed = time.perf_counter() - started
+            request_latency.observe(scope["method"], _route_template(scope), status, elapsed)
+
+
+def _route_template(scope) -> str:
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    if template is None:
+        return "other"
+    if isinstance(route, Mount):
+        return template + "/{path}"
+    # Routes of an included router may report their path without its prefix
+    depth = scope["path"].rstrip("/").count("/") - template.rstrip("/").count("/")
+    if depth > 0:
+        template = "/".join(scope["path"].split("/")[:depth + 1]) + template
+    return template
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus() -> str:
+    """Render all metrics in the Prometheus text exposition format (0.0.4)."""
+    lines = []
+
+    def family(name: str, kind: str, help_text: str):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    family("epg_http_request_duration_seconds", "histogram", "API request latency by route template.")
+    for (method, route, status), (bucket_counts, total, total_seconds) in request_latency.items():
+        for bound, value in zip(request_latency.buckets, bucket_counts):
+            labels = _labels(method=method, route=route, status=status, le=_number(bound))
+            lines.append(f"epg_http_request_duration_seconds_bucket{labels} {value}")
+        labels = _labels(method=method, route=route, status=status, le="+Inf")
+        lines.append(f"epg_http_request_duration_seconds_bucket{labels} {total}")
+        labels = _labels(method=method, route=route, status=status)
+        lines.append(f"epg_http_request_duration_seconds_sum{labels} {_number(total_seconds)}")
+        lines.append(f"epg_http_request_duration_seconds_count{labels} {total}")
+
+    family("epg_imports_total", "counter", "Finished imports by status.")
+    for status, value in sorted(_import_totals.items()):
+        lines.append(f"epg_imports_total{_labels(status=status)} {value}")
+
+    imports = recent_imports()
+    family("epg_import_info", "gauge", f"Last {IMPORT_HISTORY} imports; value is the start time (unix seconds).")
+    for m in imports:
+        labels = _labels(import_id=m.id, source=m.source, status=m.status,
+                         generation=m.generation or "")
+        lines.append(f"epg_import_info{labels} {_number(m.started_at.timestamp())}")
+
+    family("epg_import_duration_seconds", "gauge", "Total wall time of recent imports.")
+    for m in imports:
+        lines.append(f"epg_import_duration_seconds{_labels(import_id=m.id)} {_number(m.seconds)}")
+
+    family("epg_import_stage_seconds", "gauge", "Wall time per import stage of recent imports.")
+    for m in imports:
+        for stage, seconds in m.stages.items():
+            lines.append(f"epg_import_stage_seconds{_labels(import_id=m.id, stage=stage)} {_number(seconds)}")
+
+    family("epg_import_items", "gauge", "Counters of recent imports (bytes, channels, programs, ...).")
+    for m in imports:
+        for name, value in m.counters.items():
+            lines.append(f"epg_import_items{_labels(import_id=m.id, item=name)} {value}")
+
+    family("epg_import_rate", "gauge", "Items per second of a stage of recent imports.")
+    for m in imports:
+        for counter, stage in IMPORT_RATES:
+            rate = m.rate(counter, stage)
+            if rate is not None:
+                lines.append(f"epg_import_rate{_labels(import_id=m.id, item=counter, stage=stage)} {_number(rate)}")
+
+    family("epg_import_peak_rss_bytes", "gauge", "Process peak RSS observed at the end of recent imports.")
+    for m in imports:
+        lines.append(f"epg_import_peak_rss_bytes{_labels(import_id=m.id)} {m.peak_rss_bytes}")
+
+    family("epg_process_peak_rss_bytes", "gauge", "Peak RSS of this worker process.")
+    lines.append(f"epg_process_peak_rss_bytes {peak_rss_bytes()}")
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,206 @@
+"""Opt-in cProfile profiles of single requests and imports.
+
+A profile is taken when:
+
+- the request carries ``X-EPG-Profile: <token>`` or ``?profile=<token>`` and
+  the token matches EPG_PROFILE_TOKEN (unset disables per-request opt-in), or
+- EPG_PROFILE_REQUESTS=1 is set, which profiles every request, or
+- code wraps work in ``profile("label")`` (e.g. ``init_db.py --profile``).
+
+Each profile writes ``<label>.prof`` (load with ``pstats`` or snakeviz) and
+``<label>.txt`` to EPG_PROFILE_DIR: the top functions by cumulative and own
+time, plus every SQL statement run during the profile with its count and
+timings, collected from SQLAlchemy cursor events.
+
+cProfile covers the whole event loop thread, so work of other requests that
+interleave with the profiled one is included. Only one profile runs at a
+time; requests arriving while one is running are served unprofiled. Event
+streams (``text/event-stream``) stay open for the life of the client, so
+their profile stops once the response has started.
+"""
+import cProfile
+import io
+import logging
+import os
+import pstats
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs
+
+from sqlalchemy import event
+
+from epg_web.services.storage import read_engine, write_engine
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.environ.get("EPG_PROFILE_DIR", "profiles")
+PROFILE_TOKEN = os.environ.get("EPG_PROFILE_TOKEN")
+PROFILE_ALL_REQUESTS = os.environ.get("EPG_PROFILE_REQUESTS") == "1"
+PROFILE_HEADER = "x-epg-profile"
+PROFILE_QUERY_PARAM = "profile"
+
+TOP_FUNCTIONS = 30
+
+_active: ContextVar[Optional["Profile"]] = ContextVar("epg_profile", default=None)
+_running = False
+
+
+class Profile:
+    """One cProfile run plus the SQL statements executed during it."""
+
+    def __init__(self, label: str, directory: str = PROFILE_DIR):
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S.%fZ")
+        safe_label = re.sub(r"[^A-Za-z0-9_.-]+", "_", label).strip("_")[:80]
+        self.name = f"{stamp}-{safe_label}"
+        self.label = label
+        self.directory = directory
+        self.profiler = cProfile.Profile()
+        # statement -> [count, total seconds, max seconds]
+        self.sql: Dict[str, List[float]] = {}
+        self.seconds = 0.0
+        self.stopped = False
+        self._started = 0.0
+
+    def start(self):
+        self._started = time.perf_counter()
+        self.profiler.enable()
+
+    def stop(self):
+        """Stop profiling and write the profile; later calls do nothing."""
+        global _running
+        if self.stopped:
+            return
+        self.stopped = True
+        self.profiler.disable()
+        self.seconds = time.perf_counter() - self._started
+        _running = False
+        try:
+            self.write()
+        except OSError as e:
+            logger.error("Could not write profile %s: %s", self.name, e)
+
+    def record_sql(self, statement: str, seconds: float):
+        stats = self.sql.get(statement)
+        if stats is None:
+            stats = self.sql[statement] = [0, 0.0, 0.0]
+        stats[0] += 1
+        stats[1] += seconds
+        stats[2] = max(stats[2], seconds)
+
+    def summary(self) -> str:
+        out = io.StringIO()
+        out.write(f"Profile {self.label}: {self.seconds * 1000:.1f} ms wall\n\n")
+        stats = pstats.Stats(self.profiler, stream=out)
+        stats.strip_dirs()
+        out.write(f"Top {TOP_FUNCTIONS} functions by cumulative time\n")
+        stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        out.write(f"Top {TOP_FUNCTIONS} functions by own time\n")
+        stats.sort_stats("tottime").print_stats(TOP_FUNCTIONS)
+
+        total = sum(s[1] for s in self.sql.values())
+        count = sum(s[0] for s in self.sql.values())
+        out.write(f"SQL: {count} statements, {total * 1000:.1f} ms\n")
+        out.write(f"{'count':>7} {'total ms':>10} {'max ms':>9}  statement\n")
+        for statement, (n, seconds, longest) in sorted(self.sql.items(), key=lambda kv: -kv[1][1]):
+            one_line = " ".join(statement.split())
+            out.write(f"{n:>7} {seconds * 1000:>10.2f} {longest * 1000:>9.2f}  {one_line}\n")
+        return out.getvalue()
+
+    def write(self):
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, self.name)
+        self.profiler.dump_stats(base + ".prof")
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            f.write(self.summary())
+        logger.info("Wrote profile %s (%.1f ms)", base, self.seconds * 1000)
+
+
+@contextmanager
+def profile(label: str, directory: str = PROFILE_DIR):
+    """Profile the enclosed block; yields the Profile, or None if one is already running."""
+    global _running
+    if _running:
+        logger.warning("Profile %s skipped: another profile is running", label)
+        yield None
+        return
+    _running = True
+    current = Profile(label, directory)
+    token = _active.set(current)
+    current.start()
+    try:
+        yield current
+    finally:
+        _active.reset(token)
+        current.stop()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    current = _active.get()
+    if current is not None and not current.stopped:
+        conn.info.setdefault("epg_profile_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    current = _active.get()
+    if current is None or current.stopped:
+        return
+    started = conn.info.get("epg_profile_started")
+    if started:
+        current.record_sql(statement, time.perf_counter() - started.pop())
+
+
+for _engine in (read_engine, write_engine):
+    event.listen(_engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(_engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _requested(scope) -> bool:
+    if PROFILE_ALL_REQUESTS:
+        return True
+    if not PROFILE_TOKEN:
+        return False
+    for name, value in scope.get("headers", ()):
+        if name == PROFILE_HEADER.encode() and value.decode("latin-1") == PROFILE_TOKEN:
+            return True
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    return PROFILE_TOKEN in query.get(PROFILE_QUERY_PARAM, ())
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling opted-in requests.
+
+    The response gets an ``X-EPG-Profile`` header naming the written profile.
+    Event streams are profiled only up to the start of the response.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or _running or not _requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        with profile(f"{scope['method']} {scope['path']}") as current:
+            if current is None:
+                await self.app(scope, receive, send)
+                return
+
+            async def send_with_header(message):
+                stream = False
+                if message["type"] == "http.response.start":
+                    headers = list(message.get("headers", []))
+                    for name, value in headers:
+                        if name.lower() == b"content-type" and value.startswith(b"text/event-stream"):
+                            stream = True
+                    headers.append((PROFILE_HEADER.encode(), current.name.encode()))
+                    message = dict(message, headers=headers)
+                await send(message)
+                if stream:
+                    current.stop()
+
+            await self.app(scope, receive, send_with_header)
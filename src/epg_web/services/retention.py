@@ -0,0 +1,87 @@
+"""Retention policy for stored programmes.
+
+Imports keep programmes that end less than EPG_RETAIN_PAST_HOURS (default 24)
+ago and start less than EPG_RETAIN_FUTURE_DAYS (default 14) from now. An
+empty value keeps everything in that direction.
+
+Every programme row carries ``day``, the UTC day of its start as days since
+1970-01-01, with an index. Pruning deletes whole days before the cutoff day
+(and after the horizon day) with a range scan over that index; only the
+boundary day needs the exact time checked.
+"""
+import os
+from datetime import datetime, timedelta, timezone
+from typing import List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import and_, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from epg_web.services.schedule import programs_table
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def _env_number(name: str, default: float) -> Optional[float]:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return float(value) if value.strip() else None
+
+
+RETAIN_PAST_HOURS = _env_number("EPG_RETAIN_PAST_HOURS", 24)
+RETAIN_FUTURE_DAYS = _env_number("EPG_RETAIN_FUTURE_DAYS", 14)
+
+
+def epoch_day(dt: datetime) -> int:
+    """UTC day of a naive UTC datetime, as days since 1970-01-01."""
+    return (dt - EPOCH).days
+
+
+class RetentionWindow(NamedTuple):
+    """Programmes ending after ``cutoff`` and starting before ``horizon`` are kept."""
+
+    cutoff: Optional[datetime]
+    horizon: Optional[datetime]
+
+    def keeps(self, start: datetime, end: datetime) -> bool:
+        return (self.cutoff is None or end > self.cutoff) and (
+            self.horizon is None or start < self.horizon
+        )
+
+
+def retention_window(
+    now: Optional[datetime] = None,
+    past_hours: Optional[float] = RETAIN_PAST_HOURS,
+    future_days: Optional[float] = RETAIN_FUTURE_DAYS,
+) -> RetentionWindow:
+    """The window to keep, relative to ``now`` (naive UTC, default the current time)."""
+    if now is None:
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return RetentionWindow(
+        cutoff=now - timedelta(hours=past_hours) if past_hours is not None else None,
+        horizon=now + timedelta(days=future_days) if future_days is not None else None,
+    )
+
+
+async def prune_programs(session: AsyncSession, window: RetentionWindow) -> List[Tuple[int, int]]:
+    """Delete stored programmes outside ``window``; return their (id, channel id).
+
+    The caller rebuilds the full-text index afterwards.
+    """
+    p = programs_table.c
+    removed = []
+    if window.cutoff is not None:
+        result = await session.execute(
+            delete(programs_table)
+            .where(and_(p.day <= epoch_day(window.cutoff), p.end_time <= window.cutoff))
+            .returning(p.id, p.channel_id)
+        )
+        removed.extend(tuple(row) for row in result)
+    if window.horizon is not None:
+        result = await session.execute(
+            delete(programs_table)
+            .where(and_(p.day >= epoch_day(window.horizon), p.start_time >= window.horizon))
+            .returning(p.id, p.channel_id)
+        )
+        removed.extend(tuple(row) for row in result)
+    return removed
@@ -0,0 +1,169 @@
+"""Read-side queries for channel lists and schedules.
+
+These use Core ``select`` of explicit columns on a plain connection, so rows
+come back as tuples without ORM identity-map or instrumentation overhead.
+
+A channel's programmes are the ``programs`` rows of its ``schedule_id``
+(itself, or the channel storing a simulcast's identical schedule); they are
+reported under the requested channel's id.
+"""
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import String, func, select, type_coerce
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from epg_web.models.db import Channel, ImportGeneration, Program
+
+channels_table = Channel.__table__
+programs_table = Program.__table__
+
+CHANNEL_COLUMNS = (
+    channels_table.c.id,
+    channels_table.c.name,
+    channels_table.c.channel_id,
+    channels_table.c.icon_url,
+)
+
+# Times are selected as the raw stored text ("YYYY-MM-DD HH:MM:SS.ffffff")
+# and reformatted by slicing instead of going through datetime objects.
+PROGRAM_COLUMNS = (
+    programs_table.c.id,
+    programs_table.c.title,
+    programs_table.c.description,
+    type_coerce(programs_table.c.start_time, String).label("start_time"),
+    type_coerce(programs_table.c.end_time, String).label("end_time"),
+    programs_table.c.category,
+    programs_table.c.channel_id,
+)
+
+
+async def fetch_generation(conn: AsyncConnection) -> int:
+    """Return the current data generation (0 before the first import)."""
+    result = await conn.execute(select(func.max(ImportGeneration.__table__.c.id)))
+    return result.scalar() or 0
+
+
+def to_utc_iso(dt: Optional[datetime]) -> Optional[str]:
+    """Format a datetime as UTC ISO8601 with a 'Z' suffix.
+
+    Naive datetimes are the storage convention and are treated as UTC.
+    """
+    if dt is None:
+        return None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt.isoformat() + "Z"
+
+
+def to_naive_utc(dt: Optional[datetime]) -> Optional[datetime]:
+    """Normalize a datetime to the naive-UTC storage convention."""
+    if dt is None or dt.tzinfo is None:
+        return dt
+    return dt.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def stored_time_to_iso(value: Optional[str]) -> Optional[str]:
+    """Convert a stored SQLite timestamp string to UTC ISO8601 with 'Z'.
+
+    Produces the same text as ``to_utc_iso`` on the parsed datetime.
+    """
+    if value is None:
+        return None
+    if len(value) == 26 and value[10] == " ":
+        if value.endswith(".000000"):
+            return value[:10] + "T" + value[11:19] + "Z"
+        return value[:10] + "T" + value[11:] + "Z"
+    return to_utc_iso(datetime.fromisoformat(value))
+
+
+def channel_row_to_dict(row) -> dict:
+    """Build the API dict for a channel row selected with CHANNEL_COLUMNS."""
+    return {
+        "id": row[0],
+        "name": row[1],
+        "channel_id": row[2],
+        "icon_url": row[3],
+    }
+
+
+def program_row_to_dict(row) -> dict:
+    """Build the API dict for a program row selected with PROGRAM_COLUMNS."""
+    return {
+        "id": row[0],
+        "title": row[1],
+        "description": row[2],
+        "start_time": stored_time_to_iso(row[3]),
+        "end_time": stored_time_to_iso(row[4]),
+        "category": row[5],
+        "channel_id": row[6],
+    }
+
+
+async def fetch_channel_page(
+    conn: AsyncConnection, country: str, page: int, per_page: int
+) -> dict:
+    """Return one page of a country's channels with their program counts."""
+    offset = (page - 1) * per_page
+    where_clause = channels_table.c.name.startswith(f"{country}|")
+
+    total = (
+        await conn.execute(
+            select(func.count()).select_from(channels_table).where(where_clause)
+        )
+    ).scalar_one()
+
+    program_count = (
+        select(func.count())
+        .where(programs_table.c.channel_id == channels_table.c.schedule_id)
+        .scalar_subquery()
+    )
+    result = await conn.execute(
+        select(*CHANNEL_COLUMNS, program_count.label("program_count"))
+        .where(where_clause)
+        .order_by(channels_table.c.channel_id.collate("NOCASE"))
+        .offset(offset)
+        .limit(per_page)
+    )
+
+    channels = []
+    for row in result:
+        channel = channel_row_to_dict(row)
+        channel["program_count"] = row[4]
+        channels.append(channel)
+
+    return {
+        "total": total,
+        "page": page,
+        "per_page": per_page,
+        "total_pages": (total + per_page - 1) // per_page,
+        "channels": channels,
+    }
+
+
+async def fetch_channel_schedule(conn: AsyncConnection, channel_id: int) -> Optional[dict]:
+    """Return a channel and all of its programs, or None if it doesn't exist."""
+    channel_row = (
+        await conn.execute(
+            select(*CHANNEL_COLUMNS, channels_table.c.schedule_id).where(channels_table.c.id == channel_id)
+        )
+    ).first()
+    if channel_row is None:
+        return None
+
+    result = await conn.execute(
+        select(*PROGRAM_COLUMNS)
+        .where(programs_table.c.channel_id == channel_row[4])
+        .order_by(programs_table.c.start_time)
+    )
+    program_list = []
+    for row in result:
+        program = program_row_to_dict(row)
+        program["channel_id"] = channel_id
+        program_list.append(program)
+
+    return {
+        "total": len(program_list),
+        "programs": program_list,
+        "channel": channel_row_to_dict(channel_row),
+    }
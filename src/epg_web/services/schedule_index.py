@@ -0,0 +1,94 @@
+"""Access to the shared schedule index (the memory-mapped snapshot).
+
+Each worker maps the snapshot file written by the import and re-maps it when
+the file is replaced. The snapshot's generation is compared with the database
+every SNAPSHOT_RECHECK_SECONDS; if the snapshot is missing or stale (e.g. the
+importing process died before writing it) this worker rebuilds it in a
+background task. Requests don't wait for it: without a snapshot they get
+None and use the database, a stale one keeps being served (as between an
+import's commit and its snapshot) until the new file is renamed into place.
+Requests that can only be answered from a snapshot (``wait=True``) wait for
+the rebuild when there is none.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Optional
+
+from epg_web.services.schedule import fetch_generation
+from epg_web.services.snapshot import SNAPSHOT_PATH, Snapshot, write_snapshot
+from epg_web.services.storage import get_connection
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_RECHECK_SECONDS = 30
+
+_snapshot: Optional[Snapshot] = None
+_checked_at = 0.0
+_check_lock = asyncio.Lock()
+_rebuild: Optional[asyncio.Task] = None
+
+
+def _file_id(path: str):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns)
+
+
+def _load(path: str) -> Optional[Snapshot]:
+    """Map the current snapshot file if it changed since we last looked."""
+    global _snapshot
+    file_id = _file_id(path)
+    if file_id is None:
+        _snapshot = None
+    elif _snapshot is None or _snapshot.file_id != file_id:
+        try:
+            _snapshot = Snapshot(path)
+        except (OSError, ValueError) as e:
+            logger.warning("Could not open snapshot %s: %s", path, e)
+            _snapshot = None
+    return _snapshot
+
+
+async def _run_rebuild(path: str, generation: int):
+    global _checked_at
+    logger.info("Rebuilding snapshot for generation %s", generation)
+    try:
+        await write_snapshot(path)
+    except Exception as e:
+        logger.error("Could not rebuild snapshot: %s", e)
+    finally:
+        # A failed rebuild is retried at the next recheck
+        _checked_at = time.monotonic()
+    _load(path)
+
+
+async def get_schedule_index(path: str = SNAPSHOT_PATH, wait: bool = False) -> Optional[Snapshot]:
+    """Return the mapped snapshot, or None if there is none yet.
+
+    Starts a background rebuild if it is missing or older than the database.
+    With ``wait``, a missing snapshot is waited for; None then means the
+    database is empty or the rebuild failed.
+    """
+    global _checked_at, _rebuild
+    snapshot = _load(path)
+    rebuilding = _rebuild is not None and not _rebuild.done()
+    if not rebuilding and (snapshot is None or time.monotonic() - _checked_at >= SNAPSHOT_RECHECK_SECONDS):
+        async with _check_lock:
+            snapshot = _load(path)
+            if _rebuild is None or _rebuild.done():
+                async with get_connection() as conn:
+                    generation = await fetch_generation(conn)
+                if generation and (snapshot is None or snapshot.generation != generation):
+                    _rebuild = asyncio.create_task(_run_rebuild(path, generation))
+                else:
+                    _checked_at = time.monotonic()
+
+    if wait and snapshot is None and _rebuild is not None and not _rebuild.done():
+        # Shielded: a cancelled request must not cancel the shared rebuild
+        await asyncio.shield(_rebuild)
+        snapshot = _load(path)
+    return snapshot
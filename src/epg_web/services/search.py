@@ -0,0 +1,117 @@
+"""Full-text program search backed by the `programs_fts` FTS5 index."""
+import re
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import and_, bindparam, func, literal_column, select, table
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from epg_web.models.db import PROGRAMS_FTS_TABLE
+from epg_web.services.schedule import (
+    PROGRAM_COLUMNS,
+    channels_table,
+    program_row_to_dict,
+    programs_table,
+)
+
+fts_table = table(PROGRAMS_FTS_TABLE)
+
+# Column weights for bm25(): title matches count most, then category
+BM25_WEIGHTS = (10.0, 1.0, 2.0)
+
+# Counting stops here; exact totals for very common words cost a full scan
+MAX_COUNTED_RESULTS = 1000
+
+_TOKEN_RE = re.compile(r"(\w+)(\*?)", re.UNICODE)
+
+
+def build_match_query(text: str) -> Optional[str]:
+    """Turn free text into an FTS5 MATCH expression.
+
+    Every word must match (implicit AND). Words are quoted so FTS5 operators
+    in user input are treated as text. A trailing ``*`` makes a word a prefix
+    query, and the last word is always a prefix so partial input matches.
+    """
+    tokens = _TOKEN_RE.findall(text or "")
+    if not tokens:
+        return None
+    parts = []
+    for i, (word, star) in enumerate(tokens):
+        prefix = star or i == len(tokens) - 1
+        parts.append(f'"{word}"*' if prefix else f'"{word}"')
+    return " ".join(parts)
+
+
+async def search_programs(
+    conn: AsyncConnection,
+    query: str,
+    country: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    page: int = 1,
+    per_page: int = 50,
+) -> dict:
+    """Return ranked, paginated programs matching ``query``.
+
+    ``start``/``end`` keep programs overlapping that window; ``country``
+    restricts to channels with that 2-letter name prefix. ``total`` stops at
+    MAX_COUNTED_RESULTS, with ``total_capped`` set when there are more.
+    """
+    match = build_match_query(query)
+    result = {"query": query, "total": 0, "total_capped": False, "page": page,
+              "per_page": per_page, "total_pages": 0, "programs": []}
+    if match is None:
+        return result
+
+    rowid = literal_column(f"{PROGRAMS_FTS_TABLE}.rowid")
+    conditions = [literal_column(PROGRAMS_FTS_TABLE).op("MATCH")(bindparam("match", match))]
+    if country:
+        conditions.append(channels_table.c.name.startswith(f"{country}|"))
+    if start is not None:
+        conditions.append(programs_table.c.end_time > start)
+    if end is not None:
+        conditions.append(programs_table.c.start_time < end)
+
+    # Every channel showing the programme, including simulcasts sharing its schedule
+    joined = (
+        fts_table
+        .join(programs_table, programs_table.c.id == rowid)
+        .join(channels_table, channels_table.c.schedule_id == programs_table.c.channel_id)
+    )
+    where_clause = and_(*conditions)
+
+    counted = (
+        select(literal_column("1"))
+        .select_from(joined)
+        .where(where_clause)
+        .limit(MAX_COUNTED_RESULTS + 1)
+        .subquery()
+    )
+    total = (await conn.execute(select(func.count()).select_from(counted))).scalar_one()
+    total_capped = total > MAX_COUNTED_RESULTS
+    total = min(total, MAX_COUNTED_RESULTS)
+
+    rank = func.bm25(literal_column(PROGRAMS_FTS_TABLE), *BM25_WEIGHTS)
+    rows = await conn.execute(
+        select(*PROGRAM_COLUMNS, channels_table.c.name, channels_table.c.id)
+        .select_from(joined)
+        .where(where_clause)
+        .order_by(rank, programs_table.c.start_time, channels_table.c.id)
+        .offset((page - 1) * per_page)
+        .limit(per_page)
+    )
+
+    programs = []
+    for row in rows:
+        program = program_row_to_dict(row)
+        program["channel_id"] = row[8]
+        program["channel_name"] = row[7]
+        programs.append(program)
+
+    result.update(
+        total=total,
+        total_capped=total_capped,
+        total_pages=(total + per_page - 1) // per_page,
+        programs=programs,
+    )
+    return result
@@ -0,0 +1,467 @@
+"""Memory-mapped binary snapshot of the schedule data.
+
+After every import the current channels and programs are written to a single
+file that each worker maps read-only. Reads go straight to the mapping, so
+every uvicorn worker shares one copy of the data through the OS page cache
+instead of holding its own in-process cache.
+
+Layout (little endian, sections 8-byte aligned)::
+
+    header          HEADER
+    channel_ids     int64[n_channels]    ascending database ids
+    channel_recs    uint32[n_channels*8] name, channel_id, icon (offset, length),
+                                         first program index, program count
+                                         (channels sharing a schedule share
+                                         the range)
+    countries       COUNTRY[n_countries] code, first member, member count
+    members         uint32[n_members]    channel indexes per country, in
+                                         /api/channels order
+    starts          int64[n_programs]    epoch seconds, sorted per channel
+    ends            int64[n_programs]
+    max_ends        int64[n_programs]    running max of ends within a channel
+    program_ids     int64[n_programs]
+    program_strs    uint32[n_programs*6] title, description, category
+                                         (offset, length)
+    program_usecs   uint32[n_programs*2] microseconds of start and end
+    strings         UTF-8 string table (deduplicated)
+
+A string length of NULL_LENGTH encodes None. Files are written to a temporary
+name and renamed into place, so readers always see a complete snapshot.
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Integer, cast, func, select
+
+from epg_web.epg.parser import country_code
+from epg_web.services.schedule import (
+    CHANNEL_COLUMNS,
+    channels_table,
+    fetch_generation,
+    programs_table,
+)
+from epg_web.services.storage import DATABASE_PATH, get_connection
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_PATH = os.environ.get("EPG_SNAPSHOT_PATH", f"{DATABASE_PATH}.snapshot")
+
+MAGIC = b"EPGSNAP1"
+VERSION = 2
+NULL_LENGTH = 0xFFFFFFFF
+
+SECTIONS = (
+    "channel_ids", "channel_recs", "countries", "members",
+    "starts", "ends", "max_ends", "program_ids", "program_strs", "program_usecs", "strings",
+)
+HEADER = struct.Struct("<8sIIqIIII" + "Q" * len(SECTIONS))
+COUNTRY = struct.Struct("<2s2xII")
+CHANNEL_FIELDS = 8
+PROGRAM_STR_FIELDS = 6
+
+# Grid layouts kept per snapshot, keyed by (country, window, lanes)
+GRID_CACHE_SIZE = int(os.environ.get("EPG_GRID_CACHE_SIZE", "32"))
+# Overlaps up to this many seconds are clipped instead of opening a new lane
+GRID_OVERLAP_TOLERANCE = int(os.environ.get("EPG_GRID_OVERLAP_TOLERANCE", "120"))
+
+
+class _StringTable:
+    """Append-only UTF-8 string table with deduplication."""
+
+    def __init__(self):
+        self.data = bytearray()
+        self._offsets: Dict[str, Tuple[int, int]] = {}
+
+    def add(self, value: Optional[str]) -> Tuple[int, int]:
+        if value is None:
+            return 0, NULL_LENGTH
+        ref = self._offsets.get(value)
+        if ref is None:
+            encoded = value.encode("utf-8")
+            ref = self._offsets[value] = (len(self.data), len(encoded))
+            self.data += encoded
+        return ref
+
+
+def _pad(buf: bytearray):
+    buf += b"\0" * (-len(buf) % 8)
+
+
+async def write_snapshot(path: str = SNAPSHOT_PATH) -> int:
+    """Write a snapshot of the current database contents; return its generation."""
+    strings = _StringTable()
+    channel_ids = array("q")
+    channel_recs = array("I")
+    starts, ends, max_ends, program_ids = array("q"), array("q"), array("q"), array("q")
+    program_strs = array("I")
+    program_usecs = array("I")
+
+    async with get_connection() as conn:
+        generation = await fetch_generation(conn)
+
+        # Countries list channels in /api/channels order (channel_id, NOCASE)
+        result = await conn.execute(
+            select(*CHANNEL_COLUMNS, channels_table.c.schedule_id)
+            .order_by(channels_table.c.channel_id.collate("NOCASE"))
+        )
+        channel_rows = result.all()
+        by_id = sorted(channel_rows, key=lambda row: row[0])
+        position = {row[0]: i for i, row in enumerate(by_id)}
+        country_members: Dict[str, List[int]] = {}
+        for row in channel_rows:
+            code = country_code(row[1])
+            if code:
+                country_members.setdefault(code, []).append(position[row[0]])
+
+        counts = {}
+        epoch_start = cast(func.strftime("%s", programs_table.c.start_time), Integer)
+        epoch_end = cast(func.strftime("%s", programs_table.c.end_time), Integer)
+        # Fraction of "YYYY-MM-DD HH:MM:SS.ffffff" (0 when stored without one)
+        usec_start = cast(func.substr(programs_table.c.start_time, 21, 6), Integer)
+        usec_end = cast(func.substr(programs_table.c.end_time, 21, 6), Integer)
+        result = await conn.stream(
+            select(
+                programs_table.c.channel_id,
+                epoch_start,
+                epoch_end,
+                usec_start,
+                usec_end,
+                programs_table.c.id,
+                programs_table.c.title,
+                programs_table.c.description,
+                programs_table.c.category,
+            ).order_by(programs_table.c.channel_id, programs_table.c.start_time)
+        )
+        current_channel = None
+        running_max = 0
+        async for partition in result.partitions(5000):
+            for channel_id, start, end, start_usec, end_usec, prog_id, title, description, category in partition:
+                if channel_id != current_channel:
+                    current_channel = channel_id
+                    running_max = end
+                    counts[channel_id] = [len(starts), 0]
+                elif end > running_max:
+                    running_max = end
+                counts[channel_id][1] += 1
+                starts.append(start)
+                ends.append(end)
+                max_ends.append(running_max)
+                program_ids.append(prog_id)
+                program_strs.extend(strings.add(title))
+                program_strs.extend(strings.add(description))
+                program_strs.extend(strings.add(category))
+                program_usecs.extend((start_usec, end_usec))
+
+    for row in by_id:
+        channel_ids.append(row[0])
+        channel_recs.extend(strings.add(row[1]))
+        channel_recs.extend(strings.add(row[2]))
+        channel_recs.extend(strings.add(row[3]))
+        first, count = counts.get(row[4] or row[0], (0, 0))
+        channel_recs.extend((first, count))
+
+    countries = bytearray()
+    members = array("I")
+    for code in sorted(country_members):
+        countries += COUNTRY.pack(code.encode("ascii"), len(members), len(country_members[code]))
+        members.extend(country_members[code])
+
+    body = bytearray()
+    offsets = []
+    for section in (channel_ids, channel_recs, countries, members, starts, ends,
+                    max_ends, program_ids, program_strs, program_usecs, strings.data):
+        _pad(body)
+        offsets.append(HEADER.size + len(body))
+        body += section if isinstance(section, bytearray) else section.tobytes()
+
+    header = HEADER.pack(
+        MAGIC, VERSION, 0, generation, len(channel_ids), len(starts),
+        len(country_members), len(members), *offsets,
+    )
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.write(body)
+    os.replace(tmp_path, path)
+    return generation
+
+
+def _epoch_to_iso(value: int, usec: int = 0) -> str:
+    """Same text as ``stored_time_to_iso``: microseconds only if there are any."""
+    if usec:
+        return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(value)) + f".{usec:06d}Z"
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(value))
+
+
+def layout_lanes(
+    starts: Sequence[int],
+    ends: Sequence[int],
+    lo: int,
+    hi: int,
+    window_start: int,
+    window_end: int,
+    tolerance: float = GRID_OVERLAP_TOLERANCE,
+) -> Tuple[int, List[Tuple[int, int, int, int]]]:
+    """Assign the programs ``lo:hi`` of one channel visible in a window to lanes.
+
+    Programs are taken in start order and each goes to the lowest lane that
+    is free by its start (greedy interval-graph coloring, which uses the
+    fewest lanes). A program overlapping a lane's last program by at most
+    ``tolerance`` seconds stays in that lane with its start clipped, so only
+    genuine overlaps open a new lane; an infinite tolerance gives a single
+    clipped lane.
+
+    Returns:
+        tuple: (number of lanes, [(program index, lane, visible start,
+        visible end)]) with visible times clipped to the window and lane
+    """
+    spans = []
+    lane_ends: List[int] = []
+    for i in range(lo, hi):
+        start, end = starts[i], ends[i]
+        if end <= window_start:
+            continue
+        for lane, lane_end in enumerate(lane_ends):
+            if lane_end <= start + tolerance:
+                break
+        else:
+            lane = len(lane_ends)
+            lane_ends.append(window_start)
+        visible_start = max(start, window_start, lane_ends[lane])
+        visible_end = min(end, window_end)
+        if end > lane_ends[lane]:
+            lane_ends[lane] = end
+        if visible_end > visible_start:
+            spans.append((i, lane, visible_start, visible_end))
+    return len(lane_ends), spans
+
+
+class Snapshot:
+    """Read-only view over a mapped snapshot file."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self.file_id = (stat.st_ino, stat.st_mtime_ns)
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, _, self.generation, self.n_channels, self.n_programs,
+         n_countries, _, *offsets) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not an EPG snapshot (version {VERSION}): {path}")
+        sections = dict(zip(SECTIONS, offsets))
+        view = memoryview(self._mm)
+
+        def column(name: str, fmt: str, length: int):
+            start = sections[name]
+            return view[start:start + length * struct.calcsize(fmt)].cast(fmt)
+
+        self.channel_ids = column("channel_ids", "q", self.n_channels)
+        self.channel_recs = column("channel_recs", "I", self.n_channels * CHANNEL_FIELDS)
+        self.starts = column("starts", "q", self.n_programs)
+        self.ends = column("ends", "q", self.n_programs)
+        self.max_ends = column("max_ends", "q", self.n_programs)
+        self.program_ids = column("program_ids", "q", self.n_programs)
+        self.program_strs = column("program_strs", "I", self.n_programs * PROGRAM_STR_FIELDS)
+        self.program_usecs = column("program_usecs", "I", self.n_programs * 2)
+        self._strings = sections["strings"]
+
+        members = column("members", "I", sum(
+            COUNTRY.unpack_from(self._mm, sections["countries"] + i * COUNTRY.size)[2]
+            for i in range(n_countries)
+        ))
+        self.countries: Dict[str, memoryview] = {}
+        for i in range(n_countries):
+            code, first, count = COUNTRY.unpack_from(self._mm, sections["countries"] + i * COUNTRY.size)
+            self.countries[code.decode("ascii")] = members[first:first + count]
+
+        # API dicts for programs touched by now/next lookups, by program
+        # index and channel (shared schedules); immutable per file
+        self._program_dicts: Dict[Tuple[int, int], dict] = {}
+        # Encoded /api/grid responses, most recently used last
+        self._grid_cache: "OrderedDict[tuple, bytes]" = OrderedDict()
+
+    def _str(self, offset: int, length: int) -> Optional[str]:
+        if length == NULL_LENGTH:
+            return None
+        start = self._strings + offset
+        return self._mm[start:start + length].decode("utf-8")
+
+    def _channel_index(self, channel_id: int) -> Optional[int]:
+        i = bisect_left(self.channel_ids, channel_id)
+        if i < self.n_channels and self.channel_ids[i] == channel_id:
+            return i
+        return None
+
+    def _channel(self, idx: int) -> dict:
+        r = self.channel_recs[idx * CHANNEL_FIELDS:(idx + 1) * CHANNEL_FIELDS]
+        return {
+            "id": self.channel_ids[idx],
+            "name": self._str(r[0], r[1]),
+            "channel_id": self._str(r[2], r[3]),
+            "icon_url": self._str(r[4], r[5]),
+        }
+
+    def channel(self, channel_id: int) -> Optional[dict]:
+        """Return a channel's id, name, channel_id and icon_url."""
+        idx = self._channel_index(channel_id)
+        return self._channel(idx) if idx is not None else None
+
+    def icon_urls(self) -> List[str]:
+        """Icon URLs of all channels."""
+        urls = []
+        for idx in range(self.n_channels):
+            r = self.channel_recs[idx * CHANNEL_FIELDS:(idx + 1) * CHANNEL_FIELDS]
+            url = self._str(r[4], r[5])
+            if url:
+                urls.append(url)
+        return urls
+
+    def _program_range(self, idx: int) -> Tuple[int, int]:
+        base = idx * CHANNEL_FIELDS
+        first = self.channel_recs[base + 6]
+        return first, first + self.channel_recs[base + 7]
+
+    def _program(self, i: int, channel_id: int) -> dict:
+        s = self.program_strs[i * PROGRAM_STR_FIELDS:(i + 1) * PROGRAM_STR_FIELDS]
+        return {
+            "id": self.program_ids[i],
+            "title": self._str(s[0], s[1]),
+            "description": self._str(s[2], s[3]),
+            "start_time": _epoch_to_iso(self.starts[i], self.program_usecs[2 * i]),
+            "end_time": _epoch_to_iso(self.ends[i], self.program_usecs[2 * i + 1]),
+            "category": self._str(s[4], s[5]),
+            "channel_id": channel_id,
+        }
+
+    def _cached_program(self, i: Optional[int], channel_id: int) -> Optional[dict]:
+        if i is None:
+            return None
+        cached = self._program_dicts.get((i, channel_id))
+        if cached is None:
+            cached = self._program_dicts[i, channel_id] = self._program(i, channel_id)
+        return cached
+
+    def on_air(self, lo: int, hi: int, at: int) -> Tuple[Optional[int], Optional[int]]:
+        """Return indexes of the program on air at ``at`` and the next to start.
+
+        Searches programs ``lo:hi`` of one channel. With overlapping programs
+        the one that started most recently wins.
+        """
+        i = bisect_right(self.starts, at, lo, hi) - 1
+        current = None
+        j = i
+        while j >= lo and self.max_ends[j] > at:
+            if self.ends[j] > at:
+                current = j
+                break
+            j -= 1
+        nxt = i + 1 if i + 1 < hi else None
+        return current, nxt
+
+    def schedule(self, channel_id: int) -> Optional[dict]:
+        """Return a channel and all of its programs, like ``fetch_channel_schedule``."""
+        idx = self._channel_index(channel_id)
+        if idx is None:
+            return None
+        lo, hi = self._program_range(idx)
+        programs = [self._program(i, channel_id) for i in range(lo, hi)]
+        return {"total": len(programs), "programs": programs, "channel": self._channel(idx)}
+
+    def now_next(self, country: str, at: datetime) -> List[dict]:
+        """Return the current and next program for every channel of ``country``."""
+        if at.tzinfo is None:
+            at = at.replace(tzinfo=timezone.utc)
+        at_epoch = int(at.timestamp())
+        result = []
+        for idx in self.countries.get(country, ()):
+            channel = self._channel(idx)
+            lo, hi = self._program_range(idx)
+            current, nxt = self.on_air(lo, hi, at_epoch)
+            channel["now"] = self._cached_program(current, channel["id"])
+            channel["next"] = self._cached_program(nxt, channel["id"])
+            result.append(channel)
+        return result
+
+    def next_transition(self, country: str, after: int) -> Tuple[Optional[int], List[int]]:
+        """Return the first time after ``after`` (epoch seconds) a program of
+        ``country`` starts or ends, and the ids of the channels it happens on.
+        """
+        at = None
+        channels: List[int] = []
+        for idx in self.countries.get(country, ()):
+            lo, hi = self._program_range(idx)
+            nxt = bisect_right(self.starts, after, lo, hi)
+            candidate = self.starts[nxt] if nxt < hi else None
+            # Programs on air at ``after`` lie between these two
+            for i in range(bisect_right(self.max_ends, after, lo, hi), nxt):
+                end = self.ends[i]
+                if end > after and (candidate is None or end < candidate):
+                    candidate = end
+            if candidate is None or (at is not None and candidate > at):
+                continue
+            if candidate != at:
+                at = candidate
+                channels = []
+            channels.append(self.channel_ids[idx])
+        return at, channels
+
+    def grid(self, country: str, start: int, end: int, lanes: bool = True) -> bytes:
+        """Return the encoded grid layout of ``country`` for a window of epoch seconds.
+
+        Every channel of the country is listed in /api/channels order with
+        its programs visible in the window as spans: lane, offset from the
+        window start and duration in seconds, and the program itself. Without
+        ``lanes`` everything is laid out in one lane, overlaps clipped.
+        Results are cached per snapshot, so they are computed once per
+        import and window.
+        """
+        key = (country, start, end, lanes)
+        cached = self._grid_cache.get(key)
+        if cached is not None:
+            self._grid_cache.move_to_end(key)
+            return cached
+
+        tolerance = GRID_OVERLAP_TOLERANCE if lanes else float("inf")
+        channels = []
+        for idx in self.countries.get(country, ()):
+            channel = self._channel(idx)
+            lo, hi = self._program_range(idx)
+            channel["program_count"] = hi - lo
+            # Programs before ``first`` all end before the window starts
+            first = bisect_right(self.max_ends, start, lo, hi)
+            last = bisect_left(self.starts, end, first, hi)
+            n_lanes, spans = layout_lanes(self.starts, self.ends, first, last, start, end, tolerance)
+            channel["lanes"] = n_lanes
+            channel["spans"] = [
+                {
+                    "lane": lane,
+                    "offset": visible_start - start,
+                    "duration": visible_end - visible_start,
+                    "program": self._program(i, channel["id"]),
+                }
+                for i, lane, visible_start, visible_end in spans
+            ]
+            channels.append(channel)
+
+        encoded = json.dumps({
+            "generation": self.generation,
+            "country": country,
+            "start": _epoch_to_iso(start),
+            "end": _epoch_to_iso(end),
+            "lanes": lanes,
+            "total": len(channels),
+            "channels": channels,
+        }, separators=(",", ":")).encode("utf-8")
+        self._grid_cache[key] = encoded
+        while len(self._grid_cache) > GRID_CACHE_SIZE:
+            self._grid_cache.popitem(last=False)
+        return encoded
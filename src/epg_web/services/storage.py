@@ -1,35 +1,168 @@
-"""Database storage service."""
+"""Database storage service.
+
+API requests read through a read-only connection pool (``read_engine``);
+imports write through a separate single-connection engine (``write_engine``).
+The database runs in WAL mode so reads are not blocked during a refresh, and
+with ``auto_vacuum=INCREMENTAL`` so imports can return freed pages to the OS.
+"""
+import asyncio
+import logging
+import os
 from contextlib import asynccontextmanager
 from typing import AsyncGenerator
 
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 from epg_web.models.db import Base
 
-# SQLite database URL (using aiosqlite for async support)
-DATABASE_URL = "sqlite+aiosqlite:///epg.db"
+logger = logging.getLogger(__name__)
+
+# SQLite database file, overridable so scripts/benchmarks can use a scratch DB
+DATABASE_PATH = os.environ.get("EPG_DB_PATH", "epg.db")
+
+# SQLite database URLs (using aiosqlite for async support)
+DATABASE_URL = f"sqlite+aiosqlite:///{DATABASE_PATH}"
+READ_DATABASE_URL = f"sqlite+aiosqlite:///file:{DATABASE_PATH}?mode=ro&uri=true"
+
+# Number of read connections kept open per worker process
+READ_POOL_SIZE = int(os.environ.get("EPG_READ_POOL_SIZE", "4"))
+
+# Create async engines
+write_engine = create_async_engine(
+    DATABASE_URL, echo=False, pool_size=1, max_overflow=0
+)
+read_engine = create_async_engine(
+    READ_DATABASE_URL, echo=False, pool_size=READ_POOL_SIZE, max_overflow=0
+)
+
+
+@event.listens_for(write_engine.sync_engine, "connect")
+def _configure_writer(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=30000")
+    cursor.close()
+
 
-# Create async engine
-engine = create_async_engine(DATABASE_URL, echo=False)
+@event.listens_for(read_engine.sync_engine, "connect")
+def _configure_reader(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA query_only=ON")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
 
-# Create async session factory
+
+# Create async session factories
 AsyncSessionLocal = sessionmaker(
-    engine, class_=AsyncSession, expire_on_commit=False
+    read_engine, class_=AsyncSession, expire_on_commit=False
+)
+WriteSessionLocal = sessionmaker(
+    write_engine, class_=AsyncSession, expire_on_commit=False
 )
 
+# Imports are serialized within a process; the pool only has one connection
+# and an import can hold it far longer than the pool checkout timeout.
+_write_lock = asyncio.Lock()
+_schema_checked = False
+
+# PRAGMA auto_vacuum value for INCREMENTAL
+AUTO_VACUUM_INCREMENTAL = 2
+
+
 async def init_db():
     """Initialize the database with tables."""
-    async with engine.begin() as conn:
+    async with write_engine.begin() as conn:
         # Ensure old tables are removed so schema changes (like removed unique
         # constraints) are applied. In production you'd use migrations; for this
         # simple script we drop and recreate.
         await conn.run_sync(Base.metadata.drop_all)
         await conn.run_sync(Base.metadata.create_all)
+    await upgrade_schema()
+
+
+def _columns(conn, table: str) -> set:
+    return {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")}
+
+
+def _upgrade_schema(conn):
+    # New tables
+    Base.metadata.create_all(conn)
+    columns = _columns(conn, "generations")
+    if "changes" not in columns:
+        # NULL: no change history for the generations before it
+        conn.exec_driver_sql("ALTER TABLE generations ADD COLUMN changes INTEGER")
+    if "schedule_id" not in _columns(conn, "channels"):
+        logger.info("Adding channels.schedule_id")
+        conn.exec_driver_sql("ALTER TABLE channels ADD COLUMN schedule_id INTEGER")
+        conn.exec_driver_sql("UPDATE channels SET schedule_id = id")
+        conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_channels_schedule_id ON channels (schedule_id)")
+    columns = _columns(conn, "programs")
+    if "day" not in columns:
+        logger.info("Adding programs.day")
+        conn.exec_driver_sql("ALTER TABLE programs ADD COLUMN day INTEGER")
+        conn.exec_driver_sql(
+            "UPDATE programs SET day = CAST(strftime('%s', start_time) AS INTEGER) / 86400"
+        )
+        conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_programs_day ON programs (day)")
+    if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() != AUTO_VACUUM_INCREMENTAL:
+        # Only takes effect on an existing database through a full VACUUM
+        logger.info("Enabling incremental auto-vacuum (one-time VACUUM)")
+        conn.exec_driver_sql(f"PRAGMA auto_vacuum={AUTO_VACUUM_INCREMENTAL}")
+        conn.exec_driver_sql("VACUUM")
+
+
+async def upgrade_schema():
+    """Bring a database created by an older version up to date.
+
+    Adds tables and columns introduced since (backfilling them) and switches the file
+    to incremental auto-vacuum. Runs outside a transaction, as VACUUM must.
+    """
+    async with write_engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.run_sync(_upgrade_schema)
+
+
+async def incremental_vacuum(session: AsyncSession) -> int:
+    """Release the free pages of the database file; return how many were freed.
+
+    Call after committing. Each step of ``PRAGMA incremental_vacuum`` frees
+    one page, so it is run as a script to completion.
+    """
+    free_pages = (await session.execute(text("PRAGMA freelist_count"))).scalar()
+    if free_pages:
+        raw = await (await session.connection()).get_raw_connection()
+        await raw.driver_connection.executescript("PRAGMA incremental_vacuum;")
+    return free_pages or 0
+
+
+async def warm_read_pool():
+    """Open every read connection up front so first requests don't pay for it."""
+    conns = []
+    try:
+        for _ in range(READ_POOL_SIZE):
+            conn = await read_engine.connect()
+            conns.append(conn)
+            await conn.execute(text("SELECT 1"))
+    except Exception as e:
+        # Typically the database file does not exist yet (before init_db)
+        logger.warning("Could not warm read pool: %s", e)
+    finally:
+        for conn in conns:
+            await conn.close()
+
+
+async def dispose_engines():
+    """Close all pooled connections."""
+    await read_engine.dispose()
+    await write_engine.dispose()
+
 
 @asynccontextmanager
 async def get_session() -> AsyncGenerator[AsyncSession, None]:
-    """Get a database session."""
+    """Get a read-only database session."""
     async with AsyncSessionLocal() as session:
         try:
             yield session
@@ -37,4 +170,32 @@ async def get_session() -> AsyncGenerator[AsyncSession, None]:
             await session.rollback()
             raise
         finally:
-            await session.close()
\ No newline at end of file
+            await session.close()
+
+
+@asynccontextmanager
+async def get_connection() -> AsyncGenerator[AsyncConnection, None]:
+    """Get a read-only Core connection for queries that skip the ORM."""
+    async with read_engine.connect() as conn:
+        yield conn
+
+
+@asynccontextmanager
+async def get_write_session() -> AsyncGenerator[AsyncSession, None]:
+    """Get the single writer session used by imports.
+
+    The first use in a process applies ``upgrade_schema``.
+    """
+    global _schema_checked
+    async with _write_lock:
+        if not _schema_checked:
+            await upgrade_schema()
+            _schema_checked = True
+        async with WriteSessionLocal() as session:
+            try:
+                yield session
+            except Exception:
+                await session.rollback()
+                raise
+            finally:
+                await session.close()
@@ -2,6 +2,15 @@
 const CHANNELS_PER_PAGE = null;
 const MINUTES_PER_SLOT = 15;
 const SLOT_WIDTH_PX = 100;
+// Fixed row geometry (see .channel-programs in style.css) used to virtualize the grid
+const LANE_HEIGHT_PX = 80;
+const OVERLAP_LANE_HEIGHT_PX = 40;
+// Rows rendered beyond each edge of the viewport
+const ROW_OVERSCAN = 8;
+// IndexedDB response cache
+const CACHE_DB_NAME = 'epg-cache';
+const CACHE_STORE = 'responses';
+const CACHE_MAX_ENTRIES = 20;
 
 let state = {
     channels: [],
@@ -14,7 +23,19 @@ let state = {
     favorites: JSON.parse(localStorage.getItem('favoriteChannels') || '[]'),
     loading: false,
     startTime: null,
-    endTime: null
+    endTime: null,
+    generation: null,
+    loadKey: null,
+    events: null,
+    // Virtualized grid: built row elements by channel id, row tops, rendered range
+    rowCache: new Map(),
+    rowOffsets: null,
+    renderedRange: null,
+    renderedRows: [],
+    gridEl: null,
+    topSpacer: null,
+    bottomSpacer: null,
+    headerHeight: 0
 };
 
 function toggleFavorite(channelId) {
@@ -164,8 +185,18 @@ function getCountryName(code) {
 }
 
 async function loadCountries() {
+    // Populate from the cache first; refetch if the data changed since
+    const cached = await cacheGet('countries');
+    if (cached) fillCountries(cached.data);
+    const generation = await fetchGeneration();
+    if (cached && cached.generation === generation) return;
     const resp = await fetch('/api/countries');
     const data = await resp.json();
+    fillCountries(data);
+    await cachePut('countries', generation, data).catch(cacheFailed);
+}
+
+function fillCountries(data) {
     const select = document.getElementById('country-filter');
     select.innerHTML = '';
     data.countries.forEach(function(c) {
@@ -188,6 +219,99 @@ async function loadCountries() {
     }
 }
 
+// Persistent cache (IndexedDB) of /api/grid responses per country and window
+// and of the country list, each tagged with the data generation it came from.
+// Every operation degrades to a cache miss if IndexedDB is unavailable.
+let cacheDbPromise = null;
+
+function openCache() {
+    if (!cacheDbPromise) {
+        cacheDbPromise = new Promise(function(resolve) {
+            if (!window.indexedDB) return resolve(null);
+            const req = indexedDB.open(CACHE_DB_NAME, 2);
+            req.onupgradeneeded = function(event) {
+                const store = event.oldVersion < 1
+                    ? req.result.createObjectStore(CACHE_STORE, { keyPath: 'key' })
+                    : req.transaction.objectStore(CACHE_STORE);
+                // Eviction walks entries oldest first
+                if (event.oldVersion < 2) store.createIndex('savedAt', 'savedAt');
+            };
+            req.onsuccess = function() { resolve(req.result); };
+            req.onerror = function() { resolve(null); };
+        });
+    }
+    return cacheDbPromise;
+}
+
+async function cacheGet(key) {
+    const db = await openCache();
+    if (!db) return null;
+    return new Promise(function(resolve) {
+        const req = db.transaction(CACHE_STORE).objectStore(CACHE_STORE).get(key);
+        req.onsuccess = function() { resolve(req.result || null); };
+        req.onerror = function() { resolve(null); };
+    });
+}
+
+// Resolves once the entry is stored; rejects if the write fails
+async function cachePut(key, generation, data) {
+    const db = await openCache();
+    if (!db) return;
+    const tx = db.transaction(CACHE_STORE, 'readwrite');
+    const store = tx.objectStore(CACHE_STORE);
+    store.put({ key: key, generation: generation, data: data, savedAt: Date.now() });
+    // Keep the most recently saved entries only: delete the oldest beyond the limit
+    const count = store.count();
+    count.onsuccess = function() {
+        let excess = count.result - CACHE_MAX_ENTRIES;
+        if (excess <= 0) return;
+        const cursor = store.index('savedAt').openCursor();
+        cursor.onsuccess = function() {
+            const c = cursor.result;
+            if (!c || excess-- <= 0) return;
+            c.delete();
+            c.continue();
+        };
+    };
+    return new Promise(function(resolve, reject) {
+        tx.oncomplete = function() { resolve(); };
+        tx.onerror = tx.onabort = function() { reject(tx.error); };
+    });
+}
+
+function cacheFailed(err) {
+    console.warn('Could not update the response cache:', err);
+}
+
+async function fetchGeneration() {
+    try {
+        const resp = await fetch('/api/generation', { cache: 'no-store' });
+        return (await resp.json()).generation;
+    } catch (err) {
+        return null;
+    }
+}
+
+// Whether the changes since a cached grid's generation leave it valid: no
+// channel of the country was added, changed or removed and no program of its
+// channels inside the window was
+async function gridStillValid(cached) {
+    const resp = await fetch('/api/changes?since=' + cached.generation);
+    const changes = await resp.json();
+    if (changes.full_resync) return false;
+    const grid = cached.data;
+    const channelIds = new Set(grid.channels.map(c => c.id));
+    const programIds = new Set();
+    grid.channels.forEach(c => (c.spans || []).forEach(span => programIds.add(span.program.id)));
+    const start = new Date(grid.start), end = new Date(grid.end);
+    const prefix = grid.country + '|';
+    if (changes.channels.some(c => channelIds.has(c.id) || c.name.toUpperCase().startsWith(prefix))) return false;
+    if (changes.deleted_channels.some(id => channelIds.has(id))) return false;
+    if (changes.deleted_programs.some(id => programIds.has(id))) return false;
+    return !changes.programs.some(p => channelIds.has(p.channel_id) &&
+        parseServerDate(p.start_time) < end && parseServerDate(p.end_time) > start);
+}
+
 document.addEventListener('DOMContentLoaded', async function() {
     const now = new Date();
     // Round start time down to nearest 30 minutes
@@ -206,6 +330,7 @@ document.addEventListener('DOMContentLoaded', async function() {
         state.country = e.target.value;
         localStorage.setItem('selectedCountry', state.country);
         loadData();
+        subscribeEvents();
     });
     
     document.getElementById('hide-empty-channels').addEventListener('change', function(e) {
@@ -250,8 +375,30 @@ document.addEventListener('DOMContentLoaded', async function() {
     const containerEl = getContainer();
     if (containerEl) {
         containerEl.addEventListener('scroll', updateScrollButtons);
+        // Swap rows in at most once per frame while scrolling
+        let scrollQueued = false;
+        const onScrollOrResize = () => {
+            if (scrollQueued) return;
+            scrollQueued = true;
+            requestAnimationFrame(() => {
+                scrollQueued = false;
+                renderVisibleRows();
+            });
+        };
+        containerEl.addEventListener('scroll', onScrollOrResize, { passive: true });
+        window.addEventListener('resize', onScrollOrResize);
     }
     
+    // Favorite checkboxes live in recycled rows; one delegated handler serves all
+    document.getElementById('tv-guide-grid').addEventListener('change', function(e) {
+        if (!e.target.classList.contains('favorite-checkbox')) return;
+        e.stopPropagation();
+        toggleFavorite(parseInt(e.target.getAttribute('data-channel-id')));
+    });
+    
+    // Hover debug: show raw channel data when hovering channel label cell
+    setupChannelHoverDebug();
+    
     // Keyboard controls: Left/Right = scroll time, PageUp/PageDown = scroll channels
     window.addEventListener('keydown', function(e) {
         const container = getContainer();
@@ -302,8 +449,27 @@ document.addEventListener('DOMContentLoaded', async function() {
     setInterval(function() {
         updateCurrentTimeIndicator();
     }, 60000);
+    
+    subscribeEvents();
 });
 
+// Server-sent events replace reloading the page: a new generation reloads the
+// grid, a program boundary moves the time indicator
+function subscribeEvents() {
+    if (!window.EventSource) return;
+    if (state.events) state.events.close();
+    state.events = new EventSource('/api/events?country=' + encodeURIComponent(state.country));
+    state.events.addEventListener('generation', function(e) {
+        const generation = JSON.parse(e.data).generation;
+        if (state.generation !== null && generation !== state.generation) {
+            loadData();
+        }
+    });
+    state.events.addEventListener('boundary', function() {
+        updateCurrentTimeIndicator();
+    });
+}
+
 function updateCurrentTimeIndicator() {
     const indicator = document.querySelector('.current-time-indicator');
     if (!indicator) return;
@@ -324,42 +490,40 @@ function updateCurrentTimeIndicator() {
 async function loadData() {
     const gridEl = document.getElementById('tv-guide-grid');
     const loadingIndicator = document.getElementById('loading-indicator');
-    
-    if (gridEl) gridEl.classList.add('loading');
-    if (loadingIndicator) loadingIndicator.style.display = 'block';
+    const key = 'grid:' + state.country + ':' + state.startTime.toISOString() + ':' + state.endTime.toISOString();
+    state.loadKey = key;
     state.currentPage = 1;
     
-    // Fetch all channels by paginating through API (max 100 per request)
-    let allChannels = [];
-    let page = 1;
-    let totalPages = 1;
-    
-    do {
-        const resp = await fetch('/api/channels?country=' + state.country + '&page=' + page + '&per_page=100');
-        const data = await resp.json();
-        allChannels = allChannels.concat(data.channels);
-        totalPages = data.total_pages;
-        page++;
-    } while (page <= totalPages);
-    
-    // Store ALL channels
-    state.allChannelsWithPrograms = allChannels;
-    
-    // Load programs only for channels that have program_count > 0
-    const channelsToLoad = allChannels.filter(c => c.program_count > 0);
-    await Promise.all(channelsToLoad.map(async function(ch) {
-        const r = await fetch('/api/schedule/' + ch.id);
-        const d = await r.json();
-        ch.programs = d.programs || [];
-    }));
-    
-    // Set empty programs array for channels without programs
-    allChannels.forEach(ch => {
-        if (!ch.programs) ch.programs = [];
-    });
+    // Render instantly from the cache, then revalidate against the current generation
+    const cached = await cacheGet(key);
+    if (state.loadKey !== key) return;
+    if (cached) {
+        showGrid(cached.data);
+        const generation = await fetchGeneration();
+        if (state.loadKey !== key || generation === null || generation === cached.generation) return;
+        if (await gridStillValid(cached)) {
+            if (state.loadKey !== key) return;
+            cached.data.generation = generation;
+            state.generation = generation;
+            await cachePut(key, generation, cached.data).catch(cacheFailed);
+            return;
+        }
+    } else {
+        if (gridEl) gridEl.classList.add('loading');
+        if (loadingIndicator) loadingIndicator.style.display = 'block';
+    }
+    
+    // One request returns every channel of the country with its programs in the
+    // visible window already clipped and assigned to lanes (cached server-side)
+    const resp = await fetch('/api/grid?country=' + encodeURIComponent(state.country) +
+        '&start=' + encodeURIComponent(state.startTime.toISOString()) +
+        '&end=' + encodeURIComponent(state.endTime.toISOString()));
+    const data = await resp.json();
+    if (state.loadKey !== key) return;
+    cachePut(key, data.generation, data).catch(cacheFailed);
     
     if (loadingIndicator) loadingIndicator.style.display = 'none';
-    renderGrid();
+    showGrid(data);
     
     // Remove blur after a short delay to let the render complete
     setTimeout(function() {
@@ -368,6 +532,14 @@ async function loadData() {
     }, 100);
 }
 
+function showGrid(data) {
+    state.allChannelsWithPrograms = data.channels || [];
+    state.generation = data.generation;
+    // New data: rows are rebuilt as they come into view
+    state.rowCache = new Map();
+    renderGrid();
+}
+
 function renderGrid() {
     // Filter based on program_count from database (more reliable than checking loaded programs in time window)
     let filtered = state.allChannelsWithPrograms;
@@ -381,21 +553,46 @@ function renderGrid() {
     }
     
     state.channels = filtered;
-    const pageChannels = filtered; // show all; vertical scroll handles overflow
     
+    // Row tops from the fixed lane heights, so any scroll position maps to a
+    // channel range without measuring the DOM
+    const offsets = new Array(filtered.length + 1);
+    offsets[0] = 0;
+    for (let i = 0; i < filtered.length; i++) {
+        offsets[i + 1] = offsets[i] + rowHeight(filtered[i]);
+    }
+    state.rowOffsets = offsets;
+    
+    if (!state.gridEl || state.gridEl.dataset.window !== state.startTime.toISOString()) {
+        buildGridShell();
+    }
+    state.renderedRange = null;
+    renderVisibleRows();
+    updateCurrentTimeIndicator();
+    
+    // Update scroll button state after render
+    const containerEl = document.getElementById('tv-guide-container');
+    if (containerEl) {
+        const leftBtn = document.getElementById('scroll-left');
+        const rightBtn = document.getElementById('scroll-right');
+        if (leftBtn && rightBtn) {
+            leftBtn.disabled = containerEl.scrollLeft <= 0;
+            rightBtn.disabled = (containerEl.scrollWidth - containerEl.clientWidth - 1) <= 0;
+        }
+    }
+}
+
+function rowHeight(ch) {
+    return LANE_HEIGHT_PX + Math.max(0, (ch.lanes || 1) - 1) * OVERLAP_LANE_HEIGHT_PX;
+}
+
+// Time header, spacers standing in for the rows outside the viewport, and the
+// current time indicator; rebuilt only when the time window changes
+function buildGridShell() {
     const totalMinutes = (state.endTime - state.startTime) / 60000;
     const numSlots = Math.ceil(totalMinutes / MINUTES_PER_SLOT);
     
-    // Calculate current time indicator position (only show if within grid time range)
-    const now = new Date();
-    const leftOffset = 200; // channel column width
-    const timePosition = (now - state.startTime) / 60000 / MINUTES_PER_SLOT * SLOT_WIDTH_PX;
-    const currentTimeIndicatorHtml = (now >= state.startTime && now <= state.endTime && timePosition >= 0) 
-        ? '<div class="current-time-indicator" style="left: ' + (timePosition + leftOffset) + 'px;"></div>'
-        : '';
-    
-    // Build time header row
-    let html = '<div class="guide-grid">';
+    let html = '<div class="guide-grid" data-window="' + state.startTime.toISOString() + '">';
     html += '<div class="time-header-row">';
     html += '<div class="corner-cell">Channels</div>';
     html += '<div class="time-slots-cell">';
@@ -416,104 +613,124 @@ function renderGrid() {
     html += '</div>'; // close time-slots
     html += '</div>'; // close time-slots-cell
     html += '</div>'; // close time-header-row
+    html += '<div class="channel-row grid-spacer"><div class="grid-spacer-cell"></div></div>';
+    html += '<div class="channel-row grid-spacer"><div class="grid-spacer-cell"></div></div>';
+    html += '<div class="current-time-indicator" style="display:none"></div>';
+    html += '</div>'; // close guide-grid
+    document.getElementById('tv-guide-grid').innerHTML = html;
     
-    // Build channel rows
-    pageChannels.forEach(function(ch) {
-        const name = ch.name.indexOf('|') > 0 ? ch.name.split('|')[1].trim() : ch.name;
-        const progs = (ch.programs || []).filter(p => parseServerDate(p.end_time) > state.startTime && parseServerDate(p.start_time) < state.endTime);
-        const isFav = isFavorite(ch.id);
-        
-    html += '<div class="channel-row">';
-    html += '<div class="channel-label" data-channel-id="' + ch.id + '">';
-        html += '<div class="channel-label-content">';
-        html += '<input type="checkbox" class="favorite-checkbox" data-channel-id="' + ch.id + '" ' + (isFav ? 'checked' : '') + ' title="Add to favorites">';
-        if (ch.icon_url) html += '<img src="' + ch.icon_url + '" onerror="this.style.display=\'none\'">';
-        html += '<span>' + name + '</span>';
-        html += '</div>'; // close channel-label-content
-        html += '</div>'; // close channel-label
-        html += '<div class="channel-programs-cell">';
-        html += '<div class="channel-programs">';
-        
-        // Lay out programs along the timeline with exact gaps and basic overlap handling
-        let cursor = new Date(state.startTime.getTime());
-        progs.forEach(function(p) {
-            const st = parseServerDate(p.start_time);
-            const et = parseServerDate(p.end_time);
+    const grid = document.querySelector('#tv-guide-grid .guide-grid');
+    const spacers = grid.querySelectorAll('.grid-spacer-cell');
+    state.gridEl = grid;
+    state.topSpacer = spacers[0];
+    state.bottomSpacer = spacers[1];
+    state.headerHeight = grid.querySelector('.time-header-row').offsetHeight;
+    state.renderedRows = [];
+}
 
-            if (!st || !et) return;
-            // Skip if outside range (extra guard; we filtered above)
-            if (et <= state.startTime || st >= state.endTime) return;
-
-            // Insert a gap if there's time between the cursor and this program's start
-            let gapStart = cursor > state.startTime ? cursor : state.startTime;
-            if (st > gapStart) {
-                const gapMinutes = (st - gapStart) / 60000;
-                if (gapMinutes > 0.5) {
-                    const gapWidth = (gapMinutes / MINUTES_PER_SLOT) * SLOT_WIDTH_PX;
-                    html += '<div class="program-gap" style="width:' + gapWidth + 'px"></div>';
-                }
-            }
+// Materialize the rows in and near the viewport; rows that scroll out are
+// detached but kept in state.rowCache for reuse
+function renderVisibleRows() {
+    const container = document.getElementById('tv-guide-container');
+    const offsets = state.rowOffsets;
+    if (!container || !state.gridEl || !offsets) return;
+    const channels = state.channels;
+    
+    const top = container.scrollTop - state.headerHeight;
+    const bottom = top + container.clientHeight;
+    let first = Math.max(0, lowerBound(offsets, top) - 1 - ROW_OVERSCAN);
+    let last = Math.min(channels.length, lowerBound(offsets, bottom) + ROW_OVERSCAN);
+    if (first > last) first = last;
+    const range = state.renderedRange;
+    if (range && range[0] === first && range[1] === last) return;
+    state.renderedRange = [first, last];
+    
+    state.renderedRows.forEach(row => row.remove());
+    const fragment = document.createDocumentFragment();
+    const rows = [];
+    for (let i = first; i < last; i++) {
+        const ch = channels[i];
+        let row = state.rowCache.get(ch.id);
+        if (!row) {
+            row = buildRow(ch);
+            state.rowCache.set(ch.id, row);
+        }
+        // Favorites may have changed since the row was built
+        row.querySelector('.favorite-checkbox').checked = isFavorite(ch.id);
+        rows.push(row);
+        fragment.appendChild(row);
+    }
+    state.renderedRows = rows;
+    state.topSpacer.style.height = offsets[first] + 'px';
+    state.bottomSpacer.style.height = (offsets[channels.length] - offsets[last]) + 'px';
+    state.bottomSpacer.parentNode.before(fragment);
+}
 
-            // Clamp visible start to the max of state window and cursor to avoid rendering overlapped portion twice
-            const visibleStart = new Date(Math.max(st.getTime(), state.startTime.getTime(), cursor.getTime()));
-            const visibleEnd = new Date(Math.min(et.getTime(), state.endTime.getTime()));
+// First index whose value is >= target
+function lowerBound(values, target) {
+    let lo = 0, hi = values.length;
+    while (lo < hi) {
+        const mid = (lo + hi) >> 1;
+        if (values[mid] < target) lo = mid + 1; else hi = mid;
+    }
+    return lo;
+}
 
-            const visibleDurMinutes = (visibleEnd - visibleStart) / 60000;
-            if (visibleDurMinutes <= 0.5) {
-                // Nothing meaningful to render
-                cursor = new Date(Math.max(cursor.getTime(), et.getTime()));
-                return;
+function buildRow(ch) {
+    const name = ch.name.indexOf('|') > 0 ? ch.name.split('|')[1].trim() : ch.name;
+    let html = '<div class="channel-row" style="height:' + rowHeight(ch) + 'px">';
+    html += '<div class="channel-label" data-channel-id="' + ch.id + '">';
+    html += '<div class="channel-label-content">';
+    html += '<input type="checkbox" class="favorite-checkbox" data-channel-id="' + ch.id + '" title="Add to favorites">';
+    if (ch.icon_url) html += '<img src="/api/icons/' + ch.id + '" loading="lazy" onerror="this.style.display=\'none\'">';
+    html += '<span>' + name + '</span>';
+    html += '</div>'; // close channel-label-content
+    html += '</div>'; // close channel-label
+    html += '<div class="channel-programs-cell">';
+    
+    const laneCount = Math.max(1, ch.lanes || 0);
+    for (let lane = 0; lane < laneCount; lane++) {
+        html += '<div class="channel-programs' + (lane > 0 ? ' overlap-lane' : '') + '">';
+        // Spans come sorted and never overlap within a lane: offsets and
+        // durations (seconds from the window start) map directly to widths
+        let cursor = 0;
+        (ch.spans || []).forEach(function(span) {
+            if (span.lane !== lane) return;
+            const gapMinutes = (span.offset - cursor) / 60;
+            if (gapMinutes > 0.5) {
+                const gapWidth = (gapMinutes / MINUTES_PER_SLOT) * SLOT_WIDTH_PX;
+                html += '<div class="program-gap" style="width:' + gapWidth + 'px"></div>';
             }
-
+            cursor = span.offset + span.duration;
+            const visibleDurMinutes = span.duration / 60;
+            if (visibleDurMinutes <= 0.5) return;
+            
+            const p = span.program;
+            const st = parseServerDate(p.start_time);
+            const et = parseServerDate(p.end_time);
             // Use exact width (no rounding) to avoid cumulative overlap; enforce a tiny minimum for visibility
             const widthPx = Math.max(4, (visibleDurMinutes / MINUTES_PER_SLOT) * SLOT_WIDTH_PX);
-
+            
             // Create tooltip text with local times
             const tooltipText = p.title + '\n' + formatTimeLocal(st) + ' - ' + formatTimeLocal(et) + (p.description ? '\n\n' + p.description : '') + (p.category ? '\n\nCategory: ' + p.category : '');
-
+            
             html += '<div class="program-block" style="width:' + widthPx + 'px" title="' + tooltipText.replace(/\"/g, '&quot;') + '">';
             html += '<div class="program-title">' + p.title + '</div>';
             html += '<div class="program-time">' + formatTimeLocal(st) + ' - ' + formatTimeLocal(et) + '</div>';
-            if (p.description) {
+            if (p.description && lane === 0) {
                 html += '<div class="program-description">' + p.description + '</div>';
             }
             html += '</div>'; // close program-block
-
-            // Advance cursor to the end of what we just placed (or program's real end if it was later)
-            cursor = new Date(Math.max(cursor.getTime(), et.getTime(), visibleEnd.getTime()));
         });
-        
         html += '</div>'; // close channel-programs
-        html += '</div>'; // close channel-programs-cell
-        html += '</div>'; // close channel-row
-    });
-    
-    html += currentTimeIndicatorHtml; // add current time indicator
-    html += '</div>'; // close guide-grid
-    document.getElementById('tv-guide-grid').innerHTML = html;
-    
-    // Attach event listeners to favorite checkboxes
-    document.querySelectorAll('.favorite-checkbox').forEach(function(checkbox) {
-        checkbox.addEventListener('change', function(e) {
-            e.stopPropagation();
-            const channelId = parseInt(this.getAttribute('data-channel-id'));
-            toggleFavorite(channelId);
-        });
-    });
+    }
     
-    // Hover debug: show raw channel data when hovering channel label cell
-    setupChannelHoverDebug();
+    html += '</div>'; // close channel-programs-cell
+    html += '</div>'; // close channel-row
     
-    // Update scroll button state after render
-    const containerEl = document.getElementById('tv-guide-container');
-    if (containerEl) {
-        const leftBtn = document.getElementById('scroll-left');
-        const rightBtn = document.getElementById('scroll-right');
-        if (leftBtn && rightBtn) {
-            leftBtn.disabled = containerEl.scrollLeft <= 0;
-            rightBtn.disabled = (containerEl.scrollWidth - containerEl.clientWidth - 1) <= 0;
-        }
-    }
+    const template = document.createElement('template');
+    template.innerHTML = html;
+    return template.content.firstChild;
 }
 
 function setupChannelHoverDebug() {
@@ -565,20 +782,27 @@ function setupChannelHoverDebug() {
         panel.classList.remove('pinned');
     }
 
-    const onOver = function(e) {
+    // Delegated to the container: rows are created and recycled while scrolling
+    let currentLabel = null;
+    container.addEventListener('mouseover', function(e) {
+        const label = e.target.closest('.channel-label');
+        if (!label || label === currentLabel) return;
+        currentLabel = label;
         labelHovering = true;
-        showPanelForChannel(e, e.currentTarget);
-    };
-    const onMove = function(e) {
-        if (panel.style.display !== 'none' && !panelPinned) positionHoverPanel(e, panel, container);
-    };
-    const onLeave = function() {
+        showPanelForChannel(e, label);
+    });
+    container.addEventListener('mousemove', function(e) {
+        if (currentLabel && panel.style.display !== 'none' && !panelPinned) positionHoverPanel(e, panel, container);
+    });
+    container.addEventListener('mouseout', function(e) {
+        if (!currentLabel || (e.relatedTarget && currentLabel.contains(e.relatedTarget))) return;
+        currentLabel = null;
         labelHovering = false;
         // Defer hide: only close if not pinned and not hovering panel
         setTimeout(() => {
             if (!panelPinned && !panelHovering) hidePanel();
         }, 50);
-    };
+    });
 
     // Panel hover management
     panel.addEventListener('mouseenter', function(){ panelHovering = true; });
@@ -586,15 +810,6 @@ function setupChannelHoverDebug() {
         panelHovering = false;
         if (!panelPinned && !labelHovering) hidePanel();
     });
-
-    document.querySelectorAll('.channel-label').forEach(function(el) {
-        el.removeEventListener('mouseover', onOver);
-        el.removeEventListener('mousemove', onMove);
-        el.removeEventListener('mouseleave', onLeave);
-        el.addEventListener('mouseover', onOver);
-        el.addEventListener('mousemove', onMove);
-        el.addEventListener('mouseleave', onLeave);
-    });
 }
 
 function positionHoverPanel(e, panel, container) {
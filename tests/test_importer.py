@@ -0,0 +1,51 @@
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+# The storage engines are bound to the database path on import
+_tmp = tempfile.mkdtemp(prefix="epg-test-")
+os.environ["EPG_DB_PATH"] = os.path.join(_tmp, "epg.db")
+os.environ["EPG_DUMP_DIR"] = os.path.join(_tmp, "dumps")
+
+from sqlalchemy import select  # noqa: E402
+
+from epg_web.services.changes import fetch_changes  # noqa: E402
+from epg_web.services.importer import import_epg_stream, iter_bytes  # noqa: E402
+from epg_web.services.schedule import programs_table  # noqa: E402
+from epg_web.services.storage import get_connection, init_db  # noqa: E402
+
+
+def xmltv(channels, programmes) -> bytes:
+    start = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    end = start + timedelta(hours=1)
+    fmt = "%Y%m%d%H%M%S +0000"
+    body = "".join(
+        f'<channel id="{key}"><display-name>FR| {key}</display-name></channel>' for key in channels
+    ) + "".join(
+        f'<programme channel="{key}" start="{start:{fmt}}" stop="{end:{fmt}}"><title>{title}</title></programme>'
+        for key, title in programmes
+    )
+    return f'<?xml version="1.0" encoding="UTF-8"?><tv>{body}</tv>'.encode()
+
+
+async def stored_titles() -> dict:
+    async with get_connection() as conn:
+        result = await conn.execute(select(programs_table.c.id, programs_table.c.title))
+        return {title: program_id for program_id, title in result}
+
+
+@pytest.mark.asyncio
+async def test_channel_without_programmes_loses_stored_ones():
+    await init_db()
+    first = await import_epg_stream(iter_bytes(xmltv(["a", "b"], [("a", "X"), ("b", "Y")])), "feed.xml")
+    removed = (await stored_titles())["Y"]
+
+    second = await import_epg_stream(iter_bytes(xmltv(["a", "b"], [("a", "X")])), "feed.xml")
+
+    assert second["deleted"] == 1
+    assert set(await stored_titles()) == {"X"}
+    async with get_connection() as conn:
+        changes = await fetch_changes(conn, first["generation"])
+    assert changes["deleted_programs"] == [removed]